@@ -6,13 +6,19 @@ Uses the OpenAI Agents SDK directly (NO ChatKit).
 from __future__ import annotations
 
 import json
-import os
+import logging
 from typing import Any, AsyncIterator
 from fastapi.responses import StreamingResponse
-from agents import Agent, Runner, SQLiteSession, RunConfig
-from agents.model_settings import ModelSettings
-from openai import AsyncOpenAI
+from agents import Agent, SQLiteSession, RunConfig
 from .jason_agent import jason_agent
+from .kb_mirror import finish_prefetch, start_prefetch
+from .hedging import run_streamed
+from .metrics import StreamTimer, ToolTimer
+from .effort_router import classify_message, model_settings_for, record_route_latency
+from .prompt_cache import record_prompt_usage
+from .response_cache import check_response_cache
+from .tool_selection import last_turn_used_tools, record_tool_set_usage, select_tools
+from .tracing import start_trace
 
 # Test agent without tools/vector store
 test_agent = Agent(
@@ -21,10 +27,7 @@ test_agent = Agent(
     model="gpt-4o",
 )
 
-# Direct OpenAI client for speed testing
-openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-DEBUG_MODE = False  # Disable debug logging for speed
+logger = logging.getLogger(__name__)
 
 
 class AISDKChatHandler:
@@ -73,25 +76,68 @@ class AISDKChatHandler:
 
         import time
         start_time = time.time()
-        print(f"[Jason Agent] Processing: '{user_content[:50]}...'")
-        print(f"[Jason Agent] Thread ID: {thread_id}")
+        logger.info("[Jason Agent] Processing: '%s...'", user_content[:50])
+        logger.debug("[Jason Agent] Thread ID: %s", thread_id)
 
         async def event_stream() -> AsyncIterator[str]:
             """Stream in AI SDK v5 data stream protocol format."""
+            stream_start = time.perf_counter()
+            # 🧭 Reasoning profile for this message (quick / standard / deep)
+            message_text = user_content if isinstance(user_content, str) else ""
+            route = classify_message(
+                message_text, has_history=len(messages) > 1 or bool(await session.get_items(limit=1))
+            )
+            # 📚 Score the message against the local knowledge base mirror
+            # while the session is checked (see kb_mirror.py)
+            kb_prefetch = start_prefetch(message_text) if route.profile != "quick" else None
+            # 💾 Replay a cached answer to a common first question (opt-in, see response_cache.py)
+            turn_cache = await check_response_cache(
+                message_text, has_attachments=False, profile=route.profile, session=session, endpoint="ai_sdk"
+            )
+            kb_retrieval = await finish_prefetch(kb_prefetch, "ai_sdk")
+            # 🧰 Only ship the tools this turn can use (none for small talk unless
+            # the last turn searched, no file_search when the local mirror has the answer)
+            tool_selection = select_tools(
+                jason_agent,
+                message_text,
+                route.profile,
+                endpoint="ai_sdk",
+                local_kb=kb_retrieval is not None and kb_retrieval.confident,
+                follows_tools=route.profile == "quick" and await last_turn_used_tools(session),
+            )
+            model_settings = model_settings_for(route, thread_id, tool_selection.agent.tools, endpoint="ai_sdk")
+            # 📊 Latency metrics (TTFT, inter-token, tokens/sec, hosted tool timings), created
+            # only once setup is done so the try below always finishes it
+            stream_timer = StreamTimer("ai_sdk", start_time=stream_start)
+            # 🔬 Always-on request spans (tail-sampled, see tracing.py)
+            request_trace = start_trace(
+                "ai_sdk.request",
+                start=stream_start,
+                thread_id=thread_id,
+                profile=route.profile,
+                tool_set=tool_selection.tool_set,
+            )
+            if turn_cache.run is not None:
+                request_trace.set(response_cache="hit")
+            if kb_retrieval is not None:
+                request_trace.set(kb_passages=len(kb_retrieval.hits), kb_confident=kb_retrieval.confident)
+            tool_timer = ToolTimer(
+                on_complete=lambda name, start, end: request_trace.add_span(f"tool.{name}", start, end)
+            )
+            result = None
             try:
                 # Run the FULL Jason Agent (with optimizations)
-                print(f"[Timing] Starting Jason Agent at {time.time() - start_time:.2f}s")
+                logger.debug("[Timing] Starting Jason Agent at %.2fs", time.time() - start_time)
+                request_trace.mark("model_start")
                 
-                result = Runner.run_streamed(
-                    jason_agent,  # 🎯 Full Jason agent with tools + vector store
+                result = turn_cache.run or run_streamed(  # ⏱️ Hedged when HEDGING_ENABLED (see hedging.py)
+                    tool_selection.agent,  # 🎯 Jason agent with this turn's tools + vector store
                     user_content,
+                    endpoint="ai_sdk",
                     session=session,  # Re-enable session for proper tool execution
                     run_config=RunConfig(
-                        model_settings=ModelSettings(
-                            parallel_tool_calls=True,
-                            reasoning_effort="low",  # ✨ CRITICAL: Fast thinking mode (2-3s)
-                            verbosity="low",
-                        )
+                        model_settings=model_settings,
+                        call_model_input_filter=kb_retrieval.input_filter() if kb_retrieval else None,
                     ),
                 )
                 
@@ -103,6 +149,7 @@ class AISDKChatHandler:
                 # Stream events
                 async for event in result.stream_events():
                     event_name = getattr(event, 'name', None)
+                    tool_timer.observe(event)
                     
                     # Handle tool call events for visualization
                     if event.type == "run_item_stream_event":
@@ -131,7 +178,7 @@ class AISDKChatHandler:
                             
                             if tool_name:
                                 active_tools.add(tool_name)
-                                print(f"[Tool] {tool_name} called")
+                                logger.debug("[Tool] %s called", tool_name)
                                 tool_data = json.dumps({"type": "tool_start", "name": tool_name})
                                 yield f'9:{tool_data}\n'
                                 
@@ -158,7 +205,7 @@ class AISDKChatHandler:
                             
                             if tool_name and tool_name in active_tools:
                                 active_tools.remove(tool_name)
-                                print(f"[Tool] {tool_name} completed")
+                                logger.debug("[Tool] %s completed", tool_name)
                                 tool_data = json.dumps({"type": "tool_end", "name": tool_name})
                                 yield f'9:{tool_data}\n'
                     
@@ -190,7 +237,7 @@ class AISDKChatHandler:
                             if tool_call_buffer and not tool_call_buffer.strip().startswith('{'):
                                 # Clear any active tools when real text starts (they've completed)
                                 for tool in list(active_tools):
-                                    print(f"[Tool] {tool} completed (text started)")
+                                    logger.debug("[Tool] %s completed (text started)", tool)
                                     tool_data = json.dumps({"type": "tool_end", "name": tool})
                                     yield f'9:{tool_data}\n'
                                     active_tools.remove(tool)
@@ -198,28 +245,49 @@ class AISDKChatHandler:
                                 if first_token_time is None:
                                     first_token_time = time.time()
                                     ttft = first_token_time - start_time
-                                    print(f"[TTFT] Jason Agent first token: {ttft:.2f}s")
+                                    logger.info("[TTFT] Jason Agent first token: %.2fs", ttft)
                                 
                                 token_count += 1
+                                stream_timer.token()
+                                if token_count == 1:
+                                    request_trace.mark("first_token")
                                 json_text = json.dumps(tool_call_buffer)
                                 yield f'0:{json_text}\n'
                                 tool_call_buffer = ""
 
+                turn_cache.remember(result)
+
                 # Send completion metadata
                 yield 'e:{"finishReason":"stop","usage":{"promptTokens":0,"completionTokens":0}}\n'
                 
                 # Send done marker
                 yield 'd\n'
                 
-                print(f"[Jason Agent] Stream complete")
+                logger.debug("[Jason Agent] Stream complete")
 
             except Exception as e:
-                import traceback
-                traceback.print_exc()
-                print(f"[Jason Agent] Error: {e}")
+                stream_timer.error("stream")
+                request_trace.record_error(e)
+                logger.exception("[Jason Agent] Error: %s", e)
                 # Send error in AI SDK format
                 error_msg = str(e).replace('"', '\\"')
                 yield f'3:"{error_msg}"\n'
+            finally:
+                tool_timer.abandon()
+                stream_timer.finish()
+                record_route_latency("ai_sdk", route, stream_timer)
+                request_trace.mark("finish")
+                request_trace.set(tokens=token_count)
+                usage = None
+                if result is not None:
+                    # 🗄️ Cached vs uncached input tokens (prompt cache hit rate)
+                    usage = record_prompt_usage("ai_sdk", result.context_wrapper.usage)
+                    if usage:
+                        request_trace.set(**usage)
+                    if getattr(result, "hedged", False):
+                        request_trace.set(hedged=True, hedge_winner=result.winner)
+                record_tool_set_usage("ai_sdk", tool_selection, stream_timer, usage)
+                request_trace.finish()
 
         return StreamingResponse(
             event_stream(),
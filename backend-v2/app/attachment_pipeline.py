@@ -0,0 +1,127 @@
+"""
+Eager attachment preprocessing.
+
+Turning an attachment into model input (base64-encoding an image, decoding
+a text file, uploading a document to OpenAI and the vector store) used to
+happen inside `respond`, one attachment after another, after the user hit
+send. Now the upload endpoint (`POST /upload/{attachment_id}`) starts the
+conversion in the background as soon as the bytes arrive; by the time the
+message is sent it's usually done, and `respond` awaits whatever isn't
+concurrently with `asyncio.gather`.
+
+A conversion that failed in the background is retried once when the message
+needs it. Tasks are dropped once a message has used their result, or when the
+attachment is deleted or re-uploaded, so nothing is held for the life of the
+process. `jason_attachment_prep_state_total{state}` shows how often the
+work was already done ("ready") vs still running ("pending"), retried after
+a background failure ("retry") or never started ("cold").
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENT_PREP_SECONDS = REGISTRY.histogram(
+    "jason_attachment_prep_seconds",
+    "Time to convert an attachment into model input, by attachment kind.",
+    ("kind",),
+)
+ATTACHMENT_PREP_STATE_TOTAL = REGISTRY.counter(
+    "jason_attachment_prep_state_total",
+    "Preprocessing state of each attachment when its message arrived.",
+    ("state",),
+)
+ATTACHMENT_WAIT_SECONDS = REGISTRY.histogram(
+    "jason_attachment_wait_seconds",
+    "Time a message spent waiting for its attachments to be ready.",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+
+def _kind(mime_type: str | None) -> str:
+    mime_type = mime_type or ""
+    if mime_type.startswith("image/"):
+        return "image"
+    if mime_type.startswith("text/") or mime_type == "application/json":
+        return "text"
+    return "document"
+
+
+class AttachmentPipeline:
+    """Background conversion of uploaded attachments, one task per attachment."""
+
+    def __init__(
+        self,
+        convert: Callable[[str], Awaitable[Any]],
+        mime_type_of: Callable[[str], str | None],
+    ) -> None:
+        self._convert = convert
+        self._mime_type_of = mime_type_of
+        self._tasks: dict[str, asyncio.Task[Any]] = {}
+
+    async def _run(self, attachment_id: str) -> Any:
+        start = time.perf_counter()
+        try:
+            return await self._convert(attachment_id)
+        finally:
+            ATTACHMENT_PREP_SECONDS.observe(
+                time.perf_counter() - start, kind=_kind(self._mime_type_of(attachment_id))
+            )
+
+    def _spawn(self, attachment_id: str) -> asyncio.Task[Any]:
+        task = asyncio.create_task(self._run(attachment_id))
+        # Failures are surfaced (and retried) by content(); don't log them twice
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._tasks[attachment_id] = task
+        return task
+
+    def start(self, attachment_id: str) -> None:
+        """Begin converting an attachment whose bytes just arrived."""
+        self.discard(attachment_id)  # re-upload: the old bytes' conversion is moot
+        self._spawn(attachment_id)
+        logger.debug("[Attachments] Preprocessing %s in the background", attachment_id)
+
+    def discard(self, attachment_id: str) -> asyncio.Task[Any] | None:
+        """Forget an attachment's conversion, cancelling it if it's still running."""
+        task = self._tasks.pop(attachment_id, None)
+        if task is not None and not task.done():
+            task.cancel()
+        return task
+
+    async def content(self, attachment_id: str) -> Any:
+        """The attachment's model input, waiting for (or starting) its conversion."""
+        task = self._tasks.get(attachment_id)
+        if task is None:
+            state = "cold"
+            task = self._spawn(attachment_id)
+        elif not task.done():
+            state = "pending"
+        elif task.cancelled() or task.exception() is not None:
+            state = "retry"
+            task = self._spawn(attachment_id)
+        else:
+            state = "ready"
+        ATTACHMENT_PREP_STATE_TOTAL.inc(state=state)
+        try:
+            # Shielded: a cancelled turn shouldn't throw away finished-next-second work
+            return await asyncio.shield(task)
+        finally:
+            # Used by this message - don't keep the result around
+            if task.done() and self._tasks.get(attachment_id) is task:
+                del self._tasks[attachment_id]
+
+    async def contents(self, attachment_ids: list[str]) -> list[Any]:
+        """Model inputs for several attachments, concurrently (exceptions returned in place)."""
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(self.content(attachment_id) for attachment_id in attachment_ids), return_exceptions=True
+        )
+        ATTACHMENT_WAIT_SECONDS.observe(time.perf_counter() - start)
+        return results
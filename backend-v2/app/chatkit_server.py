@@ -0,0 +1,702 @@
+"""
+ChatKit server for the Jason coaching agent.
+
+Kept out of `main.py` so the ChatKit / Agents SDK / OpenAI imports (about a
+second of import time) only happen when the chat stack is first needed - see
+`load_chat_stack()` in main.py.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Any, AsyncIterator
+
+from agents import RunConfig, trace
+from chatkit.agents import AgentContext, stream_agent_response
+from chatkit.server import ChatKitServer
+from chatkit.types import (
+    Attachment,
+    ClientToolCallItem,
+    ThreadItem,
+    ThreadMetadata,
+    ThreadStreamEvent,
+    UserMessageItem,
+)
+from openai.types.responses import ResponseInputContentParam
+
+from .attachment_pipeline import AttachmentPipeline
+from .document_text import small_document_text
+from .effort_router import classify_message, model_settings_for, record_route_latency
+from .hedging import run_streamed
+from .image_normalize import image_input
+from .jason_agent import JASON_VECTOR_STORE_ID
+from .kb_mirror import finish_prefetch, start_prefetch
+from .memory_store import MemoryStore
+from .metrics import ERRORS_TOTAL, ObservedRun, StreamTimer, ToolTimer
+from .openai_client import get_openai_client
+from .prompt_cache import record_prompt_usage
+from .response_cache import check_response_cache
+from .session_attachments import AttachmentSession, merge_with_history
+from .text_attachments import text_attachment_text
+from .thread_vector_stores import DOCUMENT_INDEX_HELD_SECONDS, THREAD_VECTOR_STORES_ENABLED, thread_vector_stores
+from .tool_selection import last_turn_used_tools, record_tool_set_usage, select_tools
+from .tracing import start_trace
+
+# ProgressUpdateEvent commented out - keep server events raw (v0.0.2 compatibility)
+# try:
+#     from chatkit.types import ProgressUpdateEvent
+# except ImportError:
+#     # Fallback if ProgressUpdateEvent doesn't exist
+#     ProgressUpdateEvent = None
+ProgressUpdateEvent = None  # Disabled for v0.0.2
+
+# Performance optimization: disable SDK tracing and debug-level logs in production
+DEBUG_MODE = os.getenv("DEBUG_MODE", "false").lower() == "true"
+
+logger = logging.getLogger(__name__)
+
+
+def _strip_annotation_markers(text: str) -> str:
+    """
+    Strip annotation index markers from response text.
+    
+    These markers (≡file≡, ≡turn0file2≡, etc.) are internal OpenAI citation indices
+    that should be converted to Annotation objects by ChatKit, but still appear in text.
+    
+    Based on official OpenAI chatkit-samples knowledge-assistant example,
+    these need to be manually stripped from display text even in latest versions.
+    """
+    if not text:
+        return text
+    
+    # Remove citation markers: ≡...≡ pattern
+    # Matches: ≡file≡, ≡turn0file2≡, ≡turn0file3≡, etc.
+    cleaned = re.sub(r'≡[^≡]*≡', '', text)
+    
+    # Also catch other citation bracket formats that might appear
+    cleaned = re.sub(r'【[^】]*】', '', cleaned)
+    
+    return cleaned
+
+
+def _user_message_text(item: UserMessageItem) -> str:
+    parts: list[str] = []
+    for part in item.content:
+        text = getattr(part, "text", None)
+        if text:
+            parts.append(text)
+    return " ".join(parts).strip()
+
+
+def _get_attachment_refs(item: UserMessageItem) -> list[str]:
+    """Extract attachment IDs from user message content."""
+    attachment_ids: list[str] = []
+    logger.debug("[_get_attachment_refs] Processing %s content parts", len(item.content))
+    for i, part in enumerate(item.content):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[_get_attachment_refs] Part %s: type=%s, attrs=%s", i, type(part).__name__, dir(part))
+            logger.debug("[_get_attachment_refs] Part %s content: %s", i, part)
+        
+        # Check for different possible attachment reference formats
+        if hasattr(part, "attachment_id") and part.attachment_id:
+            logger.debug("[_get_attachment_refs] Found attachment_id: %s", part.attachment_id)
+            attachment_ids.append(part.attachment_id)
+        elif hasattr(part, "attachment") and part.attachment:
+            logger.debug("[_get_attachment_refs] Found attachment object: %s", part.attachment)
+            if hasattr(part.attachment, "id"):
+                attachment_ids.append(part.attachment.id)
+        elif hasattr(part, "type") and part.type in ["image", "file", "attachment"]:
+            logger.debug("[_get_attachment_refs] Found %s type part", part.type)
+            # Try to extract ID from various possible attributes
+            for attr in ["id", "file_id", "image_id", "attachment_id"]:
+                if hasattr(part, attr) and getattr(part, attr):
+                    attachment_ids.append(getattr(part, attr))
+                    break
+    
+    logger.debug("[_get_attachment_refs] Total found: %s", attachment_ids)
+    return attachment_ids
+
+
+def _is_tool_completion_item(item: Any) -> bool:
+    return isinstance(item, ClientToolCallItem)
+
+
+def _is_text_delta(event: Any) -> bool:
+    """True for ChatKit events that carry a streamed assistant text delta."""
+    if isinstance(getattr(event, "delta", None), str):
+        return True
+    update = getattr(event, "update", None)
+    return isinstance(getattr(update, "delta", None), str)
+
+
+class JasonCoachingServer(ChatKitServer[dict[str, Any]]):
+    def __init__(self, agent) -> None:
+        self.store = MemoryStore()
+        # Pass the store as both the store AND the attachment_store
+        super().__init__(self.store, attachment_store=self.store)
+        self.assistant = agent
+        # Cache SQLiteSession instances per thread
+        self.sessions: dict[str, AttachmentSession] = {}
+        # Track active tools for progress visualization
+        self.active_tools: dict[str, str] = {}
+        # ⚡ Attachments are converted to model input as soon as their bytes
+        # arrive (POST /upload/{id}), not when the message is sent
+        self.attachment_pipeline = AttachmentPipeline(
+            self._prepare_attachment,
+            lambda attachment_id: getattr(self.store, "_attachment_data", {}).get(attachment_id, {}).get("mime_type"),
+        )
+        self.store.on_attachment_deleted = self._attachment_deleted
+    
+    def _get_tool_progress_message(
+        self, 
+        tool_name: str, 
+        status: str = "running",
+        queries: list[str] | None = None
+    ) -> str:
+        """Convert tool name to user-friendly progress message with icons and query details."""
+        
+        # Extract first query if available
+        query_text = None
+        if queries and len(queries) > 0:
+            # queries is typically a list like ['search term']
+            query_text = queries[0] if isinstance(queries, list) else str(queries)
+            # Truncate long queries
+            if len(query_text) > 60:
+                query_text = query_text[:60] + "..."
+        
+        # Base messages
+        tool_messages = {
+            "file_search": {
+                "running": "🔎 Searching knowledge base",
+                "completed": "✅ Found relevant content",
+                "analyzing": "🧪 Analyzing Results"
+            },
+            "web_search": {
+                "running": "🌐 Searching the web",
+                "completed": "✅ Found latest information",
+                "analyzing": "🧪 Analyzing Results"
+            },
+        }
+        
+        if tool_name in tool_messages:
+            base_msg = tool_messages[tool_name].get(status, f"🔧 Using {tool_name}")
+            
+            # Add query details if running and query available
+            if status == "running" and query_text:
+                return f"{base_msg} for: \"{query_text}\""
+            
+            return base_msg + "..."
+        
+        # Fallback for unknown tools
+        if status == "running" and query_text:
+            return f"🔧 Using {tool_name} with query: \"{query_text}\""
+        return f"🔧 Using {tool_name}..." if status == "running" else f"✅ Completed {tool_name}"
+    
+    async def _prepare_attachment(self, attachment_id: str) -> ResponseInputContentParam:
+        """Load an attachment and convert it to model input (run by the attachment pipeline)."""
+        attachment = await self.store.load_attachment(attachment_id, {})
+        logger.debug("[Attachments] Converting %s: %s", attachment_id, attachment.name)
+        return await self.to_message_content(attachment)
+
+    async def _attachment_deleted(self, attachment_id: str, attachment_data: dict[str, Any]) -> None:
+        """Attachment removed before sending: stop converting it and delete its uploaded document."""
+        task = self.attachment_pipeline.discard(attachment_id)
+        if task is not None:
+            await asyncio.wait([task])
+        file_id = attachment_data.get("document_file_id")
+        if file_id and not thread_vector_stores.has_file(file_id):
+            try:
+                await get_openai_client().files.delete(file_id)
+                logger.debug("[Attachments] Deleted %s uploaded for removed attachment %s", file_id, attachment_id)
+            except Exception as e:
+                logger.warning("[Attachments] Could not delete %s for removed attachment %s: %s", file_id, attachment_id, e)
+
+    def _get_session(self, thread_id: str) -> AttachmentSession:
+        """Get or create a SQLiteSession for this thread (attachments stored compactly)."""
+        if thread_id not in self.sessions:
+            self.sessions[thread_id] = AttachmentSession(
+                session_id=thread_id,
+                db_path="conversations.db"  # All sessions in one DB
+            )
+        return self.sessions[thread_id]
+
+    async def respond(
+        self,
+        thread: ThreadMetadata,
+        item: ThreadItem | None,
+        context: dict[str, Any],
+    ) -> AsyncIterator[ThreadStreamEvent]:
+        if item is None:
+            return
+
+        if _is_tool_completion_item(item):
+            return
+
+        if not isinstance(item, UserMessageItem):
+            return
+
+        request_start = time.perf_counter()
+
+        # Debug: Print the entire item structure (only in debug mode)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[respond] UserMessageItem attributes: %s", dir(item))
+            logger.debug("[respond] UserMessageItem data: %s", item)
+        
+        message_text = _user_message_text(item)
+        
+        # Check for attachments at the item level (not just in content)
+        attachment_ids = []
+        if hasattr(item, "attachments") and item.attachments:
+            logger.debug("[respond] Found item.attachments: %s", item.attachments)
+            for att in item.attachments:
+                if hasattr(att, "id"):
+                    attachment_ids.append(att.id)
+                elif isinstance(att, str):
+                    attachment_ids.append(att)
+        
+        # Also check content parts
+        content_attachment_ids = _get_attachment_refs(item)
+        attachment_ids.extend(content_attachment_ids)
+        
+        if message_text:
+            logger.debug("[respond] Message text: '%s...'", message_text[:50])
+        else:
+            logger.debug("[respond] No text")
+        logger.debug("[respond] Found %s attachment(s): %s", len(attachment_ids), attachment_ids)
+
+        # Get SQLiteSession for this thread (for agent memory)
+        session = self._get_session(thread.id)
+
+        # 🧭 Pick a reasoning profile for this message (quick / standard / deep)
+        # "minimal"/"low" = fast, good for chat; "medium" = deeper strategy work
+        route = classify_message(
+            message_text,
+            [self.store._attachment_data.get(attachment_id, {}).get("mime_type") for attachment_id in attachment_ids],
+            has_history=bool(await session.get_items(limit=1)),
+        )
+
+        # 📚 Score the message against the local knowledge base mirror while the
+        # rest of the turn is prepared (see kb_mirror.py)
+        kb_prefetch = start_prefetch(message_text) if route.profile != "quick" else None
+        
+        # Build input content - either string or list with message wrapper
+        if attachment_ids:
+            # Build multi-part message content with text and inline attachments (images, text files, docs)
+            message_content = []
+            
+            # Add text if present
+            if message_text:
+                message_content.append({"type": "input_text", "text": message_text})
+            
+            # Collect each attachment's model input - usually already converted
+            # at upload time; anything still running is awaited concurrently
+            # Note: PDFs will be uploaded to vector store, images/text inline
+            attachments_start = time.perf_counter()
+            attachment_contents = await self.attachment_pipeline.contents(attachment_ids)
+            for attachment_id, attachment_content in zip(attachment_ids, attachment_contents):
+                if isinstance(attachment_content, BaseException):
+                    ERRORS_TOTAL.inc(endpoint="chatkit", stage="attachment")
+                    logger.error(
+                        "[respond] ERROR processing attachment %s: %s", attachment_id, attachment_content,
+                        exc_info=attachment_content if logger.isEnabledFor(logging.DEBUG) else None,
+                    )
+                    continue
+                message_content.append(attachment_content)
+                logger.debug("[respond] Added attachment %s to message content", attachment_id)
+            
+            attachments_end = time.perf_counter()
+
+            # 📎 Documents go into this thread's own vector store (see thread_vector_stores.py)
+            document_file_ids = [
+                file_id
+                for attachment_id in attachment_ids
+                if (file_id := self.store._attachment_data.get(attachment_id, {}).get("document_file_id"))
+            ]
+            thread_docs = (
+                asyncio.create_task(thread_vector_stores.add_files(thread.id, document_file_ids))
+                if document_file_ids
+                else None
+            )
+
+            # Wrap in a message format for Responses API
+            agent_input = [
+                {
+                    "type": "message",
+                    "role": "user",
+                    "content": message_content
+                }
+            ]
+        else:
+            # Just text, no attachments
+            agent_input = message_text
+            thread_docs = None
+            
+        if not message_text and not attachment_ids:
+            return
+
+        # Auto-generate thread title from first user message if not set
+        if not thread.title and message_text:
+            thread.title = self.store._generate_title_from_message(message_text)
+            await self.store.save_thread(thread, context)
+
+        # 🎯 Using single GPT-5 agent (simple and fast)
+        # GPT-5 handles all queries with adaptive response depth
+        # Reasoning effort is routed per message above (effort_router.py)
+        logger.debug("[GPT-5 Agent] Processing query: '%s...'", message_text[:50] if message_text else 'image/file')
+
+        agent_context = AgentContext(
+            thread=thread,
+            store=self.store,
+            request_context=context,
+        )
+        
+        # 🧠 Emit initial "Thinking..." status BEFORE streaming starts
+        if ProgressUpdateEvent is not None:
+            try:
+                thinking_event = ProgressUpdateEvent(text="🧠 Thinking...")
+                yield thinking_event
+                logger.debug("🧠 Yielded initial thinking status to ChatKit")
+            except Exception as e:
+                logger.debug("⚠️  Failed to yield initial thinking status: %s", e)
+        
+        kb_retrieval = await finish_prefetch(kb_prefetch, "chatkit")
+        if thread_docs is not None:
+            try:
+                await thread_docs
+            except Exception as e:
+                ERRORS_TOTAL.inc(endpoint="chatkit", stage="thread_docs")
+                logger.error("[respond] ERROR adding documents to the thread's vector store: %s", e)
+        thread_store_id = thread_vector_stores.vector_store_id(thread.id)
+        # 📄 New documents index while the rest of the turn is set up; the model
+        # call only waits for what's left (bounded, see thread_vector_stores.py)
+        indexing = (
+            asyncio.create_task(thread_vector_stores.wait_for_indexing(thread.id))
+            if route.profile != "quick" and thread_vector_stores.indexing_pending(thread.id)
+            else None
+        )
+        # 🧰 Only ship the tools this turn can use (none for small talk unless
+        # the last turn searched, no file_search when the local mirror has the answer)
+        tool_selection = select_tools(
+            self.assistant,
+            message_text,
+            route.profile,
+            endpoint="chatkit",
+            local_kb=kb_retrieval is not None and kb_retrieval.confident,
+            vector_store_ids=(thread_store_id,) if thread_store_id else (),
+            follows_tools=route.profile == "quick" and await last_turn_used_tools(session),
+        )
+        model_settings = model_settings_for(route, thread.id, tool_selection.agent.tools, endpoint="chatkit")
+        run_config = RunConfig(
+            model_settings=model_settings,
+            call_model_input_filter=kb_retrieval.input_filter() if kb_retrieval else None,
+            # 💾 Attachment turns are list inputs - merge them with the thread's
+            # history instead of running without memory (see session_attachments.py)
+            session_input_callback=merge_with_history,
+        )
+        logger.debug("[Router] %s (%s), tools: %s", route.profile, route.reason, tool_selection.tool_set)
+
+        # 💾 Replay a cached answer to a common first question (opt-in, see response_cache.py)
+        turn_cache = await check_response_cache(
+            message_text,
+            has_attachments=bool(attachment_ids),
+            profile=route.profile,
+            session=session,
+            endpoint="chatkit",
+        )
+        
+        # 📊 Latency metrics (TTFT, inter-token, tokens/sec, hosted tool timings)
+        stream_timer = StreamTimer("chatkit", start_time=request_start)
+        # 🔬 Always-on request spans (tail-sampled, see tracing.py)
+        request_trace = start_trace(
+            "chatkit.request",
+            start=request_start,
+            thread_id=thread.id,
+            attachments=len(attachment_ids),
+            profile=route.profile,
+            tool_set=tool_selection.tool_set,
+        )
+        if turn_cache.run is not None:
+            request_trace.set(response_cache="hit")
+        if kb_retrieval is not None:
+            request_trace.set(kb_passages=len(kb_retrieval.hits), kb_confident=kb_retrieval.confident)
+        if attachment_ids:
+            request_trace.add_span("attachments", attachments_start, attachments_end)
+        tool_timer = ToolTimer(
+            on_complete=lambda name, start, end: request_trace.add_span(f"tool.{name}", start, end)
+        )
+
+        result = None
+        try:
+            # 📄 Inside the try, so a disconnect while waiting still finishes the timer and trace
+            if indexing is not None:
+                indexing_start = time.perf_counter()
+                if not indexing.done() and ProgressUpdateEvent is not None:
+                    yield ProgressUpdateEvent(text="📄 Reading your document...")
+                try:
+                    await indexing
+                except Exception as e:
+                    logger.warning("[respond] Could not check document indexing: %s", e)
+                DOCUMENT_INDEX_HELD_SECONDS.observe(time.perf_counter() - indexing_start)
+                request_trace.add_span("document_indexing", indexing_start, time.perf_counter())
+
+            request_trace.mark("model_start")
+            # Conditional tracing: only trace in debug mode to reduce latency
+            if DEBUG_MODE:
+                with trace(f"Jason coaching - {thread.id[:8]}"):
+                    result = turn_cache.run or run_streamed(  # ⏱️ Hedged when HEDGING_ENABLED (see hedging.py)
+                        tool_selection.agent,  # 🎯 Single GPT-5 agent with this turn's tools
+                        agent_input,  # 🖼️ Now includes attachments!
+                        endpoint="chatkit",
+                        context=agent_context,
+                        session=session,  # ✨ Attachments included (compact references stored)
+                        run_config=run_config,
+                    )
+                    # 🔧 Stream events with ChatKit conversion
+                    async for chatkit_event in stream_agent_response(
+                        agent_context, ObservedRun(result, tool_timer.observe)
+                    ):
+                        # Debug: Log event structure
+                        logger.debug("[EVENT] Type: %s", type(chatkit_event).__name__)
+                        if hasattr(chatkit_event, 'delta'):
+                            logger.debug("[EVENT] Delta: %r", chatkit_event.delta)
+                        if hasattr(chatkit_event, 'text'):
+                            logger.debug("[EVENT] Text: %r", chatkit_event.text[:100] if chatkit_event.text else None)
+                    
+                        # Strip annotation markers from text deltas
+                        # Even with chatkit 1.0.2, these markers still appear in text
+                        # and need manual stripping (confirmed via official samples)
+                        if hasattr(chatkit_event, 'delta') and isinstance(chatkit_event.delta, str):
+                            original = chatkit_event.delta
+                            chatkit_event.delta = _strip_annotation_markers(chatkit_event.delta)
+                            if original != chatkit_event.delta:
+                                logger.debug("[STRIPPED] %r -> %r", original, chatkit_event.delta)
+                    
+                        # Also check for 'text' field
+                        if hasattr(chatkit_event, 'text') and isinstance(chatkit_event.text, str):
+                            original = chatkit_event.text
+                            chatkit_event.text = _strip_annotation_markers(chatkit_event.text)
+                            if original != chatkit_event.text:
+                                logger.debug("[STRIPPED TEXT] %r -> %r", original[:100], chatkit_event.text[:100])
+                    
+                        if _is_text_delta(chatkit_event):
+                            stream_timer.token()
+                            if stream_timer.token_count == 1:
+                                request_trace.mark("first_token")
+                        yield chatkit_event
+                    turn_cache.remember(result)
+            else:
+                # Production mode: no tracing overhead
+                result = turn_cache.run or run_streamed(  # ⏱️ Hedged when HEDGING_ENABLED (see hedging.py)
+                    tool_selection.agent,  # 🎯 Single GPT-5 agent with this turn's tools
+                    agent_input,  # 🖼️ Now includes attachments!
+                    endpoint="chatkit",
+                    context=agent_context,
+                    session=session,  # ✨ Attachments included (compact references stored)
+                    run_config=run_config,
+                )
+                # 🔧 Stream events with ChatKit conversion
+                async for chatkit_event in stream_agent_response(
+                    agent_context, ObservedRun(result, tool_timer.observe)
+                ):
+                    # Strip annotation markers from text deltas
+                    # Even with chatkit 1.0.2, these markers still appear in text
+                    # and need manual stripping (confirmed via official samples)
+                    if hasattr(chatkit_event, 'delta') and isinstance(chatkit_event.delta, str):
+                        chatkit_event.delta = _strip_annotation_markers(chatkit_event.delta)
+                
+                    # Also check for 'text' field
+                    if hasattr(chatkit_event, 'text') and isinstance(chatkit_event.text, str):
+                        chatkit_event.text = _strip_annotation_markers(chatkit_event.text)
+                
+                    if _is_text_delta(chatkit_event):
+                        stream_timer.token()
+                        if stream_timer.token_count == 1:
+                            request_trace.mark("first_token")
+                    yield chatkit_event
+                turn_cache.remember(result)
+        except Exception as e:
+            stream_timer.error("stream")
+            request_trace.record_error(e)
+            raise
+        finally:
+            tool_timer.abandon()
+            stream_timer.finish()
+            record_route_latency("chatkit", route, stream_timer)
+            request_trace.mark("finish")
+            request_trace.set(tokens=stream_timer.token_count)
+            usage = None
+            if result is not None:
+                # 🗄️ Cached vs uncached input tokens (prompt cache hit rate)
+                usage = record_prompt_usage("chatkit", result.context_wrapper.usage)
+                if usage:
+                    request_trace.set(**usage)
+                if getattr(result, "hedged", False):
+                    request_trace.set(hedged=True, hedge_winner=result.winner)
+            record_tool_set_usage("chatkit", tool_selection, stream_timer, usage)
+            request_trace.finish()
+
+    async def to_message_content(self, input: Attachment) -> ResponseInputContentParam:
+        """
+        Convert attachment to format Agent SDK expects.
+        
+        Supported formats:
+        - Images (image/*): Uploaded once to OpenAI files and referenced by file_id
+          (base64 data URL if the upload fails or IMAGE_FILE_REFS_ENABLED=false)
+        - Text files (text/*, .json, .md, .txt): Decoded and inline as input_text
+          (large ones as a summary plus first / last lines, within a token budget)
+        - Small documents (PDF, DOCX, XLSX, PPTX): Text extracted locally and inlined
+        - Other documents: Uploaded to OpenAI and added to the thread's
+          own vector store by respond() (Responses API doesn't support message.attachments);
+          THREAD_VECTOR_STORES_ENABLED=false adds them to the permanent store instead
+        
+        Returns:
+        - Dict with {"type": "input_image"} or {"type": "input_text"}
+        
+        Note: the Responses API (used by Agent SDK) doesn't support thread-level
+        attachments, so documents go through a per-thread vector store instead.
+        """
+        logger.debug("[to_message_content] Converting attachment %s to message content", input.id)
+        
+        # Get attachment data from custom storage
+        if not hasattr(self.store, '_attachment_data'):
+            raise RuntimeError(f"Attachment storage not initialized")
+        
+        attachment_data = self.store._attachment_data.get(input.id)
+        if not attachment_data:
+            logger.error("[to_message_content] ERROR: Attachment %s not found in _attachment_data", input.id)
+            logger.debug("[to_message_content] Available attachments: %s", list(self.store._attachment_data.keys()))
+            raise RuntimeError(f"Attachment {input.id} not found")
+        
+        mime_type = attachment_data["mime_type"]
+        data_bytes = attachment_data.get("data")
+        filename = attachment_data.get("name", "unnamed")
+        
+        logger.debug("[to_message_content] Attachment MIME type: %s, filename: %s", mime_type, filename)
+        
+        if not data_bytes:
+            logger.error("[to_message_content] ERROR: No data bytes for attachment %s", input.id)
+            raise RuntimeError(f"No data bytes for attachment {input.id}")
+        
+        # Handle images - referenced by uploaded file id (data URL fallback)
+        if mime_type and mime_type.startswith("image/"):
+            # 🖼️ Downscaled / metadata-stripped / recompressed once per attachment,
+            # then uploaded once so history holds a file id rather than megabytes of base64
+            result = await image_input(attachment_data)
+            logger.debug("[to_message_content] Returning Agent SDK format: type=input_image (%s)",
+                         "file_id" if "file_id" in result else "data_url")
+            return result
+        
+        # Handle simple text files - inline as text
+        elif mime_type and (mime_type.startswith("text/") or mime_type in ["application/json"]):
+            try:
+                # 📏 Files over TEXT_ATTACHMENT_MAX_TOKENS become a summary plus first /
+                # last lines; only that part is decoded (see text_attachments.py)
+                text_content = await asyncio.to_thread(text_attachment_text, filename, mime_type, data_bytes)
+                logger.debug("[to_message_content] Decoded text file, length: %s chars", len(text_content))
+                
+                # Return as input_text with filename context
+                result = {
+                    "type": "input_text",
+                    "text": text_content
+                }
+                logger.debug("[to_message_content] Returning Agent SDK format: type=input_text")
+                return result
+            except UnicodeDecodeError:
+                raise RuntimeError(f"Failed to decode text file: {filename}")
+        
+        # Handle PDFs, DOCX, and other documents - upload to OpenAI and add to vector store
+        # Responses API doesn't support message.attachments, so we add to vector store instead
+        elif mime_type in [
+            "application/pdf",
+            "application/vnd.openxmlformats-officedocument.wordprocessingml.document",  # .docx
+            "application/msword",  # .doc
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",  # .xlsx
+            "application/vnd.ms-excel",  # .xls
+            "application/vnd.openxmlformats-officedocument.presentationml.presentation",  # .pptx
+        ]:
+            logger.debug("[to_message_content] Document type detected: %s", mime_type)
+
+            # 📄 Small documents are read locally and inlined - no upload, no
+            # waiting for indexing (see document_text.py)
+            document_text = await small_document_text(mime_type, data_bytes)
+            if document_text is not None:
+                logger.debug("[to_message_content] Inlined document text, length: %s chars", len(document_text))
+                return {"type": "input_text", "text": f"File: {filename}\n\n{document_text}"}
+
+            if THREAD_VECTOR_STORES_ENABLED and attachment_data.get("document_file_id"):
+                # Already uploaded (converted again after its first use) - don't upload twice
+                return {
+                    "type": "input_text",
+                    "text": f"[Document attached: {filename}]\n\nIt's been added to this conversation's documents - use file_search to read it."
+                }
+
+            logger.debug("[to_message_content] Uploading to OpenAI and adding to vector store...")
+            
+            try:
+                openai_client = get_openai_client()
+
+                # Step 1: Upload to OpenAI with purpose="assistants"
+                # (bytes are sent directly - no temp file, no blocking disk I/O)
+                openai_file = await openai_client.files.create(
+                    file=(filename, data_bytes, mime_type),
+                    purpose="assistants"
+                )
+                
+                logger.debug("[to_message_content] Uploaded to OpenAI, file_id: %s", openai_file.id)
+                
+                # Step 2: Add to vector store so file_search can access it
+                # (Responses API requires this - can't use message.attachments)
+                if THREAD_VECTOR_STORES_ENABLED:
+                    # 📎 The thread isn't known yet - respond() adds the file to the
+                    # thread's own vector store (see thread_vector_stores.py)
+                    attachment_data["document_file_id"] = openai_file.id
+                    result = {
+                        "type": "input_text",
+                        "text": f"[Document attached: {filename}]\n\nIt's been added to this conversation's documents - use file_search to read it."
+                    }
+                elif JASON_VECTOR_STORE_ID:
+                    try:
+                        vector_store_file = await openai_client.vector_stores.files.create(
+                            vector_store_id=JASON_VECTOR_STORE_ID,
+                            file_id=openai_file.id
+                        )
+                        logger.debug("[to_message_content] Added to vector store, status: %s", vector_store_file.status)
+                        
+                        # Return message telling user the file is being indexed
+                        result = {
+                            "type": "input_text",
+                            "text": f"[Document attached: {filename}]\n\nI've added this to my knowledge base and will analyze it. Note: This file will be saved permanently in the knowledge base."
+                        }
+                    except Exception as e:
+                        logger.error("[to_message_content] ERROR adding to vector store: %s", e)
+                        # Fall back to just mentioning the file
+                        result = {
+                            "type": "input_text",
+                            "text": f"[Document attached: {filename}]\n\nNote: Could not add to knowledge base ({str(e)}). Please use the Knowledge Base upload section instead."
+                        }
+                else:
+                    # No vector store configured
+                    logger.warning("[to_message_content] WARNING: No vector store configured")
+                    result = {
+                        "type": "input_text",
+                        "text": f"[Document attached: {filename}]\n\nNote: Vector store not configured. Please upload documents via the Knowledge Base section instead."
+                    }
+                
+                logger.debug("[to_message_content] Returning document reference")
+                
+                return result
+                        
+            except Exception as e:
+                logger.exception("[to_message_content] ERROR uploading document: %s", e)
+                raise RuntimeError(f"Failed to process document {filename}: {str(e)}")
+        
+        else:
+            raise RuntimeError(
+                f"Unsupported attachment type: {mime_type} ({filename}). "
+                f"Supported: images (image/*), text files (text/*, .json), "
+                f"and documents (.pdf, .docx, .xlsx, .pptx)"
+            )
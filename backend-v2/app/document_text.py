@@ -0,0 +1,246 @@
+"""
+Local text extraction for small chat documents.
+
+A 2-page PDF or a short DOCX attached in chat used to go through the vector
+store: upload, index (asynchronous), then hope file_search finds the right
+chunks. For small documents it's faster and more reliable to give the model
+the whole text. Documents are extracted locally (in a thread, at upload time
+via the attachment pipeline) and inlined as `input_text` when the text fits
+DOCUMENT_INLINE_MAX_TOKENS; larger ones, and anything that can't be parsed
+here, still go to the vector store.
+
+- DOCX / XLSX / PPTX are zipped XML and are read with the standard library
+- PDF needs pypdf (optional); without it PDFs always use the vector store
+- legacy .doc / .xls are binary formats and always use the vector store
+
+Extraction stops as soon as the budget is exceeded, so a 300-page PDF costs
+about as much as the few pages it takes to find out it's too big.
+
+Environment:
+- DOCUMENT_INLINE_ENABLED: "true" (default) / "false"
+- DOCUMENT_INLINE_MAX_TOKENS: largest document inlined, in estimated tokens (default 6000)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+import os
+import re
+import zipfile
+from typing import Callable, Iterator
+from xml.etree import ElementTree
+
+from .metrics import REGISTRY
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # optional dependency - PDFs go to the vector store without it
+    PdfReader = None  # type: ignore[assignment,misc]
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_INLINE_ENABLED = os.getenv("DOCUMENT_INLINE_ENABLED", "true").lower() == "true"
+DOCUMENT_INLINE_MAX_TOKENS = int(os.getenv("DOCUMENT_INLINE_MAX_TOKENS", "6000"))
+
+# Zip members bigger than this aren't read (a small document never needs it)
+_MAX_XML_BYTES = 20 * 1024 * 1024
+
+DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+PPTX = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+PDF = "application/pdf"
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_S = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+_R = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+DOCUMENT_EXTRACT_TOTAL = REGISTRY.counter(
+    "jason_document_extract_total",
+    "Local document extraction outcomes (inlined / too_large / empty / unsupported / error).",
+    ("kind", "outcome"),
+)
+DOCUMENT_EXTRACT_SECONDS = REGISTRY.histogram(
+    "jason_document_extract_seconds",
+    "Time to extract text from a document locally.",
+    ("kind",),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+if PdfReader is None and DOCUMENT_INLINE_ENABLED:
+    logger.info("[Documents] pypdf not installed; PDFs always go to the vector store")
+
+
+class _TooLarge(Exception):
+    pass
+
+
+class _Budget:
+    """Collects text blocks, bailing out once the token budget is exceeded."""
+
+    def __init__(self, max_tokens: int) -> None:
+        self.max_chars = max_tokens * 4
+        self.blocks: list[str] = []
+        self._parts: list[str] = []
+        self.chars = 0
+
+    def add(self, block: str, separator: str = "\n\n") -> None:
+        block = block.strip()
+        if not block:
+            return
+        self.chars += len(block) + len(separator)
+        if self.chars > self.max_chars:
+            raise _TooLarge
+        self.blocks.append(block)
+        self._parts.extend((separator, block) if self._parts else (block,))
+
+    def text(self) -> str:
+        return _BLANK_LINES_RE.sub("\n\n", "".join(self._parts))
+
+
+def _xml(archive: zipfile.ZipFile, name: str) -> ElementTree.Element | None:
+    try:
+        info = archive.getinfo(name)
+    except KeyError:
+        return None
+    if info.file_size > _MAX_XML_BYTES:
+        raise _TooLarge
+    return ElementTree.fromstring(archive.read(info))
+
+
+def _numbered(names: list[str], prefix: str) -> list[str]:
+    """slide1.xml, slide2.xml, ..., slide10.xml in numeric order."""
+    pattern = re.compile(re.escape(prefix) + r"(\d+)\.xml$")
+    found = [(int(match.group(1)), name) for name in names if (match := pattern.match(name))]
+    return [name for _, name in sorted(found)]
+
+
+def _docx(data: bytes, budget: _Budget) -> None:
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        root = _xml(archive, "word/document.xml")
+        if root is None:
+            return
+        for paragraph in root.iter(f"{_W}p"):
+            parts = []
+            for node in paragraph.iter():
+                if node.tag == f"{_W}t" and node.text:
+                    parts.append(node.text)
+                elif node.tag == f"{_W}tab":
+                    parts.append("\t")
+                elif node.tag in (f"{_W}br", f"{_W}cr"):
+                    parts.append("\n")
+            budget.add("".join(parts))
+
+
+def _xlsx_rows(sheet: ElementTree.Element, shared: list[str]) -> Iterator[str]:
+    for row in sheet.iter(f"{_S}row"):
+        cells = []
+        for cell in row.iter(f"{_S}c"):
+            kind = cell.get("t")
+            if kind == "inlineStr":
+                cells.append("".join(t.text or "" for t in cell.iter(f"{_S}t")))
+                continue
+            value = cell.find(f"{_S}v")
+            text = value.text if value is not None and value.text is not None else ""
+            if kind == "s" and text.isdigit() and int(text) < len(shared):
+                text = shared[int(text)]
+            cells.append(text)
+        if any(cells):
+            yield "\t".join(cells)
+
+
+def _xlsx(data: bytes, budget: _Budget) -> None:
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        strings = _xml(archive, "xl/sharedStrings.xml")
+        shared = (
+            ["".join(t.text or "" for t in item.iter(f"{_S}t")) for item in strings.iter(f"{_S}si")]
+            if strings is not None
+            else []
+        )
+        workbook = _xml(archive, "xl/workbook.xml")
+        rels = _xml(archive, "xl/_rels/workbook.xml.rels")
+        if workbook is None or rels is None:
+            return
+        targets = {rel.get("Id"): rel.get("Target", "") for rel in rels.iter(f"{_PKG_REL}Relationship")}
+        for sheet in workbook.iter(f"{_S}sheet"):
+            target = targets.get(sheet.get(f"{_R}id"), "").lstrip("/")
+            path = target if target.startswith("xl/") else f"xl/{target}"
+            root = _xml(archive, path)
+            if root is None:
+                continue
+            budget.add(f"## Sheet: {sheet.get('name')}")
+            for line in _xlsx_rows(root, shared):
+                budget.add(line, separator="\n")
+
+
+def _pptx(data: bytes, budget: _Budget) -> None:
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for number, name in enumerate(_numbered(archive.namelist(), "ppt/slides/slide"), start=1):
+            root = _xml(archive, name)
+            if root is None:
+                continue
+            budget.add(f"## Slide {number}")
+            for paragraph in root.iter(f"{_A}p"):
+                budget.add("".join(t.text or "" for t in paragraph.iter(f"{_A}t")))
+
+
+def _pdf(data: bytes, budget: _Budget) -> None:
+    reader = PdfReader(io.BytesIO(data))
+    if reader.is_encrypted:
+        return
+    for number, page in enumerate(reader.pages, start=1):
+        budget.add(f"## Page {number}")
+        budget.add(page.extract_text() or "")
+
+
+_EXTRACTORS: dict[str, tuple[str, Callable[[bytes, _Budget], None]]] = {
+    DOCX: ("docx", _docx),
+    XLSX: ("xlsx", _xlsx),
+    PPTX: ("pptx", _pptx),
+}
+if PdfReader is not None:
+    _EXTRACTORS[PDF] = ("pdf", _pdf)
+
+_UNSUPPORTED_KINDS = {PDF: "pdf", "application/msword": "doc", "application/vnd.ms-excel": "xls"}
+
+
+def extract_document_text(mime_type: str, data: bytes, max_tokens: int = DOCUMENT_INLINE_MAX_TOKENS) -> str | None:
+    """Text of a small document, or None if it's too large / can't be read here (CPU-bound)."""
+    if not DOCUMENT_INLINE_ENABLED:
+        return None
+    extractor = _EXTRACTORS.get(mime_type)
+    if extractor is None:
+        return None
+    kind, extract = extractor
+    budget = _Budget(max_tokens)
+    with DOCUMENT_EXTRACT_SECONDS.time(kind=kind):
+        try:
+            extract(data, budget)
+        except _TooLarge:
+            DOCUMENT_EXTRACT_TOTAL.inc(kind=kind, outcome="too_large")
+            return None
+        except Exception as e:
+            DOCUMENT_EXTRACT_TOTAL.inc(kind=kind, outcome="error")
+            logger.warning("[Documents] Could not extract %s locally: %s", kind, e)
+            return None
+    # Headings alone ("## Page 1") mean there was no real text, e.g. a scanned PDF
+    if all(block.startswith("## ") for block in budget.blocks):
+        DOCUMENT_EXTRACT_TOTAL.inc(kind=kind, outcome="empty")
+        return None
+    DOCUMENT_EXTRACT_TOTAL.inc(kind=kind, outcome="inlined")
+    return budget.text()
+
+
+async def small_document_text(mime_type: str, data: bytes) -> str | None:
+    """`extract_document_text` off the event loop."""
+    if not DOCUMENT_INLINE_ENABLED:
+        return None
+    if mime_type not in _EXTRACTORS:
+        DOCUMENT_EXTRACT_TOTAL.inc(kind=_UNSUPPORTED_KINDS.get(mime_type, "other"), outcome="unsupported")
+        return None
+    return await asyncio.to_thread(extract_document_text, mime_type, data)
@@ -0,0 +1,160 @@
+"""
+Per-message reasoning-effort router.
+
+A cheap local classifier (no model call) picks a model settings profile for
+each message from its length, attachments, URLs and keywords:
+
+- quick:    greetings / acknowledgements ("yo", "thanks", "bet"); a bare
+            "yes" / "ok" only when the thread has no history, since later
+            it usually answers the assistant's last question
+- standard: everyday coaching questions (the previous fixed behaviour)
+- deep:     strategy / planning asks, long messages, document attachments
+
+Both chat paths build their `ModelSettings` through `model_settings_for()`,
+which also carries the per-thread prompt cache key (see prompt_cache.py).
+
+Environment:
+- EFFORT_ROUTER_ENABLED: "true" (default); "false" routes everything to standard
+- EFFORT_ROUTER_DEEP_CHARS: messages at least this long go deep (default 600)
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Iterable
+
+from agents.model_settings import ModelSettings
+from agents.models.openai_responses import WebSearchTool
+from openai.types.shared import Reasoning
+
+from .metrics import REGISTRY, StreamTimer
+from .prompt_cache import prompt_cache_args
+
+EFFORT_ROUTER_ENABLED = os.getenv("EFFORT_ROUTER_ENABLED", "true").lower() == "true"
+EFFORT_ROUTER_DEEP_CHARS = int(os.getenv("EFFORT_ROUTER_DEEP_CHARS", "600"))
+
+# profile -> (reasoning effort, verbosity)
+PROFILES: dict[str, tuple[str, str]] = {
+    "quick": ("minimal", "low"),
+    "standard": ("low", "low"),
+    "deep": ("medium", "medium"),
+}
+
+_URL_RE = re.compile(r"https?://\S+|www\.\S+", re.IGNORECASE)
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+_SMALL_TALK = {
+    "yo", "hi", "hey", "hello", "sup", "wassup", "gm", "gn", "thanks", "thank",
+    "you", "thx", "ty", "ok", "okay", "k", "cool", "bet", "nice", "lol", "lmao",
+    "bro", "fire", "dope", "appreciate", "it", "got", "yes", "yeah", "yep",
+    "no", "nah", "good", "morning", "night", "what's", "up", "whats", "man",
+}
+
+# Confirmations are only small talk at the start of a thread
+_CONFIRMATIONS = {
+    "ok", "okay", "k", "yes", "yeah", "yep", "no", "nah", "bet", "got",
+}
+
+# Whole words only ("plan" but not "airplane" / "explanation")
+_DEEP_KEYWORDS_RE = re.compile(
+    r"\b(?:strateg(?:y|ies|ic)|plan(?:s|ned|ning)?|roadmaps?|calendars?|funnels?|"
+    r"monetiz\w*|launch(?:es|ed|ing)?|audit(?:s|ed|ing)?|analy\w+|break ?down|"
+    r"step by step|compar(?:e|es|ed|ing|ison)|frameworks?|pricing|brand deals?|"
+    r"sponsorships?|niches?|grow my|30[ -]day|90[ -]day|content systems?|business\w*)\b"
+)
+
+_DOCUMENT_MIME_PREFIXES = ("application/",)
+
+ROUTE_DECISIONS_TOTAL = REGISTRY.counter(
+    "jason_route_decisions_total",
+    "Reasoning profile chosen per message, by reason.",
+    ("endpoint", "profile", "reason"),
+)
+ROUTE_TTFT_SECONDS = REGISTRY.histogram(
+    "jason_route_ttft_seconds",
+    "Time to first token by reasoning profile.",
+    ("endpoint", "profile"),
+)
+ROUTE_DURATION_SECONDS = REGISTRY.histogram(
+    "jason_route_duration_seconds",
+    "Total response duration by reasoning profile.",
+    ("endpoint", "profile"),
+)
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    profile: str
+    reason: str
+
+
+def classify_message(
+    text: str,
+    attachment_mime_types: Iterable[str | None] = (),
+    has_history: bool = False,
+) -> RouteDecision:
+    """Pick a profile for one user message (pure, microseconds).
+
+    `has_history` is whether the thread already has turns; a "yes" or "ok"
+    then answers the previous reply and isn't routed as small talk.
+    """
+    if not EFFORT_ROUTER_ENABLED:
+        return RouteDecision("standard", "router_disabled")
+
+    mime_types = [mime or "" for mime in attachment_mime_types]
+    lowered = text.lower().strip()
+
+    if any(mime.startswith(_DOCUMENT_MIME_PREFIXES) for mime in mime_types):
+        return RouteDecision("deep", "document_attachment")
+    if len(lowered) >= EFFORT_ROUTER_DEEP_CHARS:
+        return RouteDecision("deep", "long_message")
+    if _DEEP_KEYWORDS_RE.search(lowered):
+        return RouteDecision("deep", "keyword")
+    if mime_types:
+        return RouteDecision("standard", "attachment")
+    if _URL_RE.search(lowered):
+        return RouteDecision("standard", "url")
+
+    words = _WORD_RE.findall(lowered)
+    if len(words) <= 6 and "?" not in lowered and all(word in _SMALL_TALK for word in words):
+        if has_history and any(word in _CONFIRMATIONS for word in words):
+            return RouteDecision("standard", "follow_up")
+        return RouteDecision("quick", "small_talk")
+    return RouteDecision("standard", "default")
+
+
+def _supports_minimal(tools: Iterable[Any]) -> bool:
+    # The API rejects reasoning.effort="minimal" when web_search is in the tool list
+    return not any(isinstance(tool, WebSearchTool) for tool in tools)
+
+
+def model_settings_for(
+    decision: RouteDecision,
+    thread_id: str,
+    tools: Iterable[Any] = (),
+    endpoint: str = "chatkit",
+) -> ModelSettings:
+    """Build the run's ModelSettings for a routing decision (and count it)."""
+    effort, verbosity = PROFILES[decision.profile]
+    tools = list(tools)
+    if effort == "minimal" and not _supports_minimal(tools):
+        effort = "low"
+    ROUTE_DECISIONS_TOTAL.inc(endpoint=endpoint, profile=decision.profile, reason=decision.reason)
+    return ModelSettings(
+        parallel_tool_calls=True if tools else None,  # 🔥 3-5x faster with parallel execution
+        reasoning=Reasoning(effort=effort),  # type: ignore[arg-type]
+        verbosity=verbosity,  # type: ignore[arg-type]
+        extra_args=prompt_cache_args(thread_id),  # 🗄️ Per-thread prompt cache key
+    )
+
+
+def record_route_latency(endpoint: str, decision: RouteDecision, stream_timer: StreamTimer) -> None:
+    """Per-profile TTFT and duration (call after the stream has finished)."""
+    if stream_timer.ttft is not None:
+        ROUTE_TTFT_SECONDS.observe(stream_timer.ttft, endpoint=endpoint, profile=decision.profile)
+    ROUTE_DURATION_SECONDS.observe(
+        time.perf_counter() - stream_timer.start, endpoint=endpoint, profile=decision.profile
+    )
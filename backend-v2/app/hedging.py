@@ -0,0 +1,296 @@
+"""
+Hedged agent runs to cut tail latency before the first output.
+
+Most GPT-5 runs start producing output quickly, but a few sit for many
+seconds (queueing, long reasoning) before anything arrives. With hedging on,
+if a run has produced no output within the hedge threshold, a second,
+identical run (optionally on HEDGE_MODEL) starts in parallel. Whichever one
+produces output first is streamed to the client and the other is cancelled.
+
+"Output" means any model event past `response.created` / `in_progress`
+(text, a tool call starting, ...). Both legs' events are held back until one
+wins, so the client never sees a mix of the two, and tool calls only ever
+run on the winner.
+
+Session memory: both legs read the thread's history, but writes go through a
+per-leg buffer that is committed for the winner and dropped for the loser,
+so the user's message is stored once.
+
+Threshold: HEDGE_AFTER_MS is a fixed delay, or "p95" (default) to use the
+p95 of recent time-to-first-output, clamped to [HEDGE_MIN_MS, HEDGE_MAX_MS]
+and falling back to HEDGE_MAX_MS until HEDGE_MIN_SAMPLES runs have been seen.
+
+Environment:
+- HEDGING_ENABLED: "false" (default) / "true" - a hedge costs a second model call
+- HEDGE_AFTER_MS: "p95" (default) or milliseconds
+- HEDGE_MIN_MS / HEDGE_MAX_MS: bounds for the adaptive threshold (1500 / 8000)
+- HEDGE_MIN_SAMPLES: runs observed before the p95 is trusted (default 20)
+- HEDGE_MODEL: model for the hedge leg (default: same as the primary)
+
+`scripts/check-hedged-requests.py` exercises this against a local stand-in
+model with injected delays.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator
+
+from agents import Agent, Runner
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "false").lower() == "true"
+HEDGE_AFTER_MS = os.getenv("HEDGE_AFTER_MS", "p95").strip().lower()
+HEDGE_MIN_MS = float(os.getenv("HEDGE_MIN_MS", "1500"))
+HEDGE_MAX_MS = float(os.getenv("HEDGE_MAX_MS", "8000"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MODEL = os.getenv("HEDGE_MODEL", "")
+
+# Raw Responses events that arrive before the model has produced anything
+_PRE_OUTPUT_EVENTS = {"response.created", "response.in_progress", "response.queued"}
+
+_first_output_samples: deque[float] = deque(maxlen=500)
+
+HEDGE_RUNS_TOTAL = REGISTRY.counter(
+    "jason_hedge_runs_total",
+    "Runs started with hedging enabled.",
+    ("endpoint",),
+)
+HEDGES_TOTAL = REGISTRY.counter(
+    "jason_hedges_total",
+    "Runs where the hedge threshold passed and a second run was started.",
+    ("endpoint",),
+)
+HEDGE_WINS_TOTAL = REGISTRY.counter(
+    "jason_hedge_wins_total",
+    "Which leg produced output first, for hedged runs.",
+    ("endpoint", "winner"),
+)
+FIRST_OUTPUT_SECONDS = REGISTRY.histogram(
+    "jason_first_output_seconds",
+    "Time from run start to the first model output event (the hedging signal).",
+    ("endpoint",),
+)
+REGISTRY.gauge(
+    "jason_hedge_threshold_seconds",
+    "Current hedge threshold.",
+    callback=lambda: hedge_threshold(),
+)
+
+
+def hedge_threshold() -> float:
+    """Seconds without output before a hedge starts."""
+    if HEDGE_AFTER_MS != "p95":
+        return float(HEDGE_AFTER_MS) / 1000
+    if len(_first_output_samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_MAX_MS / 1000
+    samples = sorted(_first_output_samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return min(max(p95, HEDGE_MIN_MS / 1000), HEDGE_MAX_MS / 1000)
+
+
+def _is_output(event: Any) -> bool:
+    if getattr(event, "type", None) != "raw_response_event":
+        return False
+    return getattr(getattr(event, "data", None), "type", None) not in _PRE_OUTPUT_EVENTS
+
+
+class _LegSession:
+    """Session proxy: reads pass through, writes are held until the leg wins."""
+
+    def __init__(self, session: Any) -> None:
+        self._session = session
+        self.session_id = session.session_id
+        self._pending: list[Any] = []
+        self._state = "pending"  # pending -> committed | discarded
+
+    async def get_items(self, limit: int | None = None) -> list[Any]:
+        return await self._session.get_items(limit)
+
+    async def add_items(self, items: list[Any]) -> None:
+        if self._state == "committed":
+            await self._session.add_items(items)
+        elif self._state == "pending":
+            self._pending.extend(items)
+
+    async def pop_item(self) -> Any:
+        return await self._session.pop_item()
+
+    async def clear_session(self) -> None:
+        await self._session.clear_session()
+
+    async def commit(self) -> None:
+        self._state = "committed"
+        if self._pending:
+            items, self._pending = self._pending, []
+            await self._session.add_items(items)
+
+    def discard(self) -> None:
+        self._state = "discarded"
+        self._pending = []
+
+
+_DONE = object()
+
+
+class _Leg:
+    def __init__(self, name: str, result: Any, session: _LegSession | None) -> None:
+        self.name = name
+        self.result = result
+        self.session = session
+        self.buffer: list[Any] = []
+        self.task: asyncio.Task[None] | None = None
+
+    def start(self, queue: asyncio.Queue[tuple[_Leg, Any]]) -> None:
+        async def pump() -> None:
+            try:
+                async for event in self.result.stream_events():
+                    await queue.put((self, event))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await queue.put((self, e))
+                return
+            await queue.put((self, _DONE))
+
+        self.task = asyncio.create_task(pump())
+
+    def cancel(self) -> None:
+        self.result.cancel()
+        if self.task is not None:
+            self.task.cancel()
+        if self.session is not None:
+            self.session.discard()
+
+
+class HedgedRun:
+    """
+    Stands in for `RunResultStreaming`: `stream_events()` yields the winning
+    leg's events; other attributes (usage, final_output, ...) come from the
+    winner (or the primary until one has won).
+    """
+
+    def __init__(
+        self,
+        agent: Agent[Any],
+        input: Any,
+        endpoint: str,
+        session: Any = None,
+        hedge_agent: Agent[Any] | None = None,
+        **run_kwargs: Any,
+    ) -> None:
+        self._agent = agent
+        self._hedge_agent = hedge_agent or agent
+        self._input = input
+        self._endpoint = endpoint
+        self._session = session
+        self._run_kwargs = run_kwargs
+        self._start = time.perf_counter()
+        self._legs: list[_Leg] = []
+        self.winner: str | None = None
+        self.hedged = False
+        self._current = self._launch("primary", self._agent)
+        HEDGE_RUNS_TOTAL.inc(endpoint=endpoint)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._current.result, name)
+
+    def _launch(self, name: str, agent: Agent[Any]) -> _Leg:
+        session = _LegSession(self._session) if self._session is not None else None
+        result = Runner.run_streamed(agent, self._input, session=session, **self._run_kwargs)
+        leg = _Leg(name, result, session)
+        self._legs.append(leg)
+        return leg
+
+    def cancel(self) -> None:
+        for leg in self._legs:
+            leg.cancel()
+
+    async def _select_winner(self, queue: asyncio.Queue[tuple[_Leg, Any]]) -> tuple[_Leg, Any]:
+        """Wait for the first leg to produce output (or finish); start the hedge on timeout."""
+        deadline = self._start + hedge_threshold()
+        failed: dict[str, BaseException] = {}
+        while True:
+            timeout = None
+            if not self.hedged:
+                timeout = max(0.0, deadline - time.perf_counter())
+            try:
+                leg, item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                self.hedged = True
+                HEDGES_TOTAL.inc(endpoint=self._endpoint)
+                logger.info(
+                    "[Hedging] No output after %.1fs, starting hedge run", time.perf_counter() - self._start
+                )
+                self._launch("hedge", self._hedge_agent).start(queue)
+                continue
+
+            if isinstance(item, BaseException):
+                failed[leg.name] = item
+                live = [other for other in self._legs if other.name not in failed]
+                if live and self.hedged:
+                    logger.warning("[Hedging] %s run failed before output, waiting on the other: %s", leg.name, item)
+                    continue
+                return leg, item
+            if item is _DONE or _is_output(item):
+                return leg, item
+            leg.buffer.append(item)
+
+    async def stream_events(self) -> AsyncIterator[Any]:
+        queue: asyncio.Queue[tuple[_Leg, Any]] = asyncio.Queue()
+        self._legs[0].start(queue)
+        try:
+            winner, first = await self._select_winner(queue)
+            self._current = winner
+            self.winner = winner.name
+            elapsed = time.perf_counter() - self._start
+            FIRST_OUTPUT_SECONDS.observe(elapsed, endpoint=self._endpoint)
+            _first_output_samples.append(elapsed)
+            if self.hedged:
+                HEDGE_WINS_TOTAL.inc(endpoint=self._endpoint, winner=winner.name)
+                logger.info("[Hedging] %s run won after %.1fs", winner.name, elapsed)
+            for leg in self._legs:
+                if leg is not winner:
+                    leg.cancel()
+            if winner.session is not None:
+                await winner.session.commit()
+
+            for event in winner.buffer:
+                yield event
+            winner.buffer = []
+            item = first
+            while True:
+                if isinstance(item, BaseException):
+                    raise item
+                if item is _DONE:
+                    break
+                yield item
+                leg, item = await queue.get()
+                while leg is not winner:
+                    leg, item = await queue.get()
+        finally:
+            for leg in self._legs:
+                if leg.task is not None and not leg.task.done():
+                    leg.cancel()
+
+
+def run_streamed(
+    agent: Agent[Any],
+    input: Any,
+    *,
+    endpoint: str,
+    session: Any = None,
+    **run_kwargs: Any,
+) -> Any:
+    """`Runner.run_streamed`, hedged when HEDGING_ENABLED."""
+    if not HEDGING_ENABLED:
+        return Runner.run_streamed(agent, input, session=session, **run_kwargs)
+    hedge_agent = agent.clone(model=HEDGE_MODEL) if HEDGE_MODEL else agent
+    return HedgedRun(agent, input, endpoint, session=session, hedge_agent=hedge_agent, **run_kwargs)
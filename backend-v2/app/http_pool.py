@@ -0,0 +1,121 @@
+"""
+Single shared, tuned HTTP connection pool for every upstream call.
+
+The AsyncOpenAI client (direct file/audio calls), the Agents SDK's model
+calls and the n8n reel transcriber all go through one `httpx.AsyncClient`,
+so keep-alive connections and TLS sessions are reused across them instead
+of each library opening its own pool.
+
+Environment:
+- HTTP_EXPECTED_CONCURRENCY: concurrent chats per worker (default 50);
+  pool limits are derived from it unless set explicitly
+- HTTP_POOL_MAX_CONNECTIONS / HTTP_POOL_MAX_KEEPALIVE / HTTP_KEEPALIVE_EXPIRY
+- HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT (seconds)
+- HTTP2: "true" (default) enables HTTP/2 when the `h2` package is installed
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any
+
+import httpx
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+
+    _H2_AVAILABLE = True
+except ImportError:
+    _H2_AVAILABLE = False
+
+# Each chat can hold a model stream plus parallel tool calls open at once
+HTTP_EXPECTED_CONCURRENCY = int(os.getenv("HTTP_EXPECTED_CONCURRENCY", "50"))
+HTTP_POOL_MAX_CONNECTIONS = int(
+    os.getenv("HTTP_POOL_MAX_CONNECTIONS", str(HTTP_EXPECTED_CONCURRENCY * 2))
+)
+HTTP_POOL_MAX_KEEPALIVE = int(
+    os.getenv("HTTP_POOL_MAX_KEEPALIVE", str(HTTP_EXPECTED_CONCURRENCY))
+)
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "90"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+# Reasoning models can think for a while before the first byte
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "600"))
+HTTP2_ENABLED = os.getenv("HTTP2", "true").lower() == "true" and _H2_AVAILABLE
+
+_http_client: httpx.AsyncClient | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide pooled AsyncClient (created on first use)."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=HTTP2_ENABLED,
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                HTTP_READ_TIMEOUT,
+                connect=HTTP_CONNECT_TIMEOUT,
+                pool=HTTP_CONNECT_TIMEOUT,
+            ),
+            follow_redirects=True,
+        )
+        logger.info(
+            "[HTTP Pool] Created shared client (max_connections=%s, keepalive=%s, http2=%s)",
+            HTTP_POOL_MAX_CONNECTIONS, HTTP_POOL_MAX_KEEPALIVE, HTTP2_ENABLED,
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _pool_connections() -> list[Any]:
+    """httpcore connections behind the shared client (internal API, read-only)."""
+    if _http_client is None:
+        return []
+    pool = getattr(getattr(_http_client, "_transport", None), "_pool", None)
+    return list(getattr(pool, "connections", []) or [])
+
+
+def _pool_queued_requests() -> float:
+    if _http_client is None:
+        return 0.0
+    pool = getattr(getattr(_http_client, "_transport", None), "_pool", None)
+    requests = getattr(pool, "_requests", []) or []
+    return float(sum(1 for request in requests if getattr(request, "connection", None) is None))
+
+
+# 📊 Pool utilization (computed at scrape time)
+REGISTRY.gauge(
+    "jason_http_pool_connections",
+    "Open upstream connections in the shared pool.",
+    callback=lambda: len(_pool_connections()),
+)
+REGISTRY.gauge(
+    "jason_http_pool_connections_idle",
+    "Idle keep-alive connections in the shared pool.",
+    callback=lambda: sum(1 for conn in _pool_connections() if conn.is_idle()),
+)
+REGISTRY.gauge(
+    "jason_http_pool_requests_queued",
+    "Requests waiting for a free connection in the shared pool.",
+    callback=_pool_queued_requests,
+)
+REGISTRY.gauge(
+    "jason_http_pool_max_connections",
+    "Configured connection limit of the shared pool.",
+    callback=lambda: HTTP_POOL_MAX_CONNECTIONS,
+)
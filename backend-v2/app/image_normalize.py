@@ -0,0 +1,266 @@
+"""
+Image normalization before vision input.
+
+Uploaded images used to be base64-encoded at full resolution, so a 12MP phone
+photo became several MB of request body on every turn that includes it. The
+API scales images down before the model sees them anyway (fit in 2048x2048,
+then shortest side 768 for high detail), so the extra pixels only cost upload
+time and, past a point, tokens.
+
+Each image attachment is normalized once (cached on the attachment):
+- EXIF orientation applied, then all metadata dropped
+- resized to fit IMAGE_MAX_LONG_SIDE / IMAGE_MAX_SHORT_SIDE
+- re-encoded as WebP (default) or JPEG at IMAGE_QUALITY
+The original is kept if the result wouldn't be smaller, and animated images
+are passed through untouched.
+
+Savings are reported as bytes and estimated vision tokens (tile formula:
+85 + 170 per 512px tile after the API's own scaling), original vs sent.
+
+Needs Pillow; without it images are sent as-is.
+
+The normalized image is then uploaded once to OpenAI files (purpose "vision")
+and referenced by `file_id` in the message, instead of embedding a base64 data
+URL that is resent - and stored in conversation history - on every later turn.
+If the upload fails the data URL is used as before. Uploaded files expire on
+their own after IMAGE_FILE_TTL_SECONDS; an image sent again after that is
+re-uploaded instead of referencing the dead file id.
+
+Environment:
+- IMAGE_NORMALIZE_ENABLED: "true" (default) / "false"
+- IMAGE_MAX_LONG_SIDE: default 1536
+- IMAGE_MAX_SHORT_SIDE: default 768
+- IMAGE_FORMAT: "webp" (default) or "jpeg"
+- IMAGE_QUALITY: encoder quality (default 80)
+- IMAGE_FILE_REFS_ENABLED: "true" (default) / "false" - "false" always inlines data URLs
+- IMAGE_FILE_TTL_SECONDS: expiry of uploaded image files (default 604800 = 7 days, 0 = never)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import io
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from .metrics import REGISTRY
+from .openai_client import get_openai_client
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional dependency - images are sent as-is without it
+    Image = None  # type: ignore[assignment]
+    ImageOps = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+IMAGE_NORMALIZE_ENABLED = os.getenv("IMAGE_NORMALIZE_ENABLED", "true").lower() == "true"
+IMAGE_MAX_LONG_SIDE = int(os.getenv("IMAGE_MAX_LONG_SIDE", "1536"))
+IMAGE_MAX_SHORT_SIDE = int(os.getenv("IMAGE_MAX_SHORT_SIDE", "768"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "webp").lower()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+IMAGE_FILE_REFS_ENABLED = os.getenv("IMAGE_FILE_REFS_ENABLED", "true").lower() == "true"
+IMAGE_FILE_TTL_SECONDS = int(os.getenv("IMAGE_FILE_TTL_SECONDS", "604800"))
+
+IMAGE_BYTES_TOTAL = REGISTRY.counter(
+    "jason_image_bytes_total",
+    "Image attachment bytes before (original) and after (sent) normalization.",
+    ("stage",),
+)
+IMAGE_TOKENS_TOTAL = REGISTRY.counter(
+    "jason_image_tokens_total",
+    "Estimated vision input tokens for image attachments, original vs sent.",
+    ("stage",),
+)
+IMAGE_NORMALIZE_SECONDS = REGISTRY.histogram(
+    "jason_image_normalize_seconds",
+    "Time to normalize one image attachment.",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+IMAGE_NORMALIZE_TOTAL = REGISTRY.counter(
+    "jason_image_normalize_total",
+    "Image normalization outcomes (normalized / kept_original / skipped / error).",
+    ("outcome",),
+)
+IMAGE_FILE_REFS_TOTAL = REGISTRY.counter(
+    "jason_image_file_refs_total",
+    "How image attachments were referenced (uploaded / reused file id, or data_url fallback).",
+    ("outcome",),
+)
+
+# file id -> upload time, for telling whether a reference in history still resolves.
+# Insertion order is upload order, so expired ids (and past the cap, the oldest)
+# are pruned from the front
+_uploaded_files: dict[str, float] = {}
+_UPLOADED_FILES_MAX = 10_000
+
+if Image is None and IMAGE_NORMALIZE_ENABLED:
+    logger.info("[Images] Pillow not installed; image attachments are sent unmodified")
+
+
+@dataclass(frozen=True)
+class NormalizedImage:
+    data: bytes
+    mime_type: str
+    width: int | None = None
+    height: int | None = None
+    original_bytes: int = 0
+    original_tokens: int = 0
+    tokens: int = 0
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Vision tokens for a high-detail image, after the API's own scaling."""
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def _target_size(width: int, height: int) -> tuple[int, int]:
+    scale = min(
+        1.0,
+        IMAGE_MAX_LONG_SIDE / max(width, height),
+        IMAGE_MAX_SHORT_SIDE / min(width, height),
+    )
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def normalize_image(data: bytes, mime_type: str) -> NormalizedImage:
+    """Resize / strip / recompress one image (CPU-bound - run in a thread)."""
+    if Image is None or not IMAGE_NORMALIZE_ENABLED:
+        IMAGE_NORMALIZE_TOTAL.inc(outcome="skipped")
+        return NormalizedImage(data, mime_type, original_bytes=len(data))
+
+    with IMAGE_NORMALIZE_SECONDS.time():
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                original_tokens = estimate_image_tokens(*image.size)
+                if getattr(image, "is_animated", False):
+                    IMAGE_NORMALIZE_TOTAL.inc(outcome="skipped")
+                    return NormalizedImage(
+                        data, mime_type, *image.size, len(data), original_tokens, original_tokens
+                    )
+                image = ImageOps.exif_transpose(image)
+                size = _target_size(*image.size)
+                if size != image.size:
+                    image = image.resize(size, Image.Resampling.LANCZOS)
+                has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+                if IMAGE_FORMAT == "jpeg":
+                    if has_alpha:
+                        background = Image.new("RGB", image.size, (255, 255, 255))
+                        background.paste(image.convert("RGBA"), mask=image.convert("RGBA").split()[-1])
+                        image = background
+                    out_format, out_mime = "JPEG", "image/jpeg"
+                    image = image.convert("RGB")
+                else:
+                    out_format, out_mime = "WEBP", "image/webp"
+                    image = image.convert("RGBA" if has_alpha else "RGB")
+                buffer = io.BytesIO()
+                # No exif/icc arguments: the re-encoded file carries no metadata
+                image.save(buffer, format=out_format, quality=IMAGE_QUALITY, optimize=True)
+                width, height = image.size
+        except Exception as e:
+            IMAGE_NORMALIZE_TOTAL.inc(outcome="error")
+            logger.warning("[Images] Could not normalize image (%s), sending original: %s", mime_type, e)
+            return NormalizedImage(data, mime_type, original_bytes=len(data))
+
+    tokens = estimate_image_tokens(width, height)
+    if buffer.tell() >= len(data) and tokens >= original_tokens:
+        IMAGE_NORMALIZE_TOTAL.inc(outcome="kept_original")
+        return NormalizedImage(data, mime_type, width, height, len(data), original_tokens, original_tokens)
+    IMAGE_NORMALIZE_TOTAL.inc(outcome="normalized")
+    return NormalizedImage(buffer.getvalue(), out_mime, width, height, len(data), original_tokens, tokens)
+
+
+async def normalized_image(attachment_data: dict[str, Any]) -> NormalizedImage:
+    """The attachment's normalized image, computed once and cached on the attachment."""
+    cached = attachment_data.get("normalized")
+    if cached is not None:
+        return cached
+    result = await asyncio.to_thread(normalize_image, attachment_data["data"], attachment_data["mime_type"])
+    attachment_data["normalized"] = result
+    IMAGE_BYTES_TOTAL.inc(result.original_bytes, stage="original")
+    IMAGE_BYTES_TOTAL.inc(len(result.data), stage="sent")
+    IMAGE_TOKENS_TOTAL.inc(result.original_tokens, stage="original")
+    IMAGE_TOKENS_TOTAL.inc(result.tokens, stage="sent")
+    if result.data is not attachment_data["data"]:
+        logger.info(
+            "[Images] %s: %s -> %s bytes, ~%s -> ~%s tokens (%sx%s %s)",
+            attachment_data.get("name"), result.original_bytes, len(result.data),
+            result.original_tokens, result.tokens, result.width, result.height, result.mime_type,
+        )
+    return result
+
+
+async def _upload_image_file(attachment_data: dict[str, Any], image: NormalizedImage) -> str | None:
+    """Upload the image for vision input, returning its file id (None on failure)."""
+    extension = image.mime_type.split("/")[-1]
+    name = os.path.splitext(attachment_data.get("name") or "image")[0]
+    kwargs: dict[str, Any] = {}
+    if IMAGE_FILE_TTL_SECONDS > 0:
+        kwargs["expires_after"] = {"anchor": "created_at", "seconds": IMAGE_FILE_TTL_SECONDS}
+    try:
+        uploaded = await get_openai_client().files.create(
+            file=(f"{name}.{extension}", image.data, image.mime_type), purpose="vision", **kwargs
+        )
+    except Exception as e:
+        logger.warning("[Images] File upload failed for %s, inlining as data URL: %s", attachment_data.get("name"), e)
+        return None
+    logger.debug("[Images] Uploaded %s as %s", attachment_data.get("name"), uploaded.id)
+    _remember_upload(uploaded.id)
+    return uploaded.id
+
+
+def _usable(uploaded_at: float, now: float) -> bool:
+    # Stop referencing it a little before the API expires it
+    return IMAGE_FILE_TTL_SECONDS <= 0 or now - uploaded_at < IMAGE_FILE_TTL_SECONDS * 0.9
+
+
+def _remember_upload(file_id: str) -> None:
+    now = time.time()
+    while _uploaded_files:
+        oldest_id, uploaded_at = next(iter(_uploaded_files.items()))
+        if _usable(uploaded_at, now) and len(_uploaded_files) < _UPLOADED_FILES_MAX:
+            break
+        del _uploaded_files[oldest_id]
+    _uploaded_files[file_id] = now
+
+
+def image_file_available(file_id: str | None) -> bool:
+    """Whether an image file uploaded by this process can still be referenced."""
+    uploaded_at = _uploaded_files.get(file_id or "")
+    if uploaded_at is None:
+        return False
+    if not _usable(uploaded_at, time.time()):
+        _uploaded_files.pop(file_id, None)
+        return False
+    return True
+
+
+async def image_input(attachment_data: dict[str, Any]) -> dict[str, Any]:
+    """`input_image` content for an image attachment: a file id reference, or a data URL fallback."""
+    image = await normalized_image(attachment_data)
+    if IMAGE_FILE_REFS_ENABLED:
+        file_id = attachment_data.get("openai_file_id")
+        if file_id and not image_file_available(file_id):
+            file_id = None  # expired (or no longer tracked) - upload it again
+        if file_id:
+            IMAGE_FILE_REFS_TOTAL.inc(outcome="reused")
+        else:
+            file_id = await _upload_image_file(attachment_data, image)
+            if file_id:
+                attachment_data["openai_file_id"] = file_id
+                IMAGE_FILE_REFS_TOTAL.inc(outcome="uploaded")
+        if file_id:
+            return {"type": "input_image", "detail": "auto", "file_id": file_id}
+
+    IMAGE_FILE_REFS_TOTAL.inc(outcome="data_url")
+    encoded = base64.b64encode(image.data).decode("utf-8")
+    return {"type": "input_image", "detail": "auto", "image_url": f"data:{image.mime_type};base64,{encoded}"}
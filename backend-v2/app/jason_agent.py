@@ -1,17 +1,26 @@
 from __future__ import annotations
 
 import os
-import requests
 from typing import Any
 
-from agents import Agent, function_tool, RunContextWrapper
+import httpx
+
+from agents import Agent, FunctionTool, function_tool, RunContextWrapper
 from agents.models.openai_responses import FileSearchTool, WebSearchTool
 from chatkit.agents import AgentContext
 
-JASON_VECTOR_STORE_ID = os.getenv("JASON_VECTOR_STORE_ID", "vs_68e6b33ec38481919601875ea1e2287c")
+from .http_pool import get_http_client
+from .knowledge_base import JASON_VECTOR_STORE_ID
+from .metrics import TOOL_CALLS_TOTAL, TOOL_DURATION_SECONDS
+from .tracing import span
+from .web_search_cache import WEB_SEARCH_CACHE_ENABLED, cached_web_search
+
 N8N_REEL_TRANSCRIBER_WEBHOOK = os.getenv("N8N_REEL_TRANSCRIBER_WEBHOOK", "")
 N8N_REEL_TRANSCRIBER_API_KEY = os.getenv("N8N_REEL_TRANSCRIBER_API_KEY", "")
 
+# Jason's location, for localized web search results
+WEB_SEARCH_LOCATION = {"type": "approximate", "city": "Miami", "country": "US"}
+
 # ============================================================================
 # UNIFIED GPT-5 AGENT WITH INTELLIGENT ROUTING
 # ============================================================================
@@ -206,22 +215,32 @@ async def transcribe_instagram_reel(
         A dictionary with the transcription result or error message.
     """
     if not N8N_REEL_TRANSCRIBER_WEBHOOK:
+        TOOL_CALLS_TOTAL.inc(tool="transcribe_instagram_reel", outcome="not_configured")
         return {
             "error": "Instagram reel transcriber is not configured. Please set the N8N_REEL_TRANSCRIBER_WEBHOOK environment variable."
         }
     
+    with span("tool.transcribe_instagram_reel"), TOOL_DURATION_SECONDS.time(tool="transcribe_instagram_reel"):
+        result = await _call_reel_transcriber(reel_url)
+    outcome = "ok" if "result" in result else "error"
+    TOOL_CALLS_TOTAL.inc(tool="transcribe_instagram_reel", outcome=outcome)
+    return result
+
+
+async def _call_reel_transcriber(reel_url: str) -> dict[str, str]:
+    """Call the n8n reel transcriber webhook and extract the A/V script."""
     try:
         # Build headers with API key for authentication
         headers = {"Content-Type": "application/json"}
         if N8N_REEL_TRANSCRIBER_API_KEY:
             headers["X-API-Key"] = N8N_REEL_TRANSCRIBER_API_KEY
         
-        # Call the n8n webhook
-        response = requests.post(
+        # Call the n8n webhook (async, on the shared connection pool)
+        response = await get_http_client().post(
             N8N_REEL_TRANSCRIBER_WEBHOOK,
             json={"Reel URL": reel_url},
             headers=headers,
-            timeout=120  # 2 minute timeout (scraping + AI analysis takes time)
+            timeout=httpx.Timeout(120, connect=10)  # 2 minute timeout (scraping + AI analysis takes time)
         )
         response.raise_for_status()
         
@@ -250,16 +269,50 @@ async def transcribe_instagram_reel(
         # Fallback if structure is different
         return {"error": f"Unexpected response format from workflow: {str(result)[:500]}"}
     
-    except requests.Timeout:
+    except httpx.TimeoutException:
         return {"error": "The reel transcription is taking longer than expected. This usually happens with very long videos or network issues. Please try again."}
     
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         return {"error": f"Error transcribing reel: {str(e)}"}
     
     except Exception as e:
         return {"error": f"Unexpected error: {str(e)}"}
 
 
+# ============================================================================
+# CUSTOM TOOL: CACHED WEB SEARCH (WEB_SEARCH_CACHE_ENABLED)
+# ============================================================================
+# Same name and purpose as the hosted web_search tool, but results are cached
+# for a few minutes so bursts of identical trend questions share one search.
+# See web_search_cache.py.
+# ============================================================================
+
+@function_tool(
+    name_override="web_search",
+    description_override=(
+        "Search the web for current trends, real-time data and recent information. "
+        "Returns a summary of the results with sources, plus `age_seconds`: results may be "
+        "served from a cache a few minutes old - mention timing if freshness matters."
+    ),
+)
+async def web_search(ctx: RunContextWrapper[AgentContext], query: str) -> dict[str, Any]:
+    """
+    Search the web (results cached briefly per query and location).
+
+    Args:
+        ctx: The agent context
+        query: What to search for
+    """
+    try:
+        with span("tool.web_search"), TOOL_DURATION_SECONDS.time(tool="web_search"):
+            result = await cached_web_search(query, WEB_SEARCH_LOCATION)
+    except Exception as e:
+        TOOL_CALLS_TOTAL.inc(tool="web_search", outcome="error")
+        return {"error": f"Web search failed: {str(e)}"}
+    TOOL_CALLS_TOTAL.inc(tool="web_search", outcome="cache_hit" if result["cached"] else "ok")
+    return result
+
+
 def build_file_search_tool() -> FileSearchTool:
     """
     Enhanced file search optimized for speed.
@@ -274,16 +327,15 @@ def build_file_search_tool() -> FileSearchTool:
     )
 
 
-def build_web_search_tool() -> WebSearchTool:
+def build_web_search_tool() -> WebSearchTool | FunctionTool:
     """
     Enhanced web search with location awareness for better results.
+    With WEB_SEARCH_CACHE_ENABLED, the cached function tool above instead.
     """
+    if WEB_SEARCH_CACHE_ENABLED:
+        return web_search
     return WebSearchTool(
-        user_location={                # ✨ Better localization
-            "type": "approximate",
-            "city": "Miami",           # Jason's location
-            "country": "US"
-        }
+        user_location=WEB_SEARCH_LOCATION,  # type: ignore[arg-type]  # ✨ Better localization
     )
 
 
@@ -291,11 +343,11 @@ def build_web_search_tool() -> WebSearchTool:
 # UNIFIED GPT-5 AGENT (SIMPLE, FAST, EFFECTIVE)
 # ============================================================================
 # Single agent approach is faster and simpler than multi-agent routing.
-# Key optimization: reasoning_effort is set in main.py (RunConfig)
+# Key optimization: reasoning effort is picked per message (effort_router.py)
 #
 # How it works:
 # - GPT-5 handles ALL queries (simple and complex)
-# - reasoning_effort="medium" enables thinking mode when needed
+# - A local router picks minimal/low/medium effort per message
 # - Instructions guide adaptive response depth
 # - Tools available when needed
 #
@@ -315,7 +367,7 @@ jason_agent = Agent[AgentContext](
         build_web_search_tool(),
         transcribe_instagram_reel,  # type: ignore[arg-type]
     ],
-    # Note: reasoning_effort is set in main.py via RunConfig
-    # This enables GPT-5's thinking mode for complex queries
+    # Note: reasoning effort is set per message via RunConfig (effort_router.py)
+    # so greetings stay fast and strategy questions get deeper thinking
 )
 
@@ -0,0 +1,316 @@
+"""
+Bulk knowledge base upload.
+
+Loading a course's worth of templates used to mean one `/api/files/upload`
+call per file, each uploading and then attaching to the vector store before
+the next began. `POST /api/files/upload-bulk` takes many files at once:
+
+1. every file is validated and hashed; duplicates (within the request or
+   already in the knowledge base, see kb_manifest.py) aren't uploaded
+2. the rest are uploaded to OpenAI concurrently, at most
+   KB_BULK_UPLOAD_CONCURRENCY at a time
+3. all new files are attached with a single vector store file batch
+4. with ?wait=true, the batch is polled (with backoff, for at most
+   KB_BULK_INDEX_WAIT_SECONDS) until indexing finishes
+
+Progress is streamed as NDJSON events: one "file" event per file as it
+finishes (uploaded / duplicate / rejected / error), "batch" and "indexing"
+events, and a final "done" event with totals and upload throughput.
+
+A request holds every file in memory, so it's capped at KB_BULK_MAX_FILES
+files and KB_BULK_MAX_BYTES in total. `BulkUploadSizeLimit` refuses a request
+whose Content-Length is already over the limit before the form is parsed;
+the endpoint checks the parsed file sizes for requests sent without one. If the client goes away mid-upload,
+the remaining uploads are cancelled and files that aren't in a batch yet are
+deleted from OpenAI.
+
+Environment:
+- KB_BULK_UPLOAD_CONCURRENCY: concurrent uploads to OpenAI (default 4)
+- KB_BULK_INDEX_WAIT_SECONDS: longest ?wait=true polls the batch (default 120)
+- KB_BULK_MAX_FILES: most files per request (default 100)
+- KB_BULK_MAX_BYTES: most bytes per request, all files together (default 256MB)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .kb_manifest import KB_DEDUP_ENABLED, content_hash, kb_manifest
+from .kb_mirror import kb_mirror
+from .knowledge_base import (
+    JASON_VECTOR_STORE_ID,
+    KB_ALLOWED_EXTENSIONS,
+    KB_MAX_FILE_BYTES,
+    mark_knowledge_base_changed,
+)
+from .metrics import REGISTRY
+from .openai_client import get_openai_client
+
+logger = logging.getLogger(__name__)
+
+KB_BULK_UPLOAD_CONCURRENCY = int(os.getenv("KB_BULK_UPLOAD_CONCURRENCY", "4"))
+KB_BULK_INDEX_WAIT_SECONDS = float(os.getenv("KB_BULK_INDEX_WAIT_SECONDS", "120"))
+KB_BULK_MAX_FILES = int(os.getenv("KB_BULK_MAX_FILES", "100"))
+KB_BULK_MAX_BYTES = int(os.getenv("KB_BULK_MAX_BYTES", str(256 * 1024 * 1024)))
+
+BULK_UPLOAD_PATH = "/api/files/upload-bulk"
+# Room for multipart boundaries and part headers on top of the file bytes
+_MULTIPART_OVERHEAD_BYTES = 1024
+
+KB_BULK_FILES_TOTAL = REGISTRY.counter(
+    "jason_kb_bulk_upload_files_total",
+    "Files in bulk knowledge base uploads, by outcome.",
+    ("status",),
+)
+KB_BULK_BYTES_TOTAL = REGISTRY.counter(
+    "jason_kb_bulk_upload_bytes_total",
+    "Bytes uploaded to OpenAI by bulk knowledge base uploads.",
+)
+KB_BULK_UPLOAD_SECONDS = REGISTRY.histogram(
+    "jason_kb_bulk_upload_seconds",
+    "Duration of a bulk upload, from the first file to the vector store batch being created.",
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0),
+)
+
+
+class BulkUploadSizeLimit:
+    """ASGI middleware: 413 for a bulk upload whose Content-Length is over the limit, before it's read."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == BULK_UPLOAD_PATH:
+            length = Headers(scope=scope).get("content-length", "")
+            limit = KB_BULK_MAX_BYTES + KB_BULK_MAX_FILES * _MULTIPART_OVERHEAD_BYTES
+            if length.isdigit() and int(length) > limit:
+                response = JSONResponse(
+                    {"detail": f"Bulk upload is {int(length) / 1_048_576:.1f}MB; at most {KB_BULK_MAX_BYTES / 1_048_576:.1f}MB per request"},
+                    status_code=413,
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+@dataclass
+class _Candidate:
+    filename: str
+    content: bytes
+    digest: str
+    duplicate_of: _Candidate | None = None
+    file_id: str | None = None
+
+
+def _file_event(candidate: _Candidate, status: str, progress: dict[str, int], **extra: Any) -> dict[str, Any]:
+    progress["done"] += 1
+    progress[status] += 1
+    KB_BULK_FILES_TOTAL.inc(status=status)
+    return {
+        "event": "file",
+        "filename": candidate.filename,
+        "status": status,
+        "bytes": len(candidate.content),
+        "done": progress["done"],
+        "total": progress["total"],
+        **extra,
+    }
+
+
+async def _wait_for_batch(batch_id: str) -> AsyncIterator[dict[str, Any]]:
+    client = get_openai_client()
+    start = time.perf_counter()
+    delay = 0.5
+    last: tuple[int, ...] | None = None
+    while True:
+        batch = await client.vector_stores.file_batches.retrieve(batch_id, vector_store_id=JASON_VECTOR_STORE_ID)
+        counts = batch.file_counts
+        current = (counts.completed, counts.failed, counts.in_progress)
+        if current != last or batch.status != "in_progress":
+            last = current
+            yield {
+                "event": "indexing",
+                "status": batch.status,
+                "completed": counts.completed,
+                "failed": counts.failed,
+                "in_progress": counts.in_progress,
+                "total": counts.total,
+                "seconds": round(time.perf_counter() - start, 2),
+            }
+        remaining = KB_BULK_INDEX_WAIT_SECONDS - (time.perf_counter() - start)
+        if batch.status != "in_progress" or remaining <= 0:
+            return
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * 2, 5.0)
+
+
+async def _record_batch(uploaded: list[_Candidate], status: str) -> None:
+    if KB_DEDUP_ENABLED:
+        for candidate in uploaded:
+            await kb_manifest.record(candidate.file_id, candidate.digest, candidate.filename, len(candidate.content), status)
+    mark_knowledge_base_changed(f"bulk upload of {len(uploaded)} files")
+    # 📚 Keep the local BM25 mirror in step (text files now, documents once indexed)
+    for candidate in uploaded:
+        await kb_mirror.add_upload(candidate.file_id, candidate.filename, candidate.content)
+
+
+async def _discard_uploads(tasks: list[asyncio.Task[Any]], candidates: list[_Candidate]) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    file_ids = [candidate.file_id for candidate in candidates if candidate.file_id]
+    if file_ids:
+        logger.warning("[KB Bulk Upload] Stopped before the vector store batch, removing %s uploaded files", len(file_ids))
+        client = get_openai_client()
+        await asyncio.gather(*(client.files.delete(file_id) for file_id in file_ids), return_exceptions=True)
+
+
+async def bulk_upload(files: list[tuple[str, bytes]], wait: bool = False) -> AsyncIterator[dict[str, Any]]:
+    """Upload files to the knowledge base, yielding progress events (see module docstring)."""
+    start = time.perf_counter()
+    client = get_openai_client()
+    progress = {"done": 0, "total": len(files), "uploaded": 0, "duplicate": 0, "rejected": 0, "error": 0}
+    yield {"event": "start", "total": len(files), "concurrency": KB_BULK_UPLOAD_CONCURRENCY}
+
+    # 1. Validate and hash; duplicates within the request point at their first copy
+    candidates: list[_Candidate] = []
+    first_by_digest: dict[str, _Candidate] = {}
+    for index, (filename, content) in enumerate(files):
+        filename = filename or f"upload-{index + 1}"
+        ext = os.path.splitext(filename)[1].lower()
+        if ext not in KB_ALLOWED_EXTENSIONS or len(content) > KB_MAX_FILE_BYTES:
+            detail = f"Unsupported file type: {ext}" if ext not in KB_ALLOWED_EXTENSIONS else "File size exceeds 512MB limit"
+            yield _file_event(_Candidate(filename, content, ""), "rejected", progress, detail=detail)
+            continue
+        digest = await content_hash(content) if KB_DEDUP_ENABLED else f"#{index}"
+        candidate = _Candidate(filename, content, digest, duplicate_of=first_by_digest.get(digest))
+        first_by_digest.setdefault(digest, candidate)
+        candidates.append(candidate)
+    unique = [candidate for candidate in candidates if candidate.duplicate_of is None]
+
+    uploaded: list[_Candidate] = []
+    uploaded_bytes = 0
+    batch = None
+    reserved: list[str] = []
+    to_upload: list[_Candidate] = []
+    tasks: list[asyncio.Task[Any]] = []
+    settled = False  # every new upload is in a batch or deleted again
+    try:
+        # 2. Reserve each hash (sorted, so bulk uploads sharing files can't wait on each other);
+        #    content already in the knowledge base is reported straight away
+        for candidate in sorted(unique, key=lambda candidate: candidate.digest):
+            existing = await kb_manifest.reserve(candidate.digest) if KB_DEDUP_ENABLED else None
+            if existing is None:
+                reserved.append(candidate.digest)
+                to_upload.append(candidate)
+                continue
+            candidate.file_id = existing["file_id"]
+            yield _file_event(
+                candidate, "duplicate", progress, file_id=existing["file_id"], existing_filename=existing["filename"]
+            )
+
+        # 3. Upload the rest, concurrently
+        semaphore = asyncio.Semaphore(KB_BULK_UPLOAD_CONCURRENCY)
+
+        async def upload(candidate: _Candidate) -> tuple[_Candidate, str, dict[str, Any]]:
+            async with semaphore:
+                file_start = time.perf_counter()
+                try:
+                    openai_file = await client.files.create(file=(candidate.filename, candidate.content), purpose="assistants")
+                except Exception as e:
+                    logger.error("[KB Bulk Upload] %s failed: %s", candidate.filename, e)
+                    return candidate, "error", {"detail": str(e)}
+            candidate.file_id = openai_file.id
+            return candidate, "uploaded", {"file_id": openai_file.id, "seconds": round(time.perf_counter() - file_start, 3)}
+
+        tasks = [asyncio.create_task(upload(candidate)) for candidate in to_upload]
+        for finished in asyncio.as_completed(tasks):
+            candidate, status, extra = await finished
+            if status == "uploaded":
+                uploaded.append(candidate)
+                uploaded_bytes += len(candidate.content)
+            yield _file_event(candidate, status, progress, **extra)
+        upload_seconds = time.perf_counter() - start
+
+        for candidate in candidates:
+            if candidate.duplicate_of is not None:
+                original = candidate.duplicate_of
+                if original.file_id:
+                    extra = {"file_id": original.file_id, "existing_filename": original.filename}
+                    yield _file_event(candidate, "duplicate", progress, **extra)
+                else:
+                    yield _file_event(candidate, "error", progress, detail=f"Same content as {original.filename}, which failed")
+
+        # 4. One vector store batch for every new file
+        if uploaded:
+            try:
+                batch = await client.vector_stores.file_batches.create(
+                    JASON_VECTOR_STORE_ID, file_ids=[candidate.file_id for candidate in uploaded]
+                )
+            except Exception as e:
+                logger.error("[KB Bulk Upload] Vector store batch failed, removing uploaded files: %s", e)
+                await asyncio.gather(
+                    *(client.files.delete(candidate.file_id) for candidate in uploaded), return_exceptions=True
+                )
+                settled = True
+                yield {"event": "error", "detail": f"Failed to add files to the vector store: {e}"}
+                uploaded = []
+                uploaded_bytes = 0
+            else:
+                settled = True
+                # Recording finishes even if the client disconnects now (it releases these hashes)
+                recording = {candidate.digest for candidate in uploaded}
+                reserved = [digest for digest in reserved if digest not in recording]
+                await asyncio.shield(_record_batch(uploaded, batch.status))
+                yield {
+                    "event": "batch",
+                    "batch_id": batch.id,
+                    "status": batch.status,
+                    "files": len(uploaded),
+                }
+        settled = True
+    finally:
+        # 🧹 Client gone (or an error) before the batch: don't leave unreferenced files behind
+        if not settled:
+            await asyncio.shield(_discard_uploads(tasks, to_upload))
+        # Hashes that weren't recorded (failed uploads) are free to upload again
+        for digest in reserved:
+            kb_manifest.release(digest)
+
+    if uploaded:
+        KB_BULK_BYTES_TOTAL.inc(uploaded_bytes)
+        KB_BULK_UPLOAD_SECONDS.observe(time.perf_counter() - start)
+
+    # 5. Optionally follow indexing
+    if wait and batch is not None:
+        async for event in _wait_for_batch(batch.id):
+            yield event
+
+    seconds = time.perf_counter() - start
+    logger.info(
+        "[KB Bulk Upload] %s of %s files uploaded (%.1f MB in %.1fs)",
+        len(uploaded), len(files), uploaded_bytes / 1_048_576, upload_seconds,
+    )
+    yield {
+        "event": "done",
+        "total": len(files),
+        "uploaded": len(uploaded),
+        "duplicate": progress["duplicate"],
+        "rejected": progress["rejected"],
+        "error": progress["error"] + progress["uploaded"] - len(uploaded),
+        "bytes": uploaded_bytes,
+        "upload_seconds": round(upload_seconds, 3),
+        "seconds": round(seconds, 3),
+        "mb_per_second": round(uploaded_bytes / 1_048_576 / upload_seconds, 2) if upload_seconds > 0 else 0.0,
+        "files_per_second": round(len(uploaded) / upload_seconds, 2) if upload_seconds > 0 else 0.0,
+        "batch_id": batch.id if batch is not None and uploaded else None,
+    }
@@ -0,0 +1,215 @@
+"""
+Content-hash manifest for knowledge base uploads.
+
+Re-dropping the same template into `/api/files/upload` used to upload and
+index it again, duplicating its chunks in the vector store (slower, noisier
+file_search). Every upload is now hashed (SHA-256) and recorded here with
+its file id; uploading identical content again returns the existing file
+straight away, no matter what it's called. Before an entry is reused it's
+checked against the vector store, so files deleted elsewhere (dashboard,
+another process) are uploaded again rather than pointed at.
+
+`files_named` finds earlier versions of a filename for `?replace=true`
+uploads. It lists the vector store, so files uploaded before the manifest
+existed are found too.
+
+An upload reserves its hash before going to OpenAI; a concurrent upload of
+the same content waits for that one and gets its file instead of racing it.
+Only identical content waits - nothing is held across another upload's
+network calls.
+
+Environment:
+- KB_DEDUP_ENABLED: "true" (default) / "false"
+- KB_MANIFEST_PATH: where the manifest is kept (default "kb_manifest.json"
+  next to the app package)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any
+
+from .knowledge_base import JASON_VECTOR_STORE_ID
+from .metrics import REGISTRY
+from .openai_client import get_openai_client
+
+logger = logging.getLogger(__name__)
+
+KB_DEDUP_ENABLED = os.getenv("KB_DEDUP_ENABLED", "true").lower() == "true"
+KB_MANIFEST_PATH = os.getenv(
+    "KB_MANIFEST_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "kb_manifest.json")
+)
+# Concurrent files.retrieve calls when looking up filenames for ?replace=true
+_LOOKUP_CONCURRENCY = 8
+
+KB_UPLOAD_DEDUP_TOTAL = REGISTRY.counter(
+    "jason_kb_upload_dedup_total",
+    "Knowledge base uploads by dedup result (new / duplicate / stale manifest entry).",
+    ("result",),
+)
+KB_REPLACED_FILES_TOTAL = REGISTRY.counter(
+    "jason_kb_replaced_files_total",
+    "Older versions of a filename removed by ?replace=true uploads.",
+)
+
+
+async def content_hash(content: bytes) -> str:
+    """SHA-256 of an upload (in a thread - uploads can be hundreds of MB)."""
+    return (await asyncio.to_thread(hashlib.sha256, content)).hexdigest()
+
+
+class KnowledgeBaseManifest:
+    """file id -> {sha256, filename, bytes, uploaded_at}, persisted as JSON."""
+
+    def __init__(self, path: str = KB_MANIFEST_PATH) -> None:
+        self.path = path
+        self.files: dict[str, dict[str, Any]] = {}
+        self._by_hash: dict[str, str] = {}
+        # hash -> in-flight upload of that content (resolves to its entry, or None if it failed)
+        self._pending: dict[str, asyncio.Future[dict[str, Any] | None]] = {}
+        # filenames of vector store files uploaded before the manifest existed
+        self._remote_names: dict[str, str] = {}
+        self._save_lock = asyncio.Lock()
+        self._dirty = False
+        self._loaded = False
+
+    def _load(self) -> None:
+        self._loaded = True
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("[KB Manifest] Could not read %s, starting empty: %s", self.path, e)
+            return
+        self._by_hash = {entry["sha256"]: file_id for file_id, entry in self.files.items()}
+        logger.info("[KB Manifest] Loaded %s file hashes", len(self.files))
+
+    def _write(self, files: dict[str, dict[str, Any]]) -> None:
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"files": files}, f)
+        os.replace(tmp, self.path)
+
+    async def _save(self) -> None:
+        """Persist off the event loop; changes made while a write is running share the next one."""
+        self._dirty = True
+        async with self._save_lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            await asyncio.to_thread(self._write, dict(self.files))
+
+    async def reserve(self, digest: str) -> dict[str, Any] | None:
+        """The knowledge base file with this content, or None once it's reserved for the caller.
+
+        If another upload of the same content is in flight, this waits for it
+        and returns its file. After None, the caller uploads and then calls
+        `record` - or `release` if the upload fails.
+        """
+        if not self._loaded:
+            self._load()
+        while (pending := self._pending.get(digest)) is not None:
+            entry = await asyncio.shield(pending)
+            if entry is not None:
+                KB_UPLOAD_DEDUP_TOTAL.inc(result="duplicate")
+                return entry
+        self._pending[digest] = asyncio.get_running_loop().create_future()
+        try:
+            existing = await self.existing_file(digest)
+        except BaseException:
+            self.release(digest)
+            raise
+        if existing is not None:
+            self.release(digest, existing)
+        return existing
+
+    def release(self, digest: str, entry: dict[str, Any] | None = None) -> None:
+        """End a reservation, handing `entry` (or None: upload again) to uploads waiting on it."""
+        pending = self._pending.pop(digest, None)
+        if pending is not None and not pending.done():
+            pending.set_result(entry)
+
+    async def existing_file(self, digest: str) -> dict[str, Any] | None:
+        """The knowledge base file with this content, if it's still in the vector store."""
+        from openai import NotFoundError
+
+        if not self._loaded:
+            self._load()
+        file_id = self._by_hash.get(digest)
+        if file_id is None:
+            return None
+        try:
+            vs_file = await get_openai_client().vector_stores.files.retrieve(
+                file_id, vector_store_id=JASON_VECTOR_STORE_ID
+            )
+            status = vs_file.status
+        except NotFoundError:
+            # Gone (deleted outside this process) - forget it and upload again
+            logger.info("[KB Manifest] %s no longer in the vector store", file_id)
+            KB_UPLOAD_DEDUP_TOTAL.inc(result="stale")
+            await self.forget(file_id)
+            return None
+        except Exception as e:
+            # Timeouts / 5xx / 429 say nothing about the file - trust the manifest
+            logger.warning("[KB Manifest] Could not verify %s, assuming it's still there: %s", file_id, e)
+            status = "unknown"
+        KB_UPLOAD_DEDUP_TOTAL.inc(result="duplicate")
+        return {"file_id": file_id, "status": status, **self.files[file_id]}
+
+    async def record(self, file_id: str, digest: str, filename: str, size: int, status: str = "in_progress") -> None:
+        """Add an uploaded file (ending the caller's reservation of its hash)."""
+        if not self._loaded:
+            self._load()
+        KB_UPLOAD_DEDUP_TOTAL.inc(result="new")
+        self.files[file_id] = {"sha256": digest, "filename": filename, "bytes": size, "uploaded_at": time.time()}
+        self._by_hash[digest] = file_id
+        self.release(digest, {"file_id": file_id, "status": status, **self.files[file_id]})
+        await self._save()
+
+    async def forget(self, file_id: str) -> None:
+        if not self._loaded:
+            self._load()
+        self._remote_names.pop(file_id, None)
+        entry = self.files.pop(file_id, None)
+        if entry is None:
+            return
+        if self._by_hash.get(entry["sha256"]) == file_id:
+            del self._by_hash[entry["sha256"]]
+        await self._save()
+
+    async def files_named(self, filename: str) -> list[str]:
+        """Ids of knowledge base files with this filename (manifest and vector store)."""
+        if not self._loaded:
+            self._load()
+        client = get_openai_client()
+        named = {file_id for file_id, entry in self.files.items() if entry["filename"] == filename}
+        unknown = [
+            vs_file.id
+            async for vs_file in client.vector_stores.files.list(vector_store_id=JASON_VECTOR_STORE_ID, limit=100)
+            if vs_file.id not in self.files
+        ]
+        semaphore = asyncio.Semaphore(_LOOKUP_CONCURRENCY)
+
+        async def name_of(file_id: str) -> str | None:
+            if file_id not in self._remote_names:
+                async with semaphore:
+                    try:
+                        self._remote_names[file_id] = (await client.files.retrieve(file_id)).filename
+                    except Exception as e:
+                        logger.warning("[KB Manifest] Could not look up %s: %s", file_id, e)
+                        return None
+            return self._remote_names[file_id]
+
+        names = await asyncio.gather(*(name_of(file_id) for file_id in unknown))
+        named.update(file_id for file_id, name in zip(unknown, names) if name == filename)
+        return sorted(named)
+
+
+kb_manifest = KnowledgeBaseManifest()
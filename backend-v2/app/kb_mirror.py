@@ -0,0 +1,491 @@
+"""
+Local mirror of the knowledge base with a BM25 index.
+
+Every knowledge-base question otherwise pays a hosted `file_search` round
+trip inside the model's tool loop (the model decides to search, the search
+runs, then a second model pass reads the results). With the mirror on, each
+turn's message is scored against a local copy of the vector store's text
+while the rest of the turn is being set up; the top passages are added to
+the model input as a developer message, and when the match is strong enough
+the turn runs without `file_search` at all.
+
+Where the text comes from:
+- `/api/files/upload` extracts text-like files (txt, md, csv, json, code,
+  html, ...) locally straight away
+- other documents (PDF, DOCX, PPTX, XLSX) are mirrored from the vector
+  store's own parsed content once it has finished indexing them
+- at startup, files already in the vector store but missing from the mirror
+  are backfilled the same way, and files removed from it are dropped
+
+The mirror is persisted to KB_MIRROR_PATH so restarts don't refetch it.
+`files` is only changed on the event loop; rebuilding the index and writing
+the file happen in a worker thread on a snapshot, in one background flush
+that picks up every change made meanwhile - a bulk upload of 50 files costs
+one rebuild, not 50.
+
+Confidence: a passage is injected when it covers at least KB_INJECT_COVERAGE
+of the message's query terms; `file_search` is skipped when the best passage
+covers KB_CONFIDENT_COVERAGE of them with a BM25 score of at least
+KB_CONFIDENT_SCORE. `scripts/bench-kb-retrieval.py` measures local retrieval
+latency (and hosted vector store search, for comparison).
+
+Environment:
+- KB_MIRROR_ENABLED: "false" (default) / "true"
+- KB_MIRROR_PATH: where the mirrored text is kept (default "kb_mirror.json"
+  next to the app package)
+- KB_MIRROR_SYNC: "true" (default) backfills from the vector store at startup
+- KB_PREFETCH_PASSAGES: passages injected per turn (default 3)
+- KB_PREFETCH_MAX_CHARS: character budget for injected passages (default 4000)
+- KB_INJECT_COVERAGE: minimum query-term coverage to inject (default 0.5)
+- KB_CONFIDENT_COVERAGE / KB_CONFIDENT_SCORE: skip file_search above these (0.8 / 6.0)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from .knowledge_base import JASON_VECTOR_STORE_ID
+from .metrics import REGISTRY
+from .openai_client import get_openai_client
+
+logger = logging.getLogger(__name__)
+
+KB_MIRROR_ENABLED = os.getenv("KB_MIRROR_ENABLED", "false").lower() == "true"
+KB_MIRROR_PATH = os.getenv(
+    "KB_MIRROR_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "kb_mirror.json")
+)
+KB_MIRROR_SYNC = os.getenv("KB_MIRROR_SYNC", "true").lower() == "true"
+KB_PREFETCH_PASSAGES = int(os.getenv("KB_PREFETCH_PASSAGES", "3"))
+KB_PREFETCH_MAX_CHARS = int(os.getenv("KB_PREFETCH_MAX_CHARS", "4000"))
+KB_INJECT_COVERAGE = float(os.getenv("KB_INJECT_COVERAGE", "0.5"))
+KB_CONFIDENT_COVERAGE = float(os.getenv("KB_CONFIDENT_COVERAGE", "0.8"))
+KB_CONFIDENT_SCORE = float(os.getenv("KB_CONFIDENT_SCORE", "6.0"))
+
+# Extensions whose bytes are the text (decoded locally on upload)
+TEXT_EXTENSIONS = {
+    ".txt", ".md", ".csv", ".json", ".xml", ".html", ".tex",
+    ".c", ".cpp", ".cs", ".css", ".go", ".java", ".js", ".php", ".py", ".rb", ".sh", ".ts",
+}
+
+_PASSAGE_CHARS = 1200
+_BM25_K1 = 1.5
+_BM25_B = 0.75
+# Changes arriving within this many seconds share one index rebuild and save
+_FLUSH_DELAY_SECONDS = 0.25
+# Seconds between vector store status checks while a document is indexing
+_INDEXING_POLL_DELAYS = (1, 2, 4, 8, 15, 30, 30, 60)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_TAG_RE = re.compile(r"<[^>]+>")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "does", "for", "from",
+    "get", "how", "i", "if", "in", "is", "it", "its", "me", "my", "of", "on", "or", "should",
+    "so", "that", "the", "their", "them", "this", "to", "up", "was", "what", "when", "where",
+    "which", "who", "why", "will", "with", "you", "your", "i'm", "it's", "what's", "yo", "bro",
+}
+
+KB_RETRIEVAL_SECONDS = REGISTRY.histogram(
+    "jason_kb_local_retrieval_seconds",
+    "Local BM25 retrieval latency per turn.",
+    ("endpoint",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+KB_RETRIEVALS_TOTAL = REGISTRY.counter(
+    "jason_kb_local_retrievals_total",
+    "Local retrieval outcomes: confident (file_search skipped), injected, weak, empty.",
+    ("endpoint", "outcome"),
+)
+KB_MIRROR_UPDATES_TOTAL = REGISTRY.counter(
+    "jason_kb_mirror_updates_total",
+    "Files added to / removed from the local mirror, by source.",
+    ("source",),
+)
+REGISTRY.gauge(
+    "jason_kb_mirror_files",
+    "Files held in the local knowledge base mirror.",
+    callback=lambda: len(kb_mirror.files),
+)
+REGISTRY.gauge(
+    "jason_kb_mirror_passages",
+    "Passages in the local BM25 index.",
+    callback=lambda: len(kb_mirror.index.passages),
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased word tokens without stopwords, with a naive plural strip."""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def split_passages(text: str, max_chars: int = _PASSAGE_CHARS) -> list[str]:
+    """Pack paragraphs into passages of about max_chars (long paragraphs are cut)."""
+    passages: list[str] = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        while len(paragraph) > max_chars:
+            cut = paragraph.rfind(" ", 0, max_chars)
+            cut = cut if cut > max_chars // 2 else max_chars
+            if current:
+                passages.append(current)
+                current = ""
+            passages.append(paragraph[:cut].strip())
+            paragraph = paragraph[cut:].strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            passages.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        passages.append(current)
+    return passages
+
+
+def extract_passages(filename: str, content: bytes) -> list[str] | None:
+    """`extract_text` split into passages (CPU-bound - run in a thread)."""
+    text = extract_text(filename, content)
+    return None if text is None else split_passages(text)
+
+
+def extract_text(filename: str, content: bytes) -> str | None:
+    """Text of a text-like upload, or None if it needs the vector store's parser."""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in TEXT_EXTENSIONS:
+        return None
+    text = content.decode("utf-8", errors="replace")
+    if ext in (".html", ".xml"):
+        text = _TAG_RE.sub(" ", text)
+    return text
+
+
+@dataclass(frozen=True)
+class Passage:
+    file_id: str
+    filename: str
+    text: str
+
+
+class BM25Index:
+    """Immutable Okapi BM25 index over passages (rebuilt on change)."""
+
+    def __init__(self, passages: list[Passage]) -> None:
+        self.passages = passages
+        self._postings: dict[str, list[tuple[int, int]]] = {}
+        self._lengths: list[int] = []
+        for i, passage in enumerate(passages):
+            counts = Counter(tokenize(f"{passage.filename} {passage.text}"))
+            self._lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self._postings.setdefault(term, []).append((i, tf))
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        n = len(passages)
+        self._idf = {
+            term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def search(self, query: str, k: int) -> list[tuple[Passage, float, float]]:
+        """Top k as (passage, score, fraction of query terms it contains)."""
+        terms = set(tokenize(query))
+        if not terms or not self.passages:
+            return []
+        scores: dict[int, float] = {}
+        matched: dict[int, int] = {}
+        for term in terms:
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self._postings[term]:
+                norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * self._lengths[i] / self._avg_length)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (_BM25_K1 + 1) / (tf + norm)
+                matched[i] = matched.get(i, 0) + 1
+        top = sorted(scores, key=scores.__getitem__, reverse=True)[:k]
+        return [(self.passages[i], scores[i], matched[i] / len(terms)) for i in top]
+
+
+@dataclass
+class Retrieval:
+    """Local retrieval result for one turn."""
+
+    query: str
+    hits: list[tuple[Passage, float, float]]
+    seconds: float
+
+    @property
+    def coverage(self) -> float:
+        return self.hits[0][2] if self.hits else 0.0
+
+    @property
+    def score(self) -> float:
+        return self.hits[0][1] if self.hits else 0.0
+
+    @property
+    def confident(self) -> bool:
+        """Strong enough to answer without file_search."""
+        return (
+            len(set(tokenize(self.query))) >= 2
+            and self.coverage >= KB_CONFIDENT_COVERAGE
+            and self.score >= KB_CONFIDENT_SCORE
+        )
+
+    @property
+    def injectable(self) -> bool:
+        return self.coverage >= KB_INJECT_COVERAGE
+
+    def context_message(self) -> dict[str, Any]:
+        """Developer message carrying the passages, within KB_PREFETCH_MAX_CHARS."""
+        parts: list[str] = []
+        budget = KB_PREFETCH_MAX_CHARS
+        for passage, _, coverage in self.hits:
+            if coverage < KB_INJECT_COVERAGE or budget <= 0:
+                break
+            text = passage.text[:budget]
+            parts.append(f"[{passage.filename}]\n{text}")
+            budget -= len(text)
+        return {
+            "role": "developer",
+            "content": (
+                "Knowledge base excerpts that may answer the user's next message "
+                "(from Jason's own files - use them as you would file_search results):\n\n"
+                + "\n\n---\n\n".join(parts)
+            ),
+        }
+
+    def input_filter(self) -> Callable[[Any], Any]:
+        """`RunConfig.call_model_input_filter` placing the excerpts before the new message."""
+        message = self.context_message()
+
+        def add_excerpts(data: Any) -> Any:
+            model_data = data.model_data
+            items = list(model_data.input)
+            last_user = max(
+                (i for i, item in enumerate(items) if isinstance(item, dict) and item.get("role") == "user"),
+                default=len(items),
+            )
+            items.insert(last_user, message)
+            model_data.input = items
+            return model_data
+
+        return add_excerpts
+
+
+def _build_index(files: dict[str, dict[str, Any]]) -> BM25Index:
+    return BM25Index([
+        Passage(file_id, entry["filename"], text)
+        for file_id, entry in files.items()
+        for text in entry["passages"]
+    ])
+
+
+class KnowledgeBaseMirror:
+    """Extracted knowledge base text by file id, with its BM25 index."""
+
+    def __init__(self, path: str = KB_MIRROR_PATH) -> None:
+        self.path = path
+        self.files: dict[str, dict[str, Any]] = {}
+        self.index = BM25Index([])
+        self._tasks: set[asyncio.Task[None]] = set()
+        self._dirty = False
+        self._flush_task: asyncio.Task[None] | None = None
+
+    # -- persistence / index -------------------------------------------------
+
+    def load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("[KB Mirror] Could not read %s, starting empty: %s", self.path, e)
+            return
+        self.index = _build_index(self.files)
+        logger.info("[KB Mirror] Loaded %s files (%s passages)", len(self.files), len(self.index.passages))
+
+    def _write(self, files: dict[str, dict[str, Any]]) -> None:
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"files": files}, f)
+        os.replace(tmp, self.path)
+
+    async def _flush(self) -> None:
+        await asyncio.sleep(_FLUSH_DELAY_SECONDS)
+        while self._dirty:
+            self._dirty = False
+            files = dict(self.files)  # entries are never modified, so a shallow copy is a snapshot
+            try:
+                self.index = await asyncio.to_thread(_build_index, files)
+                await asyncio.to_thread(self._write, files)
+            except Exception as e:
+                logger.warning("[KB Mirror] Could not update the index / %s: %s", self.path, e)
+
+    def _changed(self) -> asyncio.Task[None]:
+        """Schedule a rebuild + save (one at a time; changes made meanwhile share the next)."""
+        self._dirty = True
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush())
+        return self._flush_task
+
+    def _put(self, file_id: str, filename: str, passages: list[str], source: str) -> None:
+        self.files[file_id] = {"filename": filename, "passages": passages}
+        self._changed()
+        KB_MIRROR_UPDATES_TOTAL.inc(source=source)
+        logger.info("[KB Mirror] Mirrored %s (%s, %s passages) from %s", filename, file_id, len(passages), source)
+
+    # -- updates ---------------------------------------------------------------
+
+    async def add_upload(self, file_id: str, filename: str, content: bytes) -> None:
+        """Mirror a file just uploaded to the vector store."""
+        if not KB_MIRROR_ENABLED:
+            return
+        try:
+            passages = await asyncio.to_thread(extract_passages, filename, content)
+        except Exception as e:
+            # The upload itself succeeded; the next sync will pick the file up
+            logger.warning("[KB Mirror] Could not mirror %s: %s", filename, e)
+            return
+        if passages is None:
+            self._spawn(self._mirror_when_indexed(file_id, filename))
+            return
+        self._put(file_id, filename, passages, "upload")
+
+    async def remove(self, file_id: str) -> None:
+        if KB_MIRROR_ENABLED and self.files.pop(file_id, None) is not None:
+            self._changed()
+            KB_MIRROR_UPDATES_TOTAL.inc(source="removed")
+
+    def _spawn(self, coro: Any) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch_text(self, file_id: str) -> str:
+        page = await get_openai_client().vector_stores.files.content(file_id, vector_store_id=JASON_VECTOR_STORE_ID)
+        return "\n\n".join([part.text async for part in page if part.text])
+
+    async def _mirror_when_indexed(self, file_id: str, filename: str) -> None:
+        """Wait (bounded) for the vector store to parse a document, then mirror its text."""
+        client = get_openai_client()
+        try:
+            for delay in _INDEXING_POLL_DELAYS:
+                await asyncio.sleep(delay)
+                status = (
+                    await client.vector_stores.files.retrieve(file_id, vector_store_id=JASON_VECTOR_STORE_ID)
+                ).status
+                if status == "completed":
+                    text = await self._fetch_text(file_id)
+                    self._put(file_id, filename, await asyncio.to_thread(split_passages, text), "vector_store")
+                    return
+                if status in ("failed", "cancelled"):
+                    logger.warning("[KB Mirror] %s indexing %s, not mirrored", filename, status)
+                    return
+            logger.warning("[KB Mirror] %s still indexing, left for the next sync", filename)
+        except Exception as e:
+            logger.warning("[KB Mirror] Could not mirror %s: %s", filename, e)
+
+    async def sync(self, concurrency: int = 4) -> None:
+        """Backfill files missing from the mirror and drop ones no longer in the vector store."""
+        client = get_openai_client()
+        known = set(self.files)  # uploads landing mid-sync are not judged stale
+        store_ids: set[str] = set()
+        missing: list[str] = []
+        async for vs_file in client.vector_stores.files.list(vector_store_id=JASON_VECTOR_STORE_ID, limit=100):
+            store_ids.add(vs_file.id)
+            if vs_file.id not in self.files and vs_file.status == "completed":
+                missing.append(vs_file.id)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def backfill(file_id: str) -> None:
+            async with semaphore:
+                try:
+                    filename = (await client.files.retrieve(file_id)).filename
+                    text = await self._fetch_text(file_id)
+                    passages = await asyncio.to_thread(split_passages, text)
+                except Exception as e:
+                    logger.warning("[KB Mirror] Could not backfill %s: %s", file_id, e)
+                    return
+                self.files[file_id] = {"filename": filename, "passages": passages}
+                KB_MIRROR_UPDATES_TOTAL.inc(source="sync")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(backfill(file_id) for file_id in missing))
+        stale = [file_id for file_id in known if file_id not in store_ids]
+        for file_id in stale:
+            self.files.pop(file_id, None)
+        if missing or stale:
+            KB_MIRROR_UPDATES_TOTAL.inc(len(stale), source="removed")
+            await asyncio.shield(self._changed())
+        logger.info(
+            "[KB Mirror] Synced in %.1fs: %s backfilled, %s removed, %s files / %s passages",
+            time.perf_counter() - start, len(missing), len(stale), len(self.files), len(self.index.passages),
+        )
+
+    async def start(self) -> None:
+        """Startup: load the persisted mirror, then sync with the vector store."""
+        await asyncio.to_thread(self.load)
+        if KB_MIRROR_SYNC and JASON_VECTOR_STORE_ID:
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning("[KB Mirror] Sync failed, using the local copy: %s", e)
+
+    # -- retrieval -------------------------------------------------------------
+
+    def search(self, query: str, k: int = KB_PREFETCH_PASSAGES) -> Retrieval:
+        start = time.perf_counter()
+        hits = self.index.search(query, k)
+        return Retrieval(query, hits, time.perf_counter() - start)
+
+
+kb_mirror = KnowledgeBaseMirror()
+
+
+def start_prefetch(query: str) -> asyncio.Task[Retrieval | None] | None:
+    """Start local retrieval for a turn's message; await the task before picking tools."""
+    if not KB_MIRROR_ENABLED or not query or not kb_mirror.index.passages:
+        return None
+    return asyncio.create_task(asyncio.to_thread(kb_mirror.search, query))
+
+
+async def finish_prefetch(task: asyncio.Task[Retrieval | None] | None, endpoint: str) -> Retrieval | None:
+    """Await a prefetch and record its outcome; None if there's nothing worth injecting."""
+    if task is None:
+        return None
+    try:
+        retrieval = await task
+    except Exception as e:
+        logger.warning("[KB Mirror] Local retrieval failed: %s", e)
+        return None
+    KB_RETRIEVAL_SECONDS.observe(retrieval.seconds, endpoint=endpoint)
+    if not retrieval.hits:
+        outcome = "empty"
+    elif retrieval.confident:
+        outcome = "confident"
+    elif retrieval.injectable:
+        outcome = "injected"
+    else:
+        outcome = "weak"
+    KB_RETRIEVALS_TOTAL.inc(endpoint=endpoint, outcome=outcome)
+    logger.debug(
+        "[KB Mirror] %s: score %.1f, coverage %.2f in %.1fms",
+        outcome, retrieval.score, retrieval.coverage, retrieval.seconds * 1000,
+    )
+    return retrieval if retrieval.injectable else None
@@ -0,0 +1,44 @@
+"""
+Knowledge base (OpenAI vector store) settings.
+
+Shared by the agent's file_search tool and the /api/files endpoints; kept in
+its own module so the file endpoints don't have to import the agent.
+
+`knowledge_base_generation()` is bumped whenever this process changes the
+vector store (upload / delete), so anything derived from its contents (e.g.
+the response cache) can tell when it has gone stale.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+JASON_VECTOR_STORE_ID = os.getenv("JASON_VECTOR_STORE_ID", "vs_68e6b33ec38481919601875ea1e2287c")
+
+# File types accepted by /api/files/upload and /api/files/upload-bulk
+KB_ALLOWED_EXTENSIONS = frozenset({
+    '.pdf', '.txt', '.md', '.doc', '.docx',
+    '.csv', '.xlsx', '.pptx',
+    '.c', '.cpp', '.cs', '.css', '.go', '.html',
+    '.java', '.js', '.json', '.php', '.py', '.rb',
+    '.sh', '.tex', '.ts', '.xml'
+})
+# OpenAI limit is typically 512MB for assistants
+KB_MAX_FILE_BYTES = 512 * 1024 * 1024
+
+_generation = 0
+
+
+def knowledge_base_generation() -> int:
+    """Counter of knowledge base changes made by this process."""
+    return _generation
+
+
+def mark_knowledge_base_changed(reason: str) -> None:
+    """Record that the vector store contents changed (upload, delete, ...)."""
+    global _generation
+    _generation += 1
+    logger.info("[Knowledge Base] Contents changed (%s), generation %s", reason, _generation)
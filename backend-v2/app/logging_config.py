@@ -0,0 +1,135 @@
+"""
+Non-blocking structured logging.
+
+Handlers on the event loop only enqueue records (`QueueHandler`); a
+`QueueListener` thread formats and writes them to stdout, so a slow or
+back-pressured stdout never stalls streaming responses.
+
+Environment:
+- LOG_LEVEL: root level for `app.*` loggers (default INFO, DEBUG in DEBUG_MODE)
+- LOG_LEVELS: per-module overrides, e.g. "app.main=DEBUG,app.memory_store=WARNING"
+- LOG_FORMAT: "json" (default) or "text"
+- LOG_RATE_LIMIT_SECONDS / LOG_RATE_LIMIT_BURST: repeated WARNING+ records
+  with the same logger/message template are limited to BURST per window
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any
+
+DEBUG_MODE = os.getenv("DEBUG_MODE", "false").lower() == "true"
+
+# Attributes present on every LogRecord; anything else came from `extra=`
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message and any `extra=` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Drop repeated WARNING/ERROR records that share a logger and message
+    template once `burst` have been emitted within `window` seconds.
+
+    A summary of how many were suppressed is attached to the next record
+    that gets through.
+    """
+
+    def __init__(self, window: float, burst: int) -> None:
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self._lock = threading.Lock()
+        # (logger, template) -> (window start, emitted, suppressed)
+        self._state: dict[tuple[str, str], tuple[float, int, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.window <= 0:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            start, emitted, suppressed = self._state.get(key, (now, 0, 0))
+            if now - start >= self.window:
+                if suppressed:
+                    record.suppressed_repeats = suppressed
+                self._state[key] = (now, 1, 0)
+                return True
+            if emitted < self.burst:
+                self._state[key] = (start, emitted + 1, suppressed)
+                return True
+            self._state[key] = (start, emitted, suppressed + 1)
+            return False
+
+
+def _parse_levels(spec: str) -> dict[str, str]:
+    levels: dict[str, str] = {}
+    for entry in spec.split(","):
+        if "=" not in entry:
+            continue
+        name, level = entry.split("=", 1)
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging() -> None:
+    """Install the queue-backed handler on the `app` logger (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        stream_handler.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s")
+        )
+    else:
+        stream_handler.setFormatter(JsonFormatter())
+
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(
+        RateLimitFilter(
+            window=float(os.getenv("LOG_RATE_LIMIT_SECONDS", "60")),
+            burst=int(os.getenv("LOG_RATE_LIMIT_BURST", "5")),
+        )
+    )
+
+    app_logger = logging.getLogger("app")
+    app_logger.handlers = [queue_handler]
+    app_logger.propagate = False
+    app_logger.setLevel(os.getenv("LOG_LEVEL", "DEBUG" if DEBUG_MODE else "INFO").upper())
+    for name, level in _parse_levels(os.getenv("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -0,0 +1,124 @@
+"""
+Event-loop lag monitor with blocking-call detection.
+
+Two cooperating pieces:
+- A heartbeat task on the event loop sleeps for `interval` and records how
+  late it wakes up (scheduling delay) into a histogram.
+- A watchdog thread checks the heartbeat. If the loop has not ticked for
+  longer than `threshold`, the loop is blocked *right now*, so the watchdog
+  grabs the event loop thread's current stack - i.e. the frame doing the
+  blocking (a sync OpenAI/requests call, heavy CPU work, ...) - and logs it.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any
+
+from .metrics import REGISTRY
+from .tracing import collect_stack
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL_MS", "100")) / 1000
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "250")) / 1000
+
+LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "jason_event_loop_lag_seconds",
+    "Event loop scheduling delay measured by the heartbeat task.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+LOOP_LAG_MAX_SECONDS = REGISTRY.gauge(
+    "jason_event_loop_lag_max_seconds",
+    "Largest scheduling delay observed since startup.",
+)
+LOOP_BLOCKED_TOTAL = REGISTRY.counter(
+    "jason_event_loop_blocked_total",
+    "Times the event loop was blocked longer than LOOP_LAG_THRESHOLD_MS.",
+)
+
+
+class LoopLagMonitor:
+    """Heartbeat task + watchdog thread for one event loop."""
+
+    def __init__(
+        self,
+        interval: float = LOOP_LAG_INTERVAL,
+        threshold: float = LOOP_LAG_THRESHOLD,
+    ) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.max_lag = 0.0
+        # Most recent blocking episodes (for /admin/loop)
+        self.blocked_events: deque[dict[str, Any]] = deque(maxlen=50)
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        """Start monitoring the running loop (call from inside it)."""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._run_heartbeat())
+        self._watchdog = threading.Thread(target=self._run_watchdog, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._heartbeat = now
+            LOOP_LAG_SECONDS.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+                LOOP_LAG_MAX_SECONDS.set(lag)
+
+    def _run_watchdog(self) -> None:
+        blocked_since: float | None = None
+        while not self._stop.wait(self.interval):
+            stalled_for = time.monotonic() - self._heartbeat
+            if stalled_for < self.threshold + self.interval:
+                blocked_since = None
+                continue
+            if blocked_since is not None and blocked_since == self._heartbeat:
+                # Same blocking episode, stack already captured
+                continue
+            blocked_since = self._heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id or 0)
+            stack = list(collect_stack(frame)) if frame is not None else []
+            LOOP_BLOCKED_TOTAL.inc()
+            self.blocked_events.append(
+                {"at": time.time(), "stalled_ms": round(stalled_for * 1000, 1), "stack": stack}
+            )
+            logger.warning(
+                "[Loop Monitor] Event loop blocked for >%.0fms at %s",
+                stalled_for * 1000,
+                stack[-1] if stack else "unknown frame",
+                extra={"stack": stack[-15:]},
+            )
+
+
+loop_monitor = LoopLagMonitor()
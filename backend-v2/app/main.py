@@ -1,559 +1,110 @@
 from __future__ import annotations
 
 import os
-from typing import Any, AsyncIterator
+from typing import TYPE_CHECKING, Any
 
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-from agents import RunConfig, Runner, SQLiteSession, trace
-
-# Performance optimization: disable debug logging in production
-DEBUG_MODE = os.getenv("DEBUG_MODE", "false").lower() == "true"
-from agents.model_settings import ModelSettings
-from chatkit.agents import AgentContext, stream_agent_response
-from chatkit.server import ChatKitServer, StreamingResult
-from chatkit.types import (
-    Attachment,
-    ClientToolCallItem,
-    ThreadItem,
-    ThreadMetadata,
-    ThreadStreamEvent,
-    UserMessageItem,
-)
-# ProgressUpdateEvent commented out - keep server events raw (v0.0.2 compatibility)
-# try:
-#     from chatkit.types import ProgressUpdateEvent
-# except ImportError:
-#     # Fallback if ProgressUpdateEvent doesn't exist
-#     ProgressUpdateEvent = None
-ProgressUpdateEvent = None  # Disabled for v0.0.2
+from .logging_config import configure_logging
+
+# Non-blocking structured logging (queue-backed, see logging_config.py)
+configure_logging()
+
 from fastapi import Depends, FastAPI, Request, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import Response, StreamingResponse
-from openai import OpenAI
-from openai.types.responses import ResponseInputContentParam
 from starlette.responses import JSONResponse
-import secrets
-import tempfile
-import base64
-import mimetypes
+import asyncio
 import json
-
-from .jason_agent import jason_agent, JASON_VECTOR_STORE_ID
-from .memory_store import MemoryStore
-from .ai_sdk_endpoint import AISDKChatHandler
-import re
-
-
-def _strip_annotation_markers(text: str) -> str:
-    """
-    Strip annotation index markers from response text.
-    
-    These markers (≡file≡, ≡turn0file2≡, etc.) are internal OpenAI citation indices
-    that should be converted to Annotation objects by ChatKit, but still appear in text.
-    
-    Based on official OpenAI chatkit-samples knowledge-assistant example,
-    these need to be manually stripped from display text even in latest versions.
-    """
-    if not text:
-        return text
-    
-    # Remove citation markers: ≡...≡ pattern
-    # Matches: ≡file≡, ≡turn0file2≡, ≡turn0file3≡, etc.
-    cleaned = re.sub(r'≡[^≡]*≡', '', text)
-    
-    # Also catch other citation bracket formats that might appear
-    cleaned = re.sub(r'【[^】]*】', '', cleaned)
-    
-    return cleaned
-
-
-def _user_message_text(item: UserMessageItem) -> str:
-    parts: list[str] = []
-    for part in item.content:
-        text = getattr(part, "text", None)
-        if text:
-            parts.append(text)
-    return " ".join(parts).strip()
-
-
-def _get_attachment_refs(item: UserMessageItem) -> list[str]:
-    """Extract attachment IDs from user message content."""
-    attachment_ids: list[str] = []
-    if DEBUG_MODE:
-        print(f"[_get_attachment_refs] Processing {len(item.content)} content parts")
-    for i, part in enumerate(item.content):
-        if DEBUG_MODE:
-            print(f"[_get_attachment_refs] Part {i}: type={type(part).__name__}, attrs={dir(part)}")
-            print(f"[_get_attachment_refs] Part {i} content: {part}")
-        
-        # Check for different possible attachment reference formats
-        if hasattr(part, "attachment_id") and part.attachment_id:
-            if DEBUG_MODE:
-                print(f"[_get_attachment_refs] Found attachment_id: {part.attachment_id}")
-            attachment_ids.append(part.attachment_id)
-        elif hasattr(part, "attachment") and part.attachment:
-            if DEBUG_MODE:
-                print(f"[_get_attachment_refs] Found attachment object: {part.attachment}")
-            if hasattr(part.attachment, "id"):
-                attachment_ids.append(part.attachment.id)
-        elif hasattr(part, "type") and part.type in ["image", "file", "attachment"]:
-            if DEBUG_MODE:
-                print(f"[_get_attachment_refs] Found {part.type} type part")
-            # Try to extract ID from various possible attributes
-            for attr in ["id", "file_id", "image_id", "attachment_id"]:
-                if hasattr(part, attr) and getattr(part, attr):
-                    attachment_ids.append(getattr(part, attr))
-                    break
-    
-    if DEBUG_MODE:
-        print(f"[_get_attachment_refs] Total found: {attachment_ids}")
-    return attachment_ids
-
-
-def _is_tool_completion_item(item: Any) -> bool:
-    return isinstance(item, ClientToolCallItem)
-
-
-class JasonCoachingServer(ChatKitServer[dict[str, Any]]):
-    def __init__(self, agent) -> None:
-        self.store = MemoryStore()
-        # Pass the store as both the store AND the attachment_store
-        super().__init__(self.store, attachment_store=self.store)
-        self.assistant = agent
-        # Cache SQLiteSession instances per thread
-        self.sessions: dict[str, SQLiteSession] = {}
-        # Track active tools for progress visualization
-        self.active_tools: dict[str, str] = {}
-    
-    def _get_tool_progress_message(
-        self, 
-        tool_name: str, 
-        status: str = "running",
-        queries: list[str] | None = None
-    ) -> str:
-        """Convert tool name to user-friendly progress message with icons and query details."""
-        
-        # Extract first query if available
-        query_text = None
-        if queries and len(queries) > 0:
-            # queries is typically a list like ['search term']
-            query_text = queries[0] if isinstance(queries, list) else str(queries)
-            # Truncate long queries
-            if len(query_text) > 60:
-                query_text = query_text[:60] + "..."
-        
-        # Base messages
-        tool_messages = {
-            "file_search": {
-                "running": "🔎 Searching knowledge base",
-                "completed": "✅ Found relevant content",
-                "analyzing": "🧪 Analyzing Results"
-            },
-            "web_search": {
-                "running": "🌐 Searching the web",
-                "completed": "✅ Found latest information",
-                "analyzing": "🧪 Analyzing Results"
-            },
-        }
-        
-        if tool_name in tool_messages:
-            base_msg = tool_messages[tool_name].get(status, f"🔧 Using {tool_name}")
-            
-            # Add query details if running and query available
-            if status == "running" and query_text:
-                return f"{base_msg} for: \"{query_text}\""
-            
-            return base_msg + "..."
-        
-        # Fallback for unknown tools
-        if status == "running" and query_text:
-            return f"🔧 Using {tool_name} with query: \"{query_text}\""
-        return f"🔧 Using {tool_name}..." if status == "running" else f"✅ Completed {tool_name}"
-    
-    def _get_session(self, thread_id: str) -> SQLiteSession:
-        """Get or create a SQLiteSession for this thread."""
-        if thread_id not in self.sessions:
-            self.sessions[thread_id] = SQLiteSession(
-                session_id=thread_id,
-                db_path="conversations.db"  # All sessions in one DB
-            )
-        return self.sessions[thread_id]
-
-    async def respond(
-        self,
-        thread: ThreadMetadata,
-        item: ThreadItem | None,
-        context: dict[str, Any],
-    ) -> AsyncIterator[ThreadStreamEvent]:
-        if item is None:
-            return
-
-        if _is_tool_completion_item(item):
-            return
-
-        if not isinstance(item, UserMessageItem):
-            return
-
-        # Debug: Print the entire item structure (only in debug mode)
-        if DEBUG_MODE:
-            print(f"[respond] UserMessageItem attributes: {dir(item)}")
-            print(f"[respond] UserMessageItem data: {item}")
-        
-        message_text = _user_message_text(item)
-        
-        # Check for attachments at the item level (not just in content)
-        attachment_ids = []
-        if hasattr(item, "attachments") and item.attachments:
-            if DEBUG_MODE:
-                print(f"[respond] Found item.attachments: {item.attachments}")
-            for att in item.attachments:
-                if hasattr(att, "id"):
-                    attachment_ids.append(att.id)
-                elif isinstance(att, str):
-                    attachment_ids.append(att)
-        
-        # Also check content parts
-        content_attachment_ids = _get_attachment_refs(item)
-        attachment_ids.extend(content_attachment_ids)
-        
-        if DEBUG_MODE:
-            print(f"[respond] Message text: '{message_text[:50]}...'" if message_text else "[respond] No text")
-            print(f"[respond] Found {len(attachment_ids)} attachment(s): {attachment_ids}")
-        
-        # Build input content - either string or list with message wrapper
-        if attachment_ids:
-            # Build multi-part message content with text and inline attachments (images, text files, docs)
-            message_content = []
-            
-            # Add text if present
-            if message_text:
-                message_content.append({"type": "input_text", "text": message_text})
-            
-            # Convert and add each attachment
-            for attachment_id in attachment_ids:
-                try:
-                    # Load the attachment metadata
-                    attachment = await self.store.load_attachment(attachment_id, context)
-                    if DEBUG_MODE:
-                        print(f"[respond] Loaded attachment {attachment_id}: {attachment.name}")
-                    
-                    # Convert to Agent SDK format
-                    # Note: PDFs will be uploaded to vector store, images/text inline
-                    attachment_content = await self.to_message_content(attachment)
-                    message_content.append(attachment_content)
-                    if DEBUG_MODE:
-                        print(f"[respond] Added attachment to message content")
-                            
-                except Exception as e:
-                    print(f"[respond] ERROR processing attachment {attachment_id}: {e}")
-                    if DEBUG_MODE:
-                        import traceback
-                        traceback.print_exc()
-            
-            # Wrap in a message format for Responses API
-            agent_input = [
-                {
-                    "type": "message",
-                    "role": "user",
-                    "content": message_content
-                }
-            ]
-        else:
-            # Just text, no attachments
-            agent_input = message_text
-            
-        if not message_text and not attachment_ids:
-            return
-
-        # Auto-generate thread title from first user message if not set
-        if not thread.title and message_text:
-            thread.title = self.store._generate_title_from_message(message_text)
-            await self.store.save_thread(thread, context)
-
-        # Get SQLiteSession for this thread (for agent memory)
-        session = self._get_session(thread.id)
-        
-        # 🎯 Using single GPT-5 agent (simple and fast)
-        # GPT-5 handles all queries with adaptive response depth
-        # reasoning_effort="medium" enables thinking mode for complex queries
-        if DEBUG_MODE:
-            print(f"[GPT-5 Agent] Processing query: '{message_text[:50] if message_text else 'image/file'}...'")
-
-        agent_context = AgentContext(
-            thread=thread,
-            store=self.store,
-            request_context=context,
-        )
-        
-        # 🧠 Emit initial "Thinking..." status BEFORE streaming starts
-        if ProgressUpdateEvent is not None:
-            try:
-                thinking_event = ProgressUpdateEvent(text="🧠 Thinking...")
-                yield thinking_event
-                if DEBUG_MODE:
-                    print("🧠 Yielded initial thinking status to ChatKit")
-            except Exception as e:
-                if DEBUG_MODE:
-                    print(f"⚠️  Failed to yield initial thinking status: {e}")
-        
-        # When we have attachments (list input), disable session memory
-        # Agent SDK requires a session_input_callback for list inputs with sessions
-        use_session = None if attachment_ids else session
-        
-        # Conditional tracing: only trace in debug mode to reduce latency
-        if DEBUG_MODE:
-            with trace(f"Jason coaching - {thread.id[:8]}"):
-                result = Runner.run_streamed(
-                    self.assistant,  # 🎯 Single GPT-5 agent (fast and effective)
-                    agent_input,  # 🖼️ Now includes attachments!
-                    context=agent_context,
-                    session=use_session,  # ✨ Disable session for image messages (Agent SDK limitation)
-                    run_config=RunConfig(
-                        model_settings=ModelSettings(
-                            parallel_tool_calls=True,  # 🔥 3-5x faster with parallel execution
-                            reasoning_effort="low",  # ✨ CRITICAL: Enables GPT-5's thinking mode
-                            # "low" = fast (2-3s thinking, good for chatbot)
-                            # "medium" = balanced (5-10s thinking)
-                            # "high" = deep (15-30s thinking, for complex analysis)
-                            verbosity="low",  # 💬 Concise responses (matches voice guidelines)
-                        )
-                    ),
-                )
-                # 🔧 Stream events with ChatKit conversion
-                async for chatkit_event in stream_agent_response(agent_context, result):
-                    # Debug: Log event structure
-                    if DEBUG_MODE:
-                        print(f"[EVENT] Type: {type(chatkit_event).__name__}")
-                        if hasattr(chatkit_event, 'delta'):
-                            print(f"[EVENT] Delta: {repr(chatkit_event.delta)}")
-                        if hasattr(chatkit_event, 'text'):
-                            print(f"[EVENT] Text: {repr(chatkit_event.text[:100] if chatkit_event.text else None)}")
-                    
-                    # Strip annotation markers from text deltas
-                    # Even with chatkit 1.0.2, these markers still appear in text
-                    # and need manual stripping (confirmed via official samples)
-                    if hasattr(chatkit_event, 'delta') and isinstance(chatkit_event.delta, str):
-                        original = chatkit_event.delta
-                        chatkit_event.delta = _strip_annotation_markers(chatkit_event.delta)
-                        if original != chatkit_event.delta and DEBUG_MODE:
-                            print(f"[STRIPPED] {repr(original)} -> {repr(chatkit_event.delta)}")
-                    
-                    # Also check for 'text' field
-                    if hasattr(chatkit_event, 'text') and isinstance(chatkit_event.text, str):
-                        original = chatkit_event.text
-                        chatkit_event.text = _strip_annotation_markers(chatkit_event.text)
-                        if original != chatkit_event.text and DEBUG_MODE:
-                            print(f"[STRIPPED TEXT] {repr(original[:100])} -> {repr(chatkit_event.text[:100])}")
-                    
-                    yield chatkit_event
-        else:
-            # Production mode: no tracing overhead
-            result = Runner.run_streamed(
-                self.assistant,  # 🎯 Single GPT-5 agent (fast and effective)
-                agent_input,  # 🖼️ Now includes attachments!
-                context=agent_context,
-                session=use_session,  # ✨ Disable session for image messages (Agent SDK limitation)
-                run_config=RunConfig(
-                    model_settings=ModelSettings(
-                        parallel_tool_calls=True,  # 🔥 3-5x faster with parallel execution
-                        reasoning_effort="low",  # ✨ CRITICAL: Enables GPT-5's thinking mode
-                        # "low" = fast (2-3s thinking, good for chatbot)
-                        # "medium" = balanced (5-10s thinking)
-                        # "high" = deep (15-30s thinking, for complex analysis)
-                        verbosity="low",  # 💬 Concise responses (matches voice guidelines)
-                    )
-                ),
-            )
-            # 🔧 Stream events with ChatKit conversion
-            async for chatkit_event in stream_agent_response(agent_context, result):
-                # Strip annotation markers from text deltas
-                # Even with chatkit 1.0.2, these markers still appear in text
-                # and need manual stripping (confirmed via official samples)
-                if hasattr(chatkit_event, 'delta') and isinstance(chatkit_event.delta, str):
-                    chatkit_event.delta = _strip_annotation_markers(chatkit_event.delta)
-                
-                # Also check for 'text' field
-                if hasattr(chatkit_event, 'text') and isinstance(chatkit_event.text, str):
-                    chatkit_event.text = _strip_annotation_markers(chatkit_event.text)
-                
-                yield chatkit_event
-
-    async def to_message_content(self, input: Attachment) -> ResponseInputContentParam:
-        """
-        Convert attachment to format Agent SDK expects.
-        
-        Supported formats:
-        - Images (image/*): Converted to base64 data URLs (inline in content)
-        - Text files (text/*, .json, .md, .txt): Decoded and inline as input_text
-        - Documents (PDF, DOCX, XLSX, PPTX): Uploaded to OpenAI and added to vector store
-          (Responses API doesn't support message.attachments, so we add to permanent storage)
-        
-        Returns:
-        - Dict with {"type": "input_image"} or {"type": "input_text"}
-        
-        Note: PDFs are added to the PERMANENT vector store because the Responses API
-        (used by Agent SDK) doesn't support temporary thread-level attachments.
-        """
-        if DEBUG_MODE:
-            print(f"[to_message_content] Converting attachment {input.id} to message content")
-        
-        # Get attachment data from custom storage
-        if not hasattr(self.store, '_attachment_data'):
-            raise RuntimeError(f"Attachment storage not initialized")
-        
-        attachment_data = self.store._attachment_data.get(input.id)
-        if not attachment_data:
-            print(f"[to_message_content] ERROR: Attachment {input.id} not found in _attachment_data")
-            if DEBUG_MODE:
-                print(f"[to_message_content] Available attachments: {list(self.store._attachment_data.keys())}")
-            raise RuntimeError(f"Attachment {input.id} not found")
-        
-        mime_type = attachment_data["mime_type"]
-        data_bytes = attachment_data.get("data")
-        filename = attachment_data.get("name", "unnamed")
-        
-        if DEBUG_MODE:
-            print(f"[to_message_content] Attachment MIME type: {mime_type}, filename: {filename}")
-        
-        if not data_bytes:
-            print(f"[to_message_content] ERROR: No data bytes for attachment {input.id}")
-            raise RuntimeError(f"No data bytes for attachment {input.id}")
-        
-        # Handle images - inline as base64
-        if mime_type and mime_type.startswith("image/"):
-            base64_image = base64.b64encode(data_bytes).decode("utf-8")
-            if DEBUG_MODE:
-                print(f"[to_message_content] Encoded image to base64, length: {len(base64_image)}")
-            
-            # Build data URL as per Agent SDK docs
-            data_url = f"data:{mime_type};base64,{base64_image}"
-            
-            result = {
-                "type": "input_image",
-                "detail": "auto",
-                "image_url": data_url,
-            }
-            if DEBUG_MODE:
-                print(f"[to_message_content] Returning Agent SDK format: type=input_image")
-            return result
-        
-        # Handle simple text files - inline as text
-        elif mime_type and (mime_type.startswith("text/") or mime_type in ["application/json"]):
-            try:
-                text_content = data_bytes.decode("utf-8")
-                if DEBUG_MODE:
-                    print(f"[to_message_content] Decoded text file, length: {len(text_content)} chars")
-                
-                # Return as input_text with filename context
-                result = {
-                    "type": "input_text",
-                    "text": f"File: {filename}\n\n{text_content}"
-                }
-                if DEBUG_MODE:
-                    print(f"[to_message_content] Returning Agent SDK format: type=input_text")
-                return result
-            except UnicodeDecodeError:
-                raise RuntimeError(f"Failed to decode text file: {filename}")
-        
-        # Handle PDFs, DOCX, and other documents - upload to OpenAI and add to vector store
-        # Responses API doesn't support message.attachments, so we add to vector store instead
-        elif mime_type in [
-            "application/pdf",
-            "application/vnd.openxmlformats-officedocument.wordprocessingml.document",  # .docx
-            "application/msword",  # .doc
-            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",  # .xlsx
-            "application/vnd.ms-excel",  # .xls
-            "application/vnd.openxmlformats-officedocument.presentationml.presentation",  # .pptx
-        ]:
-            if DEBUG_MODE:
-                print(f"[to_message_content] Document type detected: {mime_type}")
-                print(f"[to_message_content] Uploading to OpenAI and adding to vector store...")
-            
-            try:
-                # Get file extension
-                file_ext = os.path.splitext(filename)[1] or ".pdf"
-                
-                # Create temporary file
-                with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp:
-                    tmp.write(data_bytes)
-                    tmp_path = tmp.name
-                
-                try:
-                    # Step 1: Upload to OpenAI with purpose="assistants"
-                    with open(tmp_path, "rb") as f:
-                        openai_file = openai_client.files.create(
-                            file=f,
-                            purpose="assistants"
-                        )
-                    
-                    if DEBUG_MODE:
-                        print(f"[to_message_content] Uploaded to OpenAI, file_id: {openai_file.id}")
-                    
-                    # Step 2: Add to vector store so file_search can access it
-                    # (Responses API requires this - can't use message.attachments)
-                    if JASON_VECTOR_STORE_ID:
-                        try:
-                            vector_store_file = openai_client.beta.vector_stores.files.create(
-                                vector_store_id=JASON_VECTOR_STORE_ID,
-                                file_id=openai_file.id
-                            )
-                            if DEBUG_MODE:
-                                print(f"[to_message_content] Added to vector store, status: {vector_store_file.status}")
-                            
-                            # Return message telling user the file is being indexed
-                            result = {
-                                "type": "input_text",
-                                "text": f"[Document attached: {filename}]\n\nI've added this to my knowledge base and will analyze it. Note: This file will be saved permanently in the knowledge base."
-                            }
-                        except Exception as e:
-                            print(f"[to_message_content] ERROR adding to vector store: {e}")
-                            # Fall back to just mentioning the file
-                            result = {
-                                "type": "input_text",
-                                "text": f"[Document attached: {filename}]\n\nNote: Could not add to knowledge base ({str(e)}). Please use the Knowledge Base upload section instead."
-                            }
-                    else:
-                        # No vector store configured
-                        print(f"[to_message_content] WARNING: No vector store configured")
-                        result = {
-                            "type": "input_text",
-                            "text": f"[Document attached: {filename}]\n\nNote: Vector store not configured. Please upload documents via the Knowledge Base section instead."
-                        }
-                    
-                    if DEBUG_MODE:
-                        print(f"[to_message_content] Returning document reference")
-                    
-                    return result
-                    
-                finally:
-                    # Clean up temp file
-                    try:
-                        os.unlink(tmp_path)
-                    except Exception as e:
-                        print(f"[to_message_content] Warning: Failed to delete temp file: {e}")
-                        
-            except Exception as e:
-                print(f"[to_message_content] ERROR uploading document: {e}")
-                import traceback
-                traceback.print_exc()
-                raise RuntimeError(f"Failed to process document {filename}: {str(e)}")
-        
-        else:
-            raise RuntimeError(
-                f"Unsupported attachment type: {mime_type} ({filename}). "
-                f"Supported: images (image/*), text files (text/*, .json), "
-                f"and documents (.pdf, .docx, .xlsx, .pptx)"
-            )
-
-
-jason_server = JasonCoachingServer(agent=jason_agent)
-
-app = FastAPI(title="Jason's Coaching ChatKit API")
-
+from contextlib import asynccontextmanager
+import secrets
+import threading
+import logging
+
+from .knowledge_base import (
+    JASON_VECTOR_STORE_ID,
+    KB_ALLOWED_EXTENSIONS,
+    KB_MAX_FILE_BYTES,
+    mark_knowledge_base_changed,
+)
+from .kb_bulk_upload import BULK_UPLOAD_PATH, KB_BULK_MAX_BYTES, KB_BULK_MAX_FILES, BulkUploadSizeLimit, bulk_upload
+from .kb_manifest import KB_DEDUP_ENABLED, KB_REPLACED_FILES_TOTAL, content_hash, kb_manifest
+from .kb_mirror import KB_MIRROR_ENABLED, kb_mirror
+from .thread_vector_stores import THREAD_VECTOR_STORES_ENABLED, thread_vector_stores
+from .metrics import REGISTRY
+from .tracing import recent_traces, sample_profile
+from .loop_monitor import loop_monitor
+from .openai_client import close_openai_client, get_openai_client, use_for_agents
+from .warmup import readiness, run_warmup
+
+if TYPE_CHECKING:
+    from .ai_sdk_endpoint import AISDKChatHandler
+    from .chatkit_server import JasonCoachingServer
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# LAZY CHAT STACK
+# ============================================================================
+# `agents`, `chatkit` and `openai` take about a second to import, and building
+# the agent constructs its tools. None of that is needed to bind the port or
+# answer /health, so it's loaded on first use: by the startup warm-up (in a
+# worker thread, see warmup.py) or by the first chat request, whichever comes
+# first. `scripts/bench-startup.py` reports the import cost per module.
+# ============================================================================
+
+_jason_server: JasonCoachingServer | None = None
+_ai_sdk_handler: AISDKChatHandler | None = None
+_chat_stack_lock = threading.Lock()
+
+
+def load_chat_stack() -> Any:
+    """Import and build the agent, ChatKit server and AI SDK handler (idempotent, thread-safe)."""
+    global _jason_server, _ai_sdk_handler
+    with _chat_stack_lock:
+        if _jason_server is None:
+            from .ai_sdk_endpoint import AISDKChatHandler
+            from .chatkit_server import JasonCoachingServer
+            from .jason_agent import jason_agent
+
+            # 🔌 Route Agents SDK model calls through the shared pooled client
+            use_for_agents()
+            _ai_sdk_handler = AISDKChatHandler()
+            _jason_server = JasonCoachingServer(agent=jason_agent)
+        return _jason_server.assistant
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 🩺 Watch for event-loop stalls (sync calls inside async handlers)
+    loop_monitor.start()
+    # 🔥 Load the chat stack and pre-open upstream connections (optionally
+    # priming the prompt cache) in the background; GET /ready reports when done
+    warmup_task = asyncio.create_task(run_warmup(load_chat_stack))
+    # 📚 Load / backfill the local knowledge base mirror (see kb_mirror.py)
+    kb_mirror_task = asyncio.create_task(kb_mirror.start()) if KB_MIRROR_ENABLED else None
+    # 📎 Clean up per-thread vector stores (see thread_vector_stores.py)
+    thread_stores_task = asyncio.create_task(thread_vector_stores.run()) if THREAD_VECTOR_STORES_ENABLED else None
+    yield
+    warmup_task.cancel()
+    if kb_mirror_task is not None:
+        kb_mirror_task.cancel()
+    if thread_stores_task is not None:
+        thread_stores_task.cancel()
+    await loop_monitor.stop()
+    await close_openai_client()
+
+
+app = FastAPI(title="Jason's Coaching ChatKit API", lifespan=lifespan)
+
+# 📦 Refuse oversized bulk uploads from Content-Length, before the form is parsed
+# (added first so CORS headers still wrap the 413)
+app.add_middleware(BulkUploadSizeLimit)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -566,12 +117,50 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize OpenAI client for file operations
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Admin endpoints (/admin/*) are only enabled when this is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 
 
 def get_server() -> JasonCoachingServer:
-    return jason_server
+    if _jason_server is None:
+        load_chat_stack()
+    return _jason_server
+
+
+def get_ai_sdk_handler() -> AISDKChatHandler:
+    if _ai_sdk_handler is None:
+        load_chat_stack()
+    return _ai_sdk_handler
+
+
+def _attachment_bytes() -> float:
+    if _jason_server is None:
+        return 0.0
+    attachment_data = getattr(_jason_server.store, "_attachment_data", {})
+    return float(sum(entry.get("size") or 0 for entry in attachment_data.values()))
+
+
+# 📊 Store sizes are computed at scrape time (no bookkeeping on hot paths)
+REGISTRY.gauge(
+    "jason_store_threads",
+    "Threads held in the in-memory ChatKit store.",
+    callback=lambda: sum(len(threads) for threads in _jason_server.store._sessions.values()) if _jason_server else 0,
+)
+REGISTRY.gauge(
+    "jason_store_attachments",
+    "Attachments held in the in-memory ChatKit store.",
+    callback=lambda: len(_jason_server.store._attachments) if _jason_server else 0,
+)
+REGISTRY.gauge(
+    "jason_store_attachment_bytes",
+    "Bytes of uploaded attachment data held in memory.",
+    callback=_attachment_bytes,
+)
+REGISTRY.gauge(
+    "jason_agent_sessions",
+    "SQLiteSession objects cached by the ChatKit server.",
+    callback=lambda: len(_jason_server.sessions) if _jason_server else 0,
+)
 
 
 @app.post("/chatkit")
@@ -582,8 +171,10 @@ async def chatkit_endpoint(
         payload = await request.body()
         # Log session ID for debugging
         session_id = request.query_params.get("sid", "default")
-        print(f"[ChatKit] Processing request for session: {session_id}")
+        logger.debug("[ChatKit] Processing request for session: %s", session_id)
         
+        from chatkit.server import StreamingResult
+
         result = await server.process(payload, {"request": request})
         if isinstance(result, StreamingResult):
             return StreamingResponse(result, media_type="text/event-stream")
@@ -591,9 +182,7 @@ async def chatkit_endpoint(
             return Response(content=result.json, media_type="application/json")
         return JSONResponse(result)
     except Exception as e:
-        print(f"[ChatKit] Error processing request: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("[ChatKit] Error processing request: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -607,42 +196,110 @@ async def ai_sdk_chat_endpoint(request: Request) -> StreamingResponse:
         # Parse request body
         body = await request.json()
         
-        print(f"[AI SDK] Received chat request with {len(body.get('messages', []))} messages")
+        logger.debug("[AI SDK] Received chat request with %s messages", len(body.get('messages', [])))
         
-        # Initialize AI SDK handler with full Jason Agent
-        ai_handler = AISDKChatHandler()
+        # AI SDK handler with full Jason Agent (built once, on first use - off the event loop)
+        ai_handler = await run_in_threadpool(get_ai_sdk_handler)
         
         # Handle the chat request with the real agent
         return await ai_handler.handle_chat(body)
         
     except Exception as e:
-        print(f"[AI SDK] Error processing chat request: {e}")
-        if DEBUG_MODE:
-            import traceback
-            traceback.print_exc()
+        logger.error(
+            "[AI SDK] Error processing chat request: %s", e,
+            exc_info=logger.isEnabledFor(logging.DEBUG),
+        )
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/metrics")
+async def metrics() -> Response:
+    """Prometheus text exposition of streaming, tool and store metrics."""
+    return Response(
+        content=REGISTRY.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+def _require_admin(request: Request) -> None:
+    """Admin endpoints are disabled unless ADMIN_TOKEN is set and sent as X-Admin-Token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not secrets.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.get("/admin/traces")
+async def admin_traces(request: Request, limit: int = 50) -> dict[str, Any]:
+    """Most recent kept request traces (newest first)."""
+    _require_admin(request)
+    return {"traces": recent_traces(limit)}
+
+
+@app.post("/admin/profile")
+async def admin_profile(request: Request, seconds: float = 10.0, interval_ms: float = 5.0) -> dict[str, Any]:
+    """
+    Capture a time-boxed sampling CPU profile of this worker's event loop thread.
+    
+    The sampler runs in a worker thread so the event loop keeps serving
+    (and being profiled) while we wait. Returns collapsed stacks for
+    flamegraph tools plus the hottest frames.
+    """
+    _require_admin(request)
+    loop_thread_id = threading.get_ident()
+    try:
+        return await asyncio.to_thread(
+            sample_profile, loop_thread_id, seconds, interval_ms / 1000
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/admin/loop")
+async def admin_loop(request: Request) -> dict[str, Any]:
+    """Event-loop lag summary and the stacks of recent blocking episodes."""
+    _require_admin(request)
+    return {
+        "interval_ms": loop_monitor.interval * 1000,
+        "threshold_ms": loop_monitor.threshold * 1000,
+        "max_lag_ms": round(loop_monitor.max_lag * 1000, 1),
+        "blocked_events": list(loop_monitor.blocked_events)[::-1],
+    }
+
+
+@app.get("/admin/indexing")
+async def admin_indexing(request: Request) -> dict[str, Any]:
+    """Indexing latency percentiles of recently attached chat documents."""
+    _require_admin(request)
+    return thread_vector_stores.indexing_percentiles()
+
+
 @app.get("/health")
 async def health_check() -> dict[str, str]:
     return {"status": "healthy", "agent": "Jason Cooperson Coaching Agent"}
 
 
+@app.get("/ready")
+async def readiness_check() -> JSONResponse:
+    """Readiness (vs. /health liveness): 503 until startup warm-up has finished."""
+    return JSONResponse(readiness.snapshot(), status_code=200 if readiness.ready else 503)
+
+
 @app.get("/")
 async def root() -> dict[str, Any]:
     return {
         "message": "Jason's Coaching ChatKit API",
         "status": "running",
-        "model": "GPT-5 with reasoning_effort=low (adaptive thinking)",
+        "model": "GPT-5 with per-message reasoning effort (adaptive thinking)",
         "architecture": {
             "type": "Single agent (simple and fast)",
             "model": "GPT-5",
-            "reasoning": "reasoning_effort=low (2-3s thinking when needed)",
+            "reasoning": "Routed per message: minimal for small talk, low by default, medium for strategy",
             "tools": "File search, web search, Instagram transcriber",
             "benefits": "Faster than multi-agent routing, still intelligent"
         },
         "features": [
-            "GPT-5 with thinking mode enabled (reasoning_effort=low)",
+            "GPT-5 with thinking mode enabled (effort routed per message)",
             "Image analysis (vision)",
             "Document processing (PDF, DOCX, XLSX, PPTX)",
             "File attachments (images, text, code files)",
@@ -668,6 +325,8 @@ async def root() -> dict[str, Any]:
             "chatkit": "/chatkit",
             "session": "/api/chatkit/session",
             "health": "/health",
+            "ready": "/ready",
+            "metrics": "/metrics",
             "files": {
                 "list": "GET /api/files - List all files in knowledge base",
                 "upload": "POST /api/files/upload - Upload documents to knowledge base (PDF, DOCX, TXT, MD, CSV, XLSX, PPTX, code files)",
@@ -724,26 +383,30 @@ async def list_files() -> dict[str, Any]:
         if not JASON_VECTOR_STORE_ID:
             return {"files": [], "vector_store_id": None}
         
+        openai_client = get_openai_client()
+
         # Get vector store files
-        vector_store_files = openai_client.beta.vector_stores.files.list(
+        vector_store_files = await openai_client.vector_stores.files.list(
             vector_store_id=JASON_VECTOR_STORE_ID
         )
         
-        # Get file details for each file
-        files_data = []
-        for vs_file in vector_store_files.data:
+        # Get file details for each file (concurrently - one round trip per file)
+        async def _file_details(vs_file: Any) -> dict[str, Any] | None:
             try:
-                file_obj = openai_client.files.retrieve(vs_file.id)
-                files_data.append({
-                    "id": file_obj.id,
-                    "filename": file_obj.filename,
-                    "bytes": file_obj.bytes,
-                    "created_at": file_obj.created_at,
-                    "status": vs_file.status,
-                })
+                file_obj = await openai_client.files.retrieve(vs_file.id)
             except Exception as e:
-                print(f"Error retrieving file {vs_file.id}: {e}")
-                continue
+                logger.error("Error retrieving file %s: %s", vs_file.id, e)
+                return None
+            return {
+                "id": file_obj.id,
+                "filename": file_obj.filename,
+                "bytes": file_obj.bytes,
+                "created_at": file_obj.created_at,
+                "status": vs_file.status,
+            }
+        
+        details = await asyncio.gather(*(_file_details(vs_file) for vs_file in vector_store_files.data))
+        files_data = [entry for entry in details if entry is not None]
         
         return {
             "files": files_data,
@@ -754,13 +417,17 @@ async def list_files() -> dict[str, Any]:
 
 
 @app.post("/api/files/upload")
-async def upload_file_to_knowledge_base(file: UploadFile = File(...)) -> dict[str, Any]:
+async def upload_file_to_knowledge_base(file: UploadFile = File(...), replace: bool = False) -> dict[str, Any]:
     """
     Upload a file to the OpenAI vector store for knowledge base search.
     Supports: PDF, DOCX, TXT, MD, CSV, PPTX, and more.
     
     This is different from chat attachments - these files are permanently added
     to the knowledge base and can be searched via file_search tool.
+
+    Identical content that's already in the knowledge base is not uploaded again
+    (see kb_manifest.py). With ?replace=true, older files with the same filename
+    are removed once the new one is added.
     """
     try:
         if not JASON_VECTOR_STORE_ID:
@@ -769,92 +436,166 @@ async def upload_file_to_knowledge_base(file: UploadFile = File(...)) -> dict[st
                 detail="Vector store not configured. Set JASON_VECTOR_STORE_ID environment variable."
             )
         
-        print(f"[Knowledge Base Upload] Starting upload: {file.filename}")
-        print(f"[Knowledge Base Upload] Content-Type: {file.content_type}")
+        logger.info("[Knowledge Base Upload] Starting upload: %s", file.filename)
+        logger.debug("[Knowledge Base Upload] Content-Type: %s", file.content_type)
         
         # Validate file type
-        allowed_extensions = {
-            '.pdf', '.txt', '.md', '.doc', '.docx', 
-            '.csv', '.xlsx', '.pptx',
-            '.c', '.cpp', '.cs', '.css', '.go', '.html', 
-            '.java', '.js', '.json', '.php', '.py', '.rb', 
-            '.sh', '.tex', '.ts', '.xml'
-        }
-        
         file_ext = os.path.splitext(file.filename or "")[1].lower()
-        if file_ext not in allowed_extensions:
+        if file_ext not in KB_ALLOWED_EXTENSIONS:
             raise HTTPException(
                 status_code=400,
-                detail=f"Unsupported file type: {file_ext}. Supported types: {', '.join(sorted(allowed_extensions))}"
+                detail=f"Unsupported file type: {file_ext}. Supported types: {', '.join(sorted(KB_ALLOWED_EXTENSIONS))}"
             )
         
         # Read file content
         content = await file.read()
         file_size_mb = len(content) / (1024 * 1024)
-        print(f"[Knowledge Base Upload] File size: {file_size_mb:.2f} MB")
+        logger.info("[Knowledge Base Upload] File size: %.2f MB", file_size_mb)
         
         # Check file size (OpenAI limit is typically 512MB for assistants)
-        if len(content) > 512 * 1024 * 1024:
+        if len(content) > KB_MAX_FILE_BYTES:
             raise HTTPException(
                 status_code=400,
                 detail="File size exceeds 512MB limit"
             )
         
-        # Create a temporary file to upload to OpenAI
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp:
-            tmp.write(content)
-            tmp_path = tmp.name
-        
-        try:
-            # Step 1: Upload file to OpenAI with purpose="assistants"
-            print(f"[Knowledge Base Upload] Uploading to OpenAI storage...")
-            with open(tmp_path, "rb") as f:
-                openai_file = openai_client.files.create(
-                    file=f,
+        openai_client = get_openai_client()
+        filename = file.filename or f"upload{file_ext}"
+
+        # 🗂️ Same bytes already in the knowledge base (or being uploaded)? Use that file (see kb_manifest.py)
+        digest = await content_hash(content) if KB_DEDUP_ENABLED else ""
+        existing = await kb_manifest.reserve(digest) if KB_DEDUP_ENABLED else None
+        if existing is not None:
+            logger.info(
+                "[Knowledge Base Upload] %s is identical to %s (%s), not uploading again",
+                filename, existing["file_id"], existing["filename"],
+            )
+            file_id, status = existing["file_id"], existing["status"]
+        else:
+            try:
+                # Step 1: Upload file to OpenAI with purpose="assistants"
+                logger.debug("[Knowledge Base Upload] Uploading to OpenAI storage...")
+                openai_file = await openai_client.files.create(
+                    file=(filename, content),
                     purpose="assistants"
                 )
+                
+                logger.debug("[Knowledge Base Upload] OpenAI file ID: %s", openai_file.id)
+                
+                # Step 2: Add file to vector store
+                logger.debug("[Knowledge Base Upload] Adding to vector store %s...", JASON_VECTOR_STORE_ID)
+                vector_store_file = await openai_client.vector_stores.files.create(
+                    vector_store_id=JASON_VECTOR_STORE_ID,
+                    file_id=openai_file.id
+                )
+            except BaseException:
+                if KB_DEDUP_ENABLED:
+                    kb_manifest.release(digest)
+                raise
+            if KB_DEDUP_ENABLED:
+                await kb_manifest.record(openai_file.id, digest, filename, len(content), vector_store_file.status)
             
-            print(f"[Knowledge Base Upload] OpenAI file ID: {openai_file.id}")
-            
-            # Step 2: Add file to vector store
-            print(f"[Knowledge Base Upload] Adding to vector store {JASON_VECTOR_STORE_ID}...")
-            vector_store_file = openai_client.beta.vector_stores.files.create(
-                vector_store_id=JASON_VECTOR_STORE_ID,
-                file_id=openai_file.id
+            logger.info(
+                "[Knowledge Base Upload] Added %s to vector store (status: %s)",
+                openai_file.id, vector_store_file.status,
             )
-            
-            print(f"[Knowledge Base Upload] Successfully added to vector store")
-            print(f"[Knowledge Base Upload] Vector store file status: {vector_store_file.status}")
-            
+            mark_knowledge_base_changed(f"uploaded {file.filename}")
+            # 📚 Keep the local BM25 mirror in step (text files now, documents once indexed)
+            await kb_mirror.add_upload(openai_file.id, filename, content)
+            file_id, status = openai_file.id, vector_store_file.status
+
+        # Step 3 (?replace=true): remove older versions of this filename
+        replaced: list[str] = []
+        if replace:
+            older = [older_id for older_id in await kb_manifest.files_named(filename) if older_id != file_id]
+            results = await asyncio.gather(
+                *(_delete_knowledge_base_file(older_id) for older_id in older), return_exceptions=True
+            )
+            for older_id, result in zip(older, results):
+                if isinstance(result, Exception):
+                    logger.error("[Knowledge Base Upload] Could not replace %s: %s", older_id, result)
+                else:
+                    replaced.append(older_id)
+            KB_REPLACED_FILES_TOTAL.inc(len(replaced))
+            if replaced:
+                logger.info("[Knowledge Base Upload] Replaced older versions of %s: %s", filename, replaced)
+
+        if existing is not None:
             return {
                 "success": True,
-                "file_id": openai_file.id,
-                "filename": file.filename,
+                "duplicate": True,
+                "file_id": file_id,
+                "filename": existing["filename"],
                 "bytes": len(content),
-                "status": vector_store_file.status,
+                "status": status,
                 "vector_store_id": JASON_VECTOR_STORE_ID,
-                "message": f"File '{file.filename}' uploaded successfully and is being indexed."
+                "replaced_file_ids": replaced,
+                "message": f"File '{file.filename}' is already in the knowledge base as '{existing['filename']}'."
             }
-            
-        finally:
-            # Clean up temp file
-            try:
-                os.unlink(tmp_path)
-            except Exception as e:
-                print(f"[Knowledge Base Upload] Warning: Failed to delete temp file: {e}")
+        return {
+            "success": True,
+            "duplicate": False,
+            "file_id": file_id,
+            "filename": file.filename,
+            "bytes": len(content),
+            "status": status,
+            "vector_store_id": JASON_VECTOR_STORE_ID,
+            "replaced_file_ids": replaced,
+            "message": f"File '{file.filename}' uploaded successfully and is being indexed."
+        }
     
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[Knowledge Base Upload] ERROR: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("[Knowledge Base Upload] ERROR: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to upload file to knowledge base: {str(e)}"
         )
 
 
+@app.post(BULK_UPLOAD_PATH)
+async def bulk_upload_to_knowledge_base(files: list[UploadFile] = File(...), wait: bool = False) -> StreamingResponse:
+    """
+    Upload many files to the knowledge base at once (see kb_bulk_upload.py).
+
+    Files are uploaded to OpenAI concurrently and attached with one vector store
+    file batch. Progress is streamed as NDJSON: an event per file, then the
+    batch, indexing progress (with ?wait=true) and totals with throughput.
+    """
+    if not JASON_VECTOR_STORE_ID:
+        raise HTTPException(
+            status_code=400,
+            detail="Vector store not configured. Set JASON_VECTOR_STORE_ID environment variable."
+        )
+    if len(files) > KB_BULK_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many files: at most {KB_BULK_MAX_FILES} per bulk upload"
+        )
+    # By now the form is parsed and spooled; this catches requests without a
+    # Content-Length (BulkUploadSizeLimit refuses the rest before they're read)
+    total_bytes = sum(file.size or 0 for file in files)
+    if total_bytes > KB_BULK_MAX_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Bulk upload is {total_bytes / 1_048_576:.1f}MB; at most {KB_BULK_MAX_BYTES / 1_048_576:.1f}MB per request"
+        )
+    # Read everything up front - the uploads are closed once this handler returns
+    contents = [(file.filename or "", await file.read()) for file in files]
+    logger.info("[KB Bulk Upload] Starting upload of %s files", len(contents))
+
+    async def events():
+        try:
+            async for event in bulk_upload(contents, wait=wait):
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            logger.exception("[KB Bulk Upload] ERROR: %s", e)
+            yield json.dumps({"event": "error", "detail": f"Bulk upload failed: {e}"}) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
 @app.options("/upload/{attachment_id}")
 async def upload_file_options(attachment_id: str):
     """Handle CORS preflight for Phase 2 file uploads."""
@@ -875,25 +616,29 @@ async def upload_file_bytes(attachment_id: str, file: UploadFile = File(...)):
     This is the upload_url returned by ChatKit's attachments.create.
     """
     try:
-        print(f"[Phase 2 Upload] Receiving file bytes for attachment: {attachment_id}")
-        print(f"[Phase 2 Upload] Filename: {file.filename}, Content-Type: {file.content_type}")
+        logger.debug("[Phase 2 Upload] Receiving file bytes for attachment: %s", attachment_id)
+        logger.debug("[Phase 2 Upload] Filename: %s, Content-Type: %s", file.filename, file.content_type)
         
         # Read file content
         content = await file.read()
-        print(f"[Phase 2 Upload] File size: {len(content)} bytes")
+        logger.debug("[Phase 2 Upload] File size: %s bytes", len(content))
         
         # Get the attachment from store
+        jason_server = await run_in_threadpool(get_server)
         if not hasattr(jason_server.store, '_attachment_data'):
             jason_server.store._attachment_data = {}
         
         attachment_data = jason_server.store._attachment_data.get(attachment_id)
         if not attachment_data:
-            print(f"[Phase 2 Upload] ERROR: Attachment {attachment_id} not found in store")
+            logger.error("[Phase 2 Upload] ERROR: Attachment %s not found in store", attachment_id)
             raise HTTPException(status_code=404, detail=f"Attachment {attachment_id} not found")
         
         # Update with actual file data
         attachment_data["data"] = content
         attachment_data["size"] = len(content)
+        attachment_data.pop("normalized", None)  # derived from the previous bytes
+        attachment_data.pop("openai_file_id", None)
+        attachment_data.pop("document_file_id", None)
         
         # Also update the Attachment object's size_bytes (best practice per docs)
         # Pydantic models are immutable, so we create a new instance with updated size
@@ -903,7 +648,10 @@ async def upload_file_bytes(attachment_id: str, file: UploadFile = File(...)):
             updated_attachment = attachment.model_copy(update={"size_bytes": len(content)})
             jason_server.store._attachments[attachment_id] = updated_attachment
         
-        print(f"[Phase 2 Upload] Successfully stored {len(content)} bytes for {attachment_id}")
+        logger.info("[Phase 2 Upload] Successfully stored %s bytes for %s", len(content), attachment_id)
+
+        # ⚡ Start converting it to model input now, so the message doesn't wait
+        jason_server.attachment_pipeline.start(attachment_id)
         
         # Return 200 OK with no body (ChatKit just needs success confirmation)
         return Response(status_code=200)
@@ -911,9 +659,7 @@ async def upload_file_bytes(attachment_id: str, file: UploadFile = File(...)):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[Phase 2 Upload] ERROR: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("[Phase 2 Upload] ERROR: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to upload file: {str(e)}")
 
 
@@ -923,18 +669,19 @@ async def get_attachment(attachment_id: str) -> Response:
     Retrieve an uploaded attachment by ID.
     """
     try:
-        print(f"[Get Attachment] Requesting attachment: {attachment_id}")
+        logger.debug("[Get Attachment] Requesting attachment: %s", attachment_id)
         
+        jason_server = await run_in_threadpool(get_server)
         if not hasattr(jason_server.store, '_attachment_data'):
-            print(f"[Get Attachment] No attachments stored")
+            logger.warning("[Get Attachment] No attachments stored")
             raise HTTPException(status_code=404, detail="Attachment not found")
         
         attachment_data = jason_server.store._attachment_data.get(attachment_id)
         if not attachment_data:
-            print(f"[Get Attachment] Attachment {attachment_id} not found in store")
+            logger.warning("[Get Attachment] Attachment %s not found in store", attachment_id)
             raise HTTPException(status_code=404, detail=f"Attachment {attachment_id} not found")
         
-        print(f"[Get Attachment] Returning {attachment_data['mime_type']} file: {attachment_data['name']}")
+        logger.debug("[Get Attachment] Returning %s file: %s", attachment_data['mime_type'], attachment_data['name'])
         
         return Response(
             content=attachment_data["data"],
@@ -949,12 +696,30 @@ async def get_attachment(attachment_id: str) -> Response:
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[Get Attachment] ERROR: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("[Get Attachment] ERROR: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to retrieve attachment: {str(e)}")
 
 
+async def _delete_knowledge_base_file(file_id: str) -> None:
+    """Remove a file from the vector store, OpenAI storage and the local indexes."""
+    openai_client = get_openai_client()
+
+    # Delete from vector store
+    try:
+        await openai_client.vector_stores.files.delete(
+            vector_store_id=JASON_VECTOR_STORE_ID,
+            file_id=file_id
+        )
+    except Exception as e:
+        logger.error("Error deleting file from vector store: %s", e)
+    
+    # Delete from OpenAI
+    await openai_client.files.delete(file_id)
+    mark_knowledge_base_changed(f"deleted {file_id}")
+    await kb_mirror.remove(file_id)
+    await kb_manifest.forget(file_id)
+
+
 @app.delete("/api/files/{file_id}")
 async def delete_file(file_id: str) -> dict[str, str]:
     """
@@ -967,17 +732,7 @@ async def delete_file(file_id: str) -> dict[str, str]:
                 detail="Vector store ID not configured."
             )
         
-        # Delete from vector store
-        try:
-            openai_client.beta.vector_stores.files.delete(
-                vector_store_id=JASON_VECTOR_STORE_ID,
-                file_id=file_id
-            )
-        except Exception as e:
-            print(f"Error deleting file from vector store: {e}")
-        
-        # Delete from OpenAI
-        openai_client.files.delete(file_id)
+        await _delete_knowledge_base_file(file_id)
         
         return {"status": "deleted", "file_id": file_id}
     except Exception as e:
@@ -993,28 +748,17 @@ async def transcribe_audio(file: UploadFile = File(...)) -> dict[str, str]:
         # Read audio file
         content = await file.read()
         
-        # Create temp file with correct extension
-        suffix = f"_{file.filename}" if file.filename else ".mp3"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            tmp.write(content)
-            tmp_path = tmp.name
+        # Transcribe with Whisper (filename carries the extension Whisper uses to detect format)
+        transcript = await get_openai_client().audio.transcriptions.create(
+            model="whisper-1",
+            file=(file.filename or "audio.mp3", content),
+            response_format="text"
+        )
         
-        try:
-            # Transcribe with Whisper
-            with open(tmp_path, "rb") as audio_file:
-                transcript = openai_client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    response_format="text"
-                )
-            
-            return {
-                "text": transcript,
-                "status": "success"
-            }
-        finally:
-            # Clean up temp file
-            os.unlink(tmp_path)
+        return {
+            "text": transcript,
+            "status": "success"
+        }
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to transcribe audio: {str(e)}")
@@ -1034,7 +778,7 @@ async def text_to_speech(request: Request) -> Response:
             raise HTTPException(status_code=400, detail="Text is required")
         
         # Generate speech
-        response = openai_client.audio.speech.create(
+        response = await get_openai_client().audio.speech.create(
             model="tts-1",  # or tts-1-hd for higher quality
             voice=voice,
             input=text
@@ -1065,9 +809,9 @@ async def handle_widget_action(request: Request) -> dict[str, str]:
         widget_item_id = body.get("widgetItemId")
         session_id = body.get("sessionId")
         
-        print(f"[Widget Action] Session: {session_id}, Widget: {widget_item_id}")
-        print(f"[Widget Action] Action type: {action.get('type')}")
-        print(f"[Widget Action] Payload: {action.get('payload')}")
+        logger.info("[Widget Action] Session: %s, Widget: %s", session_id, widget_item_id)
+        logger.debug("[Widget Action] Action type: %s", action.get('type'))
+        logger.debug("[Widget Action] Payload: %s", action.get('payload'))
         
         # Handle different action types
         action_type = action.get("type")
@@ -1086,7 +830,7 @@ async def handle_widget_action(request: Request) -> dict[str, str]:
         }
         
     except Exception as e:
-        print(f"[Widget Action] Error: {e}")
+        logger.error("[Widget Action] Error: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to handle widget action: {str(e)}")
 
 
@@ -1097,8 +841,12 @@ async def get_thread_first_message(
     server: JasonCoachingServer = Depends(get_server)
 ) -> JSONResponse:
     """Get the first user message from a thread for title generation."""
+    from chatkit.types import UserMessageItem
+
+    from .chatkit_server import _user_message_text
+
     try:
-        print(f"[First Message] Attempting to load thread: {thread_id}")
+        logger.debug("[First Message] Attempting to load thread: %s", thread_id)
         # Create context with request (needed for session-based store)
         context = {"request": request}
         
@@ -1106,38 +854,38 @@ async def get_thread_first_message(
         try:
             thread_metadata = await server.store.load_thread(thread_id, context)
         except Exception as e:
-            print(f"[First Message] Thread load failed: {e}")
+            logger.warning("[First Message] Thread load failed: %s", e)
             return JSONResponse({"message": None}, status_code=404)
         
         if not thread_metadata:
-            print(f"[First Message] Thread not found: {thread_id}")
+            logger.warning("[First Message] Thread not found: %s", thread_id)
             return JSONResponse({"message": None}, status_code=404)
         
-        print(f"[First Message] Thread metadata type: {type(thread_metadata)}")
-        print(f"[First Message] Thread metadata: {thread_metadata}")
+        logger.debug("[First Message] Thread metadata type: %s", type(thread_metadata))
+        logger.debug("[First Message] Thread metadata: %s", thread_metadata)
         
         # Load thread items from the store
         items_page = await server.store.load_thread_items(thread_id, after=None, limit=10, order="asc", context=context)
         items = items_page.data
         
-        print(f"[First Message] Found {len(items)} items in thread")
+        logger.debug("[First Message] Found %s items in thread", len(items))
         
         # Find first user message
         for i, item in enumerate(items):
-            print(f"[First Message] Item {i}: type={type(item).__name__}, item={item}")
+            logger.debug("[First Message] Item %s: type=%s, item=%s", i, type(item).__name__, item)
             
             # Check if it's a UserMessageItem
             if isinstance(item, UserMessageItem):
                 # Extract text using helper function
                 text = _user_message_text(item)
                 if text:
-                    print(f"[First Message] Found user message (UserMessageItem): {text[:100]}...")
+                    logger.debug("[First Message] Found user message (UserMessageItem): %s...", text[:100])
                     return JSONResponse({"message": text})
             
             # Also try dict format
             if isinstance(item, dict):
                 item_type = item.get('type')
-                print(f"[First Message] Dict item type: {item_type}")
+                logger.debug("[First Message] Dict item type: %s", item_type)
                 if item_type == 'user_message':
                     # Try to extract text from content
                     content = item.get('content', [])
@@ -1145,12 +893,12 @@ async def get_thread_first_message(
                         if isinstance(part, dict):
                             text = part.get('text')
                             if text:
-                                print(f"[First Message] Found user message (dict): {text[:100]}...")
+                                logger.debug("[First Message] Found user message (dict): %s...", text[:100])
                                 return JSONResponse({"message": text})
             
             # Try hasattr approach for any object with type attribute
             if hasattr(item, 'type'):
-                print(f"[First Message] Item has type attribute: {item.type}")
+                logger.debug("[First Message] Item has type attribute: %s", item.type)
                 if getattr(item, 'type', None) == 'user_message':
                     if hasattr(item, 'content'):
                         # Try to extract text
@@ -1158,13 +906,11 @@ async def get_thread_first_message(
                         for part in content:
                             text = getattr(part, 'text', None)
                             if text:
-                                print(f"[First Message] Found user message (attr): {text[:100]}...")
+                                logger.debug("[First Message] Found user message (attr): %s...", text[:100])
                                 return JSONResponse({"message": text})
         
-        print(f"[First Message] No user message found in thread {thread_id}")
+        logger.debug("[First Message] No user message found in thread %s", thread_id)
         return JSONResponse({"message": None})
     except Exception as e:
-        print(f"[First Message] Error fetching first message for thread {thread_id}: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("[First Message] Error fetching first message for thread %s: %s", thread_id, e)
         return JSONResponse({"message": None}, status_code=500)
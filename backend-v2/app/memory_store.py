@@ -1,8 +1,9 @@
 from __future__ import annotations
 
+import logging
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Any
+from typing import Any, Awaitable, Callable
 
 from chatkit.store import NotFoundError, Store
 from chatkit.types import (
@@ -15,6 +16,8 @@ from chatkit.types import (
     UserMessageItem,
 )
 
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class _ThreadState:
@@ -30,6 +33,8 @@ class MemoryStore(Store[dict[str, Any]]):
         self._sessions: dict[str, dict[str, _ThreadState]] = {}
         # Store attachments by attachment_id -> Attachment
         self._attachments: dict[str, Attachment] = {}
+        # Called with (attachment_id, attachment data) when an attachment is deleted
+        self.on_attachment_deleted: Callable[[str, dict[str, Any]], Awaitable[None]] | None = None
     
     def _get_session_id(self, context: dict[str, Any]) -> str:
         """Extract session ID from query parameters."""
@@ -190,8 +195,8 @@ class MemoryStore(Store[dict[str, Any]]):
         # Generate attachment ID
         attachment_id = f"att_{secrets.token_urlsafe(16)}"
         
-        print(f"[Phase 1 Create] Creating attachment: {attachment_id}")
-        print(f"[Phase 1 Create] Name: {input.name}, MIME type: {input.mime_type}")
+        logger.debug("[Phase 1 Create] Creating attachment: %s", attachment_id)
+        logger.debug("[Phase 1 Create] Name: %s, MIME type: %s", input.name, input.mime_type)
         
         # Store initial attachment metadata (without file data yet)
         if not hasattr(self, '_attachment_data'):
@@ -233,7 +238,7 @@ class MemoryStore(Store[dict[str, Any]]):
                 upload_url=upload_url,
             )
         
-        print(f"[Phase 1 Create] Returning {type(attachment).__name__} with upload_url: {upload_url}")
+        logger.debug("[Phase 1 Create] Returning %s with upload_url: %s", type(attachment).__name__, upload_url)
         
         # Store the attachment object so load_attachment can find it later
         self._attachments[attachment_id] = attachment
@@ -261,4 +266,8 @@ class MemoryStore(Store[dict[str, Any]]):
     async def delete_attachment(self, attachment_id: str, context: dict[str, Any]) -> None:
         """Delete attachment from memory."""
         self._attachments.pop(attachment_id, None)
+        # ChatKit calls this on both the attachment store and the store (the same object here)
+        attachment_data = getattr(self, "_attachment_data", {}).pop(attachment_id, None)
+        if attachment_data is not None and self.on_attachment_deleted is not None:
+            await self.on_attachment_deleted(attachment_id, attachment_data)
 
@@ -0,0 +1,440 @@
+"""
+In-process metrics registry with Prometheus text exposition.
+
+Zero-dependency counters, gauges and histograms for the streaming paths
+(ChatKit `respond` and the AI SDK `handle_chat`) and the agent tools.
+Scraped via GET /metrics.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Iterator
+
+# Latency buckets in seconds (TTFT, tool calls and whole streams)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0, 60.0, 120.0)
+# Inter-token gaps are much shorter than TTFT
+INTER_TOKEN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+TOKENS_PER_SECOND_BUCKETS = (5, 10, 20, 30, 50, 75, 100, 150, 250)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    type_name = "untyped"
+
+    def __init__(self, name: str, description: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+    @abstractmethod
+    def _samples(self) -> list[str]:
+        """Exposition lines for this metric's current values."""
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, description: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, description, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """Gauge that is either set directly or computed at scrape time via a callback."""
+
+    type_name = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labelnames: tuple[str, ...] = (),
+        callback: Callable[[], float] | None = None,
+    ) -> None:
+        super().__init__(name, description, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, callback: Callable[[], float]) -> None:
+        self._callback = callback
+
+    def value(self, **labels: str) -> float:
+        if self._callback is not None:
+            return float(self._callback())
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> list[str]:
+        if self._callback is not None:
+            try:
+                return [f"{self.name} {_format_value(float(self._callback()))}"]
+            except Exception:
+                return []
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # key -> (bucket counts, sum, count)
+        self._values: dict[tuple[str, ...], tuple[list[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[idx] += 1
+                    break
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, (list(c), s, n)) for key, (c, s, n) in self._values.items())
+        lines: list[str] = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric and renders them in Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, description: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, description, labelnames))  # type: ignore[return-value]
+
+    def gauge(
+        self,
+        name: str,
+        description: str,
+        labelnames: tuple[str, ...] = (),
+        callback: Callable[[], float] | None = None,
+    ) -> Gauge:
+        return self._register(Gauge(name, description, labelnames, callback))  # type: ignore[return-value]
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, description, labelnames, buckets))  # type: ignore[return-value]
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: list[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# ============================================================================
+# STREAMING METRICS (shared by ChatKit and AI SDK paths, labelled by endpoint)
+# ============================================================================
+
+TTFT_SECONDS = REGISTRY.histogram(
+    "jason_ttft_seconds",
+    "Time from request start to first streamed text token.",
+    ("endpoint",),
+)
+TTFT_BY_WARMTH_SECONDS = REGISTRY.histogram(
+    "jason_ttft_by_warmth_seconds",
+    "TTFT split by whether the worker was warm when the stream started.",
+    ("endpoint", "warmth"),
+)
+INTER_TOKEN_SECONDS = REGISTRY.histogram(
+    "jason_inter_token_seconds",
+    "Gap between consecutive streamed text deltas.",
+    ("endpoint",),
+    buckets=INTER_TOKEN_BUCKETS,
+)
+TOKENS_PER_SECOND = REGISTRY.histogram(
+    "jason_tokens_per_second",
+    "Streamed text deltas per second after the first token.",
+    ("endpoint",),
+    buckets=TOKENS_PER_SECOND_BUCKETS,
+)
+STREAM_DURATION_SECONDS = REGISTRY.histogram(
+    "jason_stream_duration_seconds",
+    "Total duration of a streamed response.",
+    ("endpoint",),
+)
+ACTIVE_STREAMS = REGISTRY.gauge(
+    "jason_active_streams",
+    "Streams currently in flight.",
+    ("endpoint",),
+)
+REQUESTS_TOTAL = REGISTRY.counter(
+    "jason_requests_total",
+    "Chat requests received.",
+    ("endpoint",),
+)
+ERRORS_TOTAL = REGISTRY.counter(
+    "jason_errors_total",
+    "Errors raised while handling requests, by stage.",
+    ("endpoint", "stage"),
+)
+
+# A worker is "warm" once startup warm-up finished or any stream has already
+# produced a token; streams started before that are recorded as cold
+_process_warm = False
+
+
+def mark_process_warm() -> None:
+    global _process_warm
+    _process_warm = True
+
+
+# ============================================================================
+# TOOL METRICS
+# ============================================================================
+
+TOOL_DURATION_SECONDS = REGISTRY.histogram(
+    "jason_tool_duration_seconds",
+    "Tool call duration (hosted tools measured from call to output event).",
+    ("tool",),
+)
+TOOL_CALLS_TOTAL = REGISTRY.counter(
+    "jason_tool_calls_total",
+    "Tool calls by tool and outcome.",
+    ("tool", "outcome"),
+)
+
+
+class StreamTimer:
+    """
+    Tracks per-stream latency: TTFT, inter-token gaps and tokens/sec.
+
+    Create one per streamed response, call `token()` for every text delta
+    sent to the client and `finish()` once the stream ends (always, even on
+    error) so the active-stream gauge stays balanced.
+    """
+
+    def __init__(self, endpoint: str, start_time: float | None = None) -> None:
+        self.endpoint = endpoint
+        self.start = start_time if start_time is not None else time.perf_counter()
+        self.first_token_at: float | None = None
+        self.last_token_at: float | None = None
+        self.token_count = 0
+        self.warmth = "warm" if _process_warm else "cold"
+        self._finished = False
+        REQUESTS_TOTAL.inc(endpoint=endpoint)
+        ACTIVE_STREAMS.inc(endpoint=endpoint)
+
+    @property
+    def ttft(self) -> float | None:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.start
+
+    def token(self) -> None:
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+            TTFT_SECONDS.observe(now - self.start, endpoint=self.endpoint)
+            TTFT_BY_WARMTH_SECONDS.observe(now - self.start, endpoint=self.endpoint, warmth=self.warmth)
+            mark_process_warm()
+        elif self.last_token_at is not None:
+            INTER_TOKEN_SECONDS.observe(now - self.last_token_at, endpoint=self.endpoint)
+        self.last_token_at = now
+        self.token_count += 1
+
+    def error(self, stage: str) -> None:
+        ERRORS_TOTAL.inc(endpoint=self.endpoint, stage=stage)
+
+    def finish(self) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        now = time.perf_counter()
+        ACTIVE_STREAMS.dec(endpoint=self.endpoint)
+        STREAM_DURATION_SECONDS.observe(now - self.start, endpoint=self.endpoint)
+        if self.first_token_at is not None and self.token_count > 1:
+            elapsed = now - self.first_token_at
+            if elapsed > 0:
+                TOKENS_PER_SECOND.observe(self.token_count / elapsed, endpoint=self.endpoint)
+
+
+HOSTED_TOOL_EVENTS = {
+    "response.file_search_call.in_progress": ("file_search", "start"),
+    "response.file_search_call.completed": ("file_search", "stop"),
+    "response.web_search_call.in_progress": ("web_search", "start"),
+    "response.web_search_call.completed": ("web_search", "stop"),
+}
+
+
+class ToolTimer:
+    """
+    Times hosted tools (file_search, web_search) from the Responses API
+    `*.in_progress` / `*.completed` stream events.
+
+    Function tools such as `transcribe_instagram_reel` are timed inside the
+    tool itself via `TOOL_DURATION_SECONDS.time(...)`.
+    """
+
+    def __init__(self, on_complete: Callable[[str, float, float], None] | None = None) -> None:
+        self._started: dict[str, tuple[str, float]] = {}
+        # Called with (tool_name, start, end) perf_counter timestamps, e.g. to add a span
+        self._on_complete = on_complete
+
+    def observe(self, event: object) -> None:
+        if getattr(event, "type", None) != "raw_response_event":
+            return
+        data = getattr(event, "data", None)
+        mapping = HOSTED_TOOL_EVENTS.get(getattr(data, "type", None) or "")
+        if mapping is None:
+            return
+        tool_name, action = mapping
+        item_id = getattr(data, "item_id", None) or tool_name
+        if action == "start":
+            self._started.setdefault(item_id, (tool_name, time.perf_counter()))
+            return
+        started = self._started.pop(item_id, None)
+        if started is not None:
+            end = time.perf_counter()
+            TOOL_DURATION_SECONDS.observe(end - started[1], tool=tool_name)
+            TOOL_CALLS_TOTAL.inc(tool=tool_name, outcome="ok")
+            if self._on_complete is not None:
+                self._on_complete(tool_name, started[1], end)
+
+    def abandon(self) -> None:
+        """Record calls that never completed (stream ended or errored mid-search)."""
+        for tool_name, _ in self._started.values():
+            TOOL_CALLS_TOTAL.inc(tool=tool_name, outcome="abandoned")
+        self._started.clear()
+
+
+class ObservedRun:
+    """
+    Proxy around `RunResultStreaming` that lets us watch raw events while
+    ChatKit's `stream_agent_response` consumes them.
+    """
+
+    def __init__(self, result: Any, observer: Callable[[Any], None]) -> None:
+        self._result = result
+        self._observer = observer
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._result, name)
+
+    async def stream_events(self) -> AsyncIterator[Any]:
+        async for event in self._result.stream_events():
+            try:
+                self._observer(event)
+            except Exception:
+                pass
+            yield event
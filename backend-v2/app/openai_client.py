@@ -0,0 +1,61 @@
+"""
+Shared AsyncOpenAI client for direct API calls (files, vector stores, audio)
+and for the Agents SDK's model calls.
+
+Endpoints must never call the synchronous client from `async def` handlers:
+uploads, Whisper and TTS would block the event loop and stall every
+streaming chat on the worker. Set OPENAI_BASE_URL to point at a local
+stand-in API for testing.
+
+The client sits on the shared connection pool from `http_pool.py`. `openai`
+itself is imported on first use to keep it off the startup path. Shutdown
+closes both (`close_openai_client`); they're recreated on next use, so a
+second lifespan (TestClient, reload) gets a working client - and the Agents
+SDK is re-pointed at it.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING
+
+from .http_pool import close_http_client, get_http_client
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+_client: AsyncOpenAI | None = None
+_agents_default = False
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """Return the process-wide AsyncOpenAI client (created on first use)."""
+    global _client
+    if _client is None:
+        from openai import AsyncOpenAI
+
+        _client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=get_http_client(),
+        )
+        if _agents_default:
+            from agents import set_default_openai_client
+
+            set_default_openai_client(_client)
+    return _client
+
+
+def use_for_agents() -> None:
+    """Route Agents SDK model calls through the shared client (and through its replacements)."""
+    global _agents_default
+    _agents_default = True
+    from agents import set_default_openai_client
+
+    set_default_openai_client(get_openai_client())
+
+
+async def close_openai_client() -> None:
+    """Shutdown: drop the client and close the pool under it (both are recreated on next use)."""
+    global _client
+    _client = None
+    await close_http_client()
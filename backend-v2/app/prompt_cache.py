@@ -0,0 +1,74 @@
+"""
+Prompt-cache-aware request shaping and cache hit reporting.
+
+OpenAI prompt caching matches an exact token prefix (1024+ tokens). Each
+request is laid out static-first: tool schemas, then `JASON_INSTRUCTIONS`
+(a constant string - nothing per-request is formatted into it), then the
+thread's session history, then the new message. `prompt_cache_key` pins a
+thread's requests to the same cache shard so the instructions *and* the
+growing history prefix are reused turn over turn.
+
+Usage reported by the API (`input_tokens_details.cached_tokens`) is recorded
+per request as cached vs uncached input tokens.
+
+Environment:
+- PROMPT_CACHE_KEY_ENABLED: "true" (default) sends a per-thread prompt_cache_key
+- PROMPT_CACHE_KEY_PREFIX: namespace for the keys (default "jason")
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import Any
+
+from .metrics import REGISTRY
+
+PROMPT_CACHE_KEY_ENABLED = os.getenv("PROMPT_CACHE_KEY_ENABLED", "true").lower() == "true"
+PROMPT_CACHE_KEY_PREFIX = os.getenv("PROMPT_CACHE_KEY_PREFIX", "jason")
+
+INPUT_TOKENS_TOTAL = REGISTRY.counter(
+    "jason_input_tokens_total",
+    "Model input tokens, split by whether they were served from the prompt cache.",
+    ("endpoint", "cache"),
+)
+PROMPT_CACHE_HIT_RATIO = REGISTRY.histogram(
+    "jason_prompt_cache_hit_ratio",
+    "Fraction of a request's input tokens served from the prompt cache.",
+    ("endpoint",),
+    buckets=(0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 1.0),
+)
+
+
+def prompt_cache_key(thread_id: str) -> str:
+    """Stable, bounded-length cache key for a thread."""
+    digest = hashlib.sha256(thread_id.encode("utf-8")).hexdigest()[:32]
+    return f"{PROMPT_CACHE_KEY_PREFIX}:{digest}"
+
+
+def prompt_cache_args(thread_id: str) -> dict[str, Any]:
+    """`ModelSettings.extra_args` carrying the thread's prompt_cache_key."""
+    if not PROMPT_CACHE_KEY_ENABLED:
+        return {}
+    return {"prompt_cache_key": prompt_cache_key(thread_id)}
+
+
+def record_prompt_usage(endpoint: str, usage: Any) -> dict[str, int] | None:
+    """
+    Record cached vs uncached input tokens from an Agents SDK `Usage`
+    (`result.context_wrapper.usage`, summed over the run's model calls).
+    Returns the counts for the request trace, or None if nothing was reported.
+    """
+    input_tokens = getattr(usage, "input_tokens", 0) or 0
+    if not input_tokens:
+        return None
+    details = getattr(usage, "input_tokens_details", None)
+    cached = min(getattr(details, "cached_tokens", 0) or 0, input_tokens)
+    INPUT_TOKENS_TOTAL.inc(cached, endpoint=endpoint, cache="cached")
+    INPUT_TOKENS_TOTAL.inc(input_tokens - cached, endpoint=endpoint, cache="uncached")
+    PROMPT_CACHE_HIT_RATIO.observe(cached / input_tokens, endpoint=endpoint)
+    return {
+        "input_tokens": input_tokens,
+        "cached_input_tokens": cached,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+    }
@@ -0,0 +1,396 @@
+"""
+Response cache for frequently asked first questions.
+
+A lot of threads open with the same handful of questions ("What are the best
+hooks for Instagram reels?", "How do I grow on Instagram?"). With the cache
+on, the answer to a first-turn, attachment-free question is kept and replayed
+for later near-identical first questions instead of running the agent again.
+
+Matching: the question is normalized (case, punctuation, whitespace) and
+looked up exactly, then fuzzily - a MinHash signature over character
+4-shingles, bucketed with LSH bands, with the estimated Jaccard similarity
+of the best candidate required to reach RESPONSE_CACHE_SIMILARITY. Shingle
+similarity can't tell "price a 5k brand deal" from "...50k..." (0.81), so a
+fuzzy candidate must also have exactly the same numbers, and every content
+word that differs must be a near-spelling (typo, plural) of one in the other
+question - "reels" vs "shorts" is a different question, not a typo.
+
+What is cached: only the first turn of a thread (the session has no history
+yet), no attachments, no links, not small talk, and only answers that didn't
+use web_search or a function tool (those depend on live data or the link).
+
+Invalidation: entries expire after RESPONSE_CACHE_TTL_SECONDS and are dropped
+when the knowledge base changes (see `knowledge_base_generation()`).
+
+A hit is replayed through the normal stream encoders: `CachedRun` stands in
+for the Agents SDK's `RunResultStreaming` and emits the same raw Responses
+events a live run would, so ChatKit and the AI SDK endpoint need no special
+case. The turn is still written to the thread's session memory.
+
+Environment:
+- RESPONSE_CACHE_ENABLED: "false" (default) / "true"
+- RESPONSE_CACHE_TTL_SECONDS: entry lifetime (default 21600 = 6h)
+- RESPONSE_CACHE_SIMILARITY: minimum estimated Jaccard similarity (default 0.8)
+- RESPONSE_CACHE_MAX_ENTRIES: LRU capacity (default 1000)
+- RESPONSE_CACHE_MAX_CHARS: longer questions are never cached (default 300)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import re
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Any, AsyncIterator
+
+from agents import RawResponsesStreamEvent, RunContextWrapper
+from openai.types.responses import (
+    ResponseContentPartAddedEvent,
+    ResponseOutputItemAddedEvent,
+    ResponseOutputItemDoneEvent,
+    ResponseOutputMessage,
+    ResponseOutputText,
+    ResponseTextDeltaEvent,
+    ResponseTextDoneEvent,
+)
+
+from .knowledge_base import knowledge_base_generation
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "21600"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.8"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_MAX_CHARS = int(os.getenv("RESPONSE_CACHE_MAX_CHARS", "300"))
+
+# MinHash: 64 permutations split into 16 LSH bands of 4 rows
+_NUM_PERM = 64
+_BANDS = 16
+_ROWS = _NUM_PERM // _BANDS
+_SHINGLE = 4
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x4A61736F6E)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(_NUM_PERM)]
+
+# Words per streamed delta when replaying
+_REPLAY_WORDS = 4
+
+# Differing words at least this similar (difflib ratio) count as the same word
+_WORD_SIMILARITY = 0.8
+_NUMBER_RE = re.compile(r"^(\d+)([km]?)$")
+_MULTIPLIERS = {"": 1, "k": 1_000, "m": 1_000_000}
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "can", "do", "does", "for", "from", "how", "i", "if",
+    "in", "is", "it", "me", "my", "of", "on", "or", "should", "so", "that", "the", "to", "what",
+    "when", "where", "which", "why", "with", "you", "your",
+}
+
+_URL_RE = re.compile(r"https?://\S+|www\.\S+", re.IGNORECASE)
+_NON_WORD_RE = re.compile(r"[^\w]+")
+# Tool calls that make an answer depend on live data or the message's link
+_LIVE_TOOL_TYPES = {"web_search_call", "function_call"}
+
+RESPONSE_CACHE_LOOKUPS_TOTAL = REGISTRY.counter(
+    "jason_response_cache_lookups_total",
+    "First-turn response cache lookups by result (hit / miss / stale).",
+    ("endpoint", "result"),
+)
+RESPONSE_CACHE_STORES_TOTAL = REGISTRY.counter(
+    "jason_response_cache_stores_total",
+    "Answers added to the response cache.",
+    ("endpoint",),
+)
+RESPONSE_CACHE_SIMILARITY_HIST = REGISTRY.histogram(
+    "jason_response_cache_similarity",
+    "Estimated similarity between a question and the cached question it hit.",
+    ("endpoint",),
+    buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 1.0),
+)
+REGISTRY.gauge(
+    "jason_response_cache_entries",
+    "Answers currently held in the response cache.",
+    callback=lambda: len(response_cache),
+)
+
+
+def normalize_question(text: str) -> str:
+    """Case-, punctuation- and whitespace-insensitive form of a question."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return " ".join(_NON_WORD_RE.sub(" ", text).split())
+
+
+def _shingles(normalized: str) -> set[str]:
+    padded = f" {normalized} "
+    if len(padded) <= _SHINGLE:
+        return {padded}
+    return {padded[i:i + _SHINGLE] for i in range(len(padded) - _SHINGLE + 1)}
+
+
+def minhash(normalized: str) -> tuple[int, ...]:
+    """MinHash signature of a normalized question's character shingles."""
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+        for shingle in _shingles(normalized)
+    ]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS)
+
+
+def _similarity(left: tuple[int, ...], right: tuple[int, ...]) -> float:
+    return sum(1 for a, b in zip(left, right) if a == b) / _NUM_PERM
+
+
+def _numbers(normalized: str) -> list[str]:
+    """Number tokens, with k/m suffixes expanded ("5k" -> "5000")."""
+    numbers = []
+    for token in normalized.split():
+        if not any(char.isdigit() for char in token):
+            continue
+        match = _NUMBER_RE.match(token)
+        numbers.append(str(int(match.group(1)) * _MULTIPLIERS[match.group(2)]) if match else token)
+    return sorted(numbers)
+
+
+def _content_words(normalized: str) -> set[str]:
+    return {
+        token for token in normalized.split()
+        if token not in _STOPWORDS and not any(char.isdigit() for char in token)
+    }
+
+
+def same_details(left: str, right: str) -> bool:
+    """Whether two normalized questions agree on numbers and content words (up to typos)."""
+    if _numbers(left) != _numbers(right):
+        return False
+    left_words, right_words = _content_words(left), _content_words(right)
+    left_only, right_only = left_words - right_words, right_words - left_words
+    for word, others in [(word, right_only) for word in left_only] + [(word, left_only) for word in right_only]:
+        if not any(SequenceMatcher(None, word, other).ratio() >= _WORD_SIMILARITY for other in others):
+            return False
+    return True
+
+
+def _bands(signature: tuple[int, ...]) -> list[tuple[int, tuple[int, ...]]]:
+    return [(band, signature[band * _ROWS:(band + 1) * _ROWS]) for band in range(_BANDS)]
+
+
+@dataclass
+class CachedAnswer:
+    key: str  # normalized question
+    question: str
+    answer: str
+    signature: tuple[int, ...]
+    created_at: float = field(default_factory=time.time)
+    kb_generation: int = field(default_factory=knowledge_base_generation)
+    hits: int = 0
+
+    def fresh(self) -> bool:
+        return (
+            time.time() - self.created_at < RESPONSE_CACHE_TTL_SECONDS
+            and self.kb_generation == knowledge_base_generation()
+        )
+
+
+class ResponseCache:
+    """In-process LRU of answers, indexed by exact key and MinHash LSH bands."""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CachedAnswer] = OrderedDict()
+        self._buckets: dict[tuple[int, tuple[int, ...]], set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, question: str) -> tuple[CachedAnswer | None, float, bool]:
+        """Best fresh match as (entry, similarity, stale_dropped)."""
+        key = normalize_question(question)
+        candidates: set[str] = {key} if key in self._entries else set()
+        signature = minhash(key)
+        for band in _bands(signature):
+            candidates |= self._buckets.get(band, set())
+
+        best: CachedAnswer | None = None
+        best_score = 0.0
+        stale = False
+        for candidate in candidates:
+            entry = self._entries.get(candidate)
+            if entry is None:
+                continue
+            if not entry.fresh():
+                self._remove(candidate)
+                stale = True
+                continue
+            if candidate != key and not same_details(key, candidate):
+                continue
+            score = 1.0 if candidate == key else _similarity(signature, entry.signature)
+            if score > best_score:
+                best, best_score = entry, score
+
+        if best is None or best_score < RESPONSE_CACHE_SIMILARITY:
+            return None, best_score, stale
+        best.hits += 1
+        self._entries.move_to_end(best.key)
+        return best, best_score, stale
+
+    def store(self, question: str, answer: str) -> CachedAnswer:
+        key = normalize_question(question)
+        self._remove(key)
+        entry = CachedAnswer(key=key, question=question, answer=answer, signature=minhash(key))
+        self._entries[key] = entry
+        for band in _bands(entry.signature):
+            self._buckets.setdefault(band, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+        return entry
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._buckets.clear()
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band in _bands(entry.signature):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
+
+
+response_cache = ResponseCache()
+
+
+class CachedRun:
+    """
+    Stands in for `RunResultStreaming`, replaying a cached answer as the raw
+    Responses events of a single assistant message (what
+    `stream_agent_response` and the AI SDK encoder consume), then writing the
+    turn to the session like a live run would.
+    """
+
+    def __init__(self, entry: CachedAnswer, user_input: str, session: Any = None) -> None:
+        self.entry = entry
+        self.final_output = entry.answer
+        self.new_items: list[Any] = []
+        self.context_wrapper: RunContextWrapper[Any] = RunContextWrapper(context=None)  # zero usage
+        self._user_input = user_input
+        self._session = session
+        self._cancelled = False
+
+    def cancel(self) -> None:
+        self._cancelled = True
+
+    async def stream_events(self) -> AsyncIterator[Any]:
+        item_id = f"msg_{uuid.uuid4().hex}"
+        text = self.entry.answer
+        sequence = 0
+
+        def event(data: Any) -> RawResponsesStreamEvent:
+            nonlocal sequence
+            sequence += 1
+            return RawResponsesStreamEvent(data=data)
+
+        yield event(ResponseOutputItemAddedEvent(
+            type="response.output_item.added", output_index=0, sequence_number=sequence,
+            item=ResponseOutputMessage(id=item_id, type="message", role="assistant", status="in_progress", content=[]),
+        ))
+        yield event(ResponseContentPartAddedEvent(
+            type="response.content_part.added", item_id=item_id, output_index=0, content_index=0,
+            sequence_number=sequence, part=ResponseOutputText(type="output_text", text="", annotations=[]),
+        ))
+        words = re.findall(r"\S+\s*", text)
+        for start in range(0, len(words), _REPLAY_WORDS):
+            if self._cancelled:
+                return
+            yield event(ResponseTextDeltaEvent(
+                type="response.output_text.delta", item_id=item_id, output_index=0, content_index=0,
+                sequence_number=sequence, delta="".join(words[start:start + _REPLAY_WORDS]), logprobs=[],
+            ))
+            await asyncio.sleep(0)
+        yield event(ResponseTextDoneEvent(
+            type="response.output_text.done", item_id=item_id, output_index=0, content_index=0,
+            sequence_number=sequence, text=text, logprobs=[],
+        ))
+        yield event(ResponseOutputItemDoneEvent(
+            type="response.output_item.done", output_index=0, sequence_number=sequence,
+            item=ResponseOutputMessage(
+                id=item_id, type="message", role="assistant", status="completed",
+                content=[ResponseOutputText(type="output_text", text=text, annotations=[])],
+            ),
+        ))
+        if self._session is not None:
+            await self._session.add_items([
+                {"role": "user", "content": self._user_input},
+                {"role": "assistant", "content": text},
+            ])
+
+
+@dataclass
+class TurnCache:
+    """Response cache state for one turn: a replay to use, or whether to store the answer."""
+
+    endpoint: str
+    question: str
+    eligible: bool
+    run: CachedRun | None = None
+
+    def remember(self, result: Any) -> None:
+        """Cache a completed live run's answer if this turn qualifies."""
+        if not self.eligible or self.run is not None or result is None:
+            return
+        answer = getattr(result, "final_output", None)
+        if not isinstance(answer, str) or not answer.strip():
+            return
+        for item in getattr(result, "new_items", None) or []:
+            if getattr(getattr(item, "raw_item", None), "type", None) in _LIVE_TOOL_TYPES:
+                return
+        response_cache.store(self.question, answer)
+        RESPONSE_CACHE_STORES_TOTAL.inc(endpoint=self.endpoint)
+        logger.debug("[Response Cache] Stored answer for '%s...'", self.question[:50])
+
+
+async def check_response_cache(
+    question: str,
+    *,
+    has_attachments: bool,
+    profile: str,
+    session: Any,
+    endpoint: str,
+) -> TurnCache:
+    """Look up a cached answer for this turn (only first, attachment-free turns qualify)."""
+    if (
+        not RESPONSE_CACHE_ENABLED
+        or has_attachments
+        or profile == "quick"  # small talk is already cheap; keep it varied
+        or not question
+        or len(question) > RESPONSE_CACHE_MAX_CHARS
+        or _URL_RE.search(question)
+        or session is None
+        or await session.get_items(limit=1)  # not the thread's first turn
+    ):
+        return TurnCache(endpoint, question, eligible=False)
+
+    entry, similarity, stale = response_cache.lookup(question)
+    if entry is None:
+        RESPONSE_CACHE_LOOKUPS_TOTAL.inc(endpoint=endpoint, result="stale" if stale else "miss")
+        return TurnCache(endpoint, question, eligible=True)
+
+    RESPONSE_CACHE_LOOKUPS_TOTAL.inc(endpoint=endpoint, result="hit")
+    RESPONSE_CACHE_SIMILARITY_HIST.observe(similarity, endpoint=endpoint)
+    logger.info(
+        "[Response Cache] Hit (similarity %.2f, age %.0fs): '%s...'",
+        similarity, time.time() - entry.created_at, question[:50],
+    )
+    return TurnCache(endpoint, question, eligible=True, run=CachedRun(entry, question, session))
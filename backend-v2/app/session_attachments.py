@@ -0,0 +1,135 @@
+"""
+Session memory for attachment turns.
+
+A ChatKit message with attachments is a list input, and the Agents SDK only
+combines list inputs with a session through `RunConfig.session_input_callback`
+- so attachment turns used to run without history (and weren't stored), and
+the follow-up message had to re-explain the context.
+
+Now they keep the session:
+- `merge_with_history` (the session input callback) appends the new turn to
+  the stored history. Earlier images whose uploaded file is gone (expired, or
+  uploaded before a restart) or that are older than the newest
+  SESSION_HISTORY_MAX_IMAGES are replaced by a short note, so they cost
+  neither a failed request nor vision tokens on every later turn.
+- `AttachmentSession` (a SQLiteSession) stores compact references instead of
+  raw payloads: image file ids are kept as-is (a few bytes), base64 data URLs
+  become a note, and inlined file text is cut to SESSION_ATTACHMENT_MAX_CHARS.
+  By default that's the largest text inlined in the first place (small
+  documents, see document_text.py, and text files / excerpts, see
+  text_attachments.py), so an inlined document stays whole for follow-up
+  questions - it isn't in any vector store to search instead.
+
+The model's reply to the attachment turn is stored as usual, so even a
+dropped image stays "remembered" through what was said about it.
+
+Environment:
+- SESSION_ATTACHMENT_MAX_CHARS: inlined file text kept in history (default: the
+  larger inline budget of DOCUMENT_INLINE_MAX_TOKENS / TEXT_ATTACHMENT_MAX_TOKENS,
+  at 4 characters per token, plus room for the "File: ..." header)
+- SESSION_HISTORY_MAX_IMAGES: earlier images resent to the model (default 4)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any
+
+from agents import SQLiteSession
+
+from .document_text import DOCUMENT_INLINE_MAX_TOKENS
+from .image_normalize import image_file_available
+from .metrics import REGISTRY
+from .text_attachments import TEXT_ATTACHMENT_MAX_TOKENS
+
+logger = logging.getLogger(__name__)
+
+_INLINE_MAX_CHARS = max(DOCUMENT_INLINE_MAX_TOKENS, TEXT_ATTACHMENT_MAX_TOKENS) * 4 + 1000
+SESSION_ATTACHMENT_MAX_CHARS = int(os.getenv("SESSION_ATTACHMENT_MAX_CHARS", str(_INLINE_MAX_CHARS)))
+SESSION_HISTORY_MAX_IMAGES = int(os.getenv("SESSION_HISTORY_MAX_IMAGES", "4"))
+
+_EARLIER_IMAGE_NOTE = "[Image shared earlier in the conversation - no longer attached]"
+
+SESSION_ATTACHMENT_PARTS_TOTAL = REGISTRY.counter(
+    "jason_session_attachment_parts_total",
+    "Attachment parts compacted in session history "
+    "(stored: data_url / truncated; resent: expired / trimmed).",
+    ("action",),
+)
+
+
+if SESSION_ATTACHMENT_MAX_CHARS < _INLINE_MAX_CHARS:
+    logger.warning(
+        "[Session] SESSION_ATTACHMENT_MAX_CHARS=%s is below the inline budget (%s chars); "
+        "inlined documents will be cut in conversation history",
+        SESSION_ATTACHMENT_MAX_CHARS, _INLINE_MAX_CHARS,
+    )
+
+
+def _is_image(part: Any) -> bool:
+    return isinstance(part, dict) and part.get("type") == "input_image"
+
+
+def _compact_part(part: Any) -> Any:
+    if _is_image(part) and str(part.get("image_url") or "").startswith("data:"):
+        SESSION_ATTACHMENT_PARTS_TOTAL.inc(action="data_url")
+        return {"type": "input_text", "text": _EARLIER_IMAGE_NOTE}
+    if isinstance(part, dict) and part.get("type") == "input_text":
+        text = part.get("text") or ""
+        # Inlined text attachments are "File: <name>\n\n<contents>" (see to_message_content)
+        if text.startswith("File: ") and len(text) > SESSION_ATTACHMENT_MAX_CHARS:
+            SESSION_ATTACHMENT_PARTS_TOTAL.inc(action="truncated")
+            dropped = len(text) - SESSION_ATTACHMENT_MAX_CHARS
+            return {
+                **part,
+                "text": f"{text[:SESSION_ATTACHMENT_MAX_CHARS]}\n\n"
+                f"[... {dropped} more characters not kept in conversation history]",
+            }
+    return part
+
+
+def compact_item(item: Any) -> Any:
+    """The item as stored: attachment payloads replaced by compact references."""
+    content = item.get("content") if isinstance(item, dict) else None
+    if not isinstance(content, list):
+        return item
+    parts = [_compact_part(part) for part in content]
+    if all(new is old for new, old in zip(parts, content)):
+        return item
+    return {**item, "content": parts}
+
+
+def merge_with_history(history: list[Any], new_input: list[Any]) -> list[Any]:
+    """Session input callback: history (stale / excess images noted out) + this turn."""
+    images_kept = 0
+    merged = []
+    for item in reversed(history):  # newest first, so the most recent images are the ones kept
+        content = item.get("content") if isinstance(item, dict) else None
+        if isinstance(content, list) and any(_is_image(part) for part in content):
+            parts = []
+            for part in content:
+                if not _is_image(part):
+                    parts.append(part)
+                    continue
+                if not image_file_available(part.get("file_id")):
+                    action = "expired"
+                elif images_kept >= SESSION_HISTORY_MAX_IMAGES:
+                    action = "trimmed"
+                else:
+                    images_kept += 1
+                    parts.append(part)
+                    continue
+                SESSION_ATTACHMENT_PARTS_TOTAL.inc(action=action)
+                parts.append({"type": "input_text", "text": _EARLIER_IMAGE_NOTE})
+            item = {**item, "content": parts}
+        merged.append(item)
+    merged.reverse()
+    return merged + new_input
+
+
+class AttachmentSession(SQLiteSession):
+    """SQLiteSession that stores attachment turns as compact references."""
+
+    async def add_items(self, items: list[Any]) -> None:
+        await super().add_items([compact_item(item) for item in items])
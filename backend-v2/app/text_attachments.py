@@ -0,0 +1,284 @@
+"""
+Token-budgeted inlining of text attachments.
+
+Text and JSON attachments used to be decoded and inlined in full, so a 5MB
+log or CSV put over a million tokens in the prompt (or failed the request).
+Now anything over TEXT_ATTACHMENT_MAX_TOKENS (estimated locally, about 4
+bytes per token) is inlined as:
+
+- a structured summary: size and line count, plus for CSV/TSV the columns
+  with inferred types, for JSON the top-level shape (keys, array length,
+  element keys; read from the first 256KB for files over 2MB, never parsing
+  the whole document), for JSON Lines the record count and keys
+- the first lines (header and sample rows) and the last lines of the file,
+  cut at line boundaries
+
+Only the head and tail are decoded (incrementally, chunk by chunk), so a
+large file costs no more than the part that is sent. Small files are inlined
+in full as before.
+
+Environment:
+- TEXT_ATTACHMENT_MAX_TOKENS: largest file inlined in full, and the budget
+  for the excerpt of larger ones (default 8000)
+"""
+
+from __future__ import annotations
+
+import codecs
+import csv
+import json
+import logging
+import os
+import re
+from typing import Any
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+TEXT_ATTACHMENT_MAX_TOKENS = int(os.getenv("TEXT_ATTACHMENT_MAX_TOKENS", "8000"))
+
+_CHUNK_BYTES = 64 * 1024
+_HEAD_SHARE = 0.6
+_TAIL_SHARE = 0.25  # the rest of the budget is left for the summary
+_SCHEMA_ROWS = 200
+_JSON_PARSE_MAX_BYTES = 2 * 1024 * 1024  # larger JSON is summarized from a prefix
+_JSON_PREFIX_CHARS = 256 * 1024
+_MAX_KEYS = 40
+
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2})?)?")
+_WS_RE = re.compile(r"\s*")
+
+TEXT_ATTACHMENT_TOTAL = REGISTRY.counter(
+    "jason_text_attachment_total",
+    "Text attachments inlined in full vs as a budgeted excerpt with summary.",
+    ("outcome",),
+)
+TEXT_ATTACHMENT_TOKENS_TOTAL = REGISTRY.counter(
+    "jason_text_attachment_tokens_total",
+    "Estimated tokens of text attachments: original size vs what was inlined.",
+    ("stage",),
+)
+
+
+def estimate_tokens(size: int) -> int:
+    """Rough token count for a length in bytes or characters (about 4 per token)."""
+    return size // 4
+
+
+def _kind(filename: str, mime_type: str) -> str:
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in (".csv", ".tsv") or mime_type in ("text/csv", "text/tab-separated-values"):
+        return "csv"
+    if ext in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if ext == ".json" or mime_type == "application/json":
+        return "json"
+    return "text"
+
+
+def _decode_head(data: bytes, max_chars: int) -> str:
+    """The first max_chars characters, decoding only as many chunks as needed."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")("strict")
+    pieces: list[str] = []
+    decoded = 0
+    for start in range(0, len(data), _CHUNK_BYTES):
+        piece = decoder.decode(data[start:start + _CHUNK_BYTES], final=start + _CHUNK_BYTES >= len(data))
+        pieces.append(piece)
+        decoded += len(piece)
+        if decoded >= max_chars:
+            break
+    head = "".join(pieces)[:max_chars]
+    cut = head.rfind("\n")
+    return head[:cut] if cut > 0 else head
+
+
+def _decode_tail(data: bytes, max_chars: int) -> str:
+    """The last (at most) max_chars characters, starting at a line boundary."""
+    raw = data[-max_chars:]
+    start = 0
+    while start < len(raw) and 0x80 <= raw[start] < 0xC0:  # mid-character: skip continuation bytes
+        start += 1
+    tail = raw[start:].decode("utf-8")
+    cut = tail.find("\n")
+    return tail[cut + 1:] if 0 <= cut < len(tail) - 1 else tail
+
+
+def _column_type(values: list[str]) -> str:
+    values = [value.strip() for value in values if value.strip()]
+    if not values:
+        return "empty"
+    for name, check in (("integer", int), ("number", float)):
+        try:
+            for value in values:
+                check(value.replace(",", "") if name == "number" else value)
+            return name
+        except ValueError:
+            pass
+    if all(_DATE_RE.match(value) for value in values):
+        return "date"
+    return "text"
+
+
+def _csv_summary(head: str, filename: str) -> list[str]:
+    lines = head.splitlines()[: _SCHEMA_ROWS + 1]
+    try:
+        dialect = csv.Sniffer().sniff("\n".join(lines[:20]), delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel_tab if filename.lower().endswith(".tsv") else csv.excel
+    rows = list(csv.reader(lines, dialect))
+    if not rows:
+        return []
+    header, body = rows[0], rows[1:]
+    columns = [
+        f"{name or f'column {i + 1}'} ({_column_type([row[i] for row in body if i < len(row)])})"
+        for i, name in enumerate(header[:_MAX_KEYS])
+    ]
+    more = f", ... ({len(header) - _MAX_KEYS} more)" if len(header) > _MAX_KEYS else ""
+    return [f"Columns ({len(header)}): {', '.join(columns)}{more}"]
+
+
+def _describe(value: Any) -> str:
+    if isinstance(value, dict):
+        return f"object with {len(value)} keys"
+    if isinstance(value, list):
+        return f"array of {len(value):,}"
+    return type(value).__name__.replace("NoneType", "null").replace("str", "string")
+
+
+def _keys(records: list[Any]) -> list[str]:
+    keys: dict[str, None] = {}
+    for record in records[:50]:
+        if isinstance(record, dict):
+            keys.update(dict.fromkeys(record))
+    return list(keys)
+
+
+def _json_prefix_summary(data: bytes) -> list[str]:
+    """Top-level shape from the first _JSON_PREFIX_CHARS, decoding one value at a time."""
+    text = _decode_head(data, _JSON_PREFIX_CHARS)
+    prefix = f"the first {len(text.encode()) // 1024:,} KB"
+    decoder = json.JSONDecoder()
+    pos = _WS_RE.match(text).end()
+    opening = text[pos:pos + 1]
+    if opening not in ("[", "{"):
+        return []
+    items: list[Any] = []
+    fields: list[str] = []
+    pos += 1
+    while len(fields) < _MAX_KEYS:
+        pos = _WS_RE.match(text, pos).end()
+        if text[pos:pos + 1] in ("]", "}", ""):
+            break
+        try:
+            if opening == "[":
+                item, pos = decoder.raw_decode(text, pos)
+                items.append(item)
+            else:
+                key, pos = decoder.raw_decode(text, pos)
+                pos = _WS_RE.match(text, pos).end()
+                if text[pos:pos + 1] != ":":
+                    break
+                pos = _WS_RE.match(text, pos + 1).end()
+                try:
+                    value, pos = decoder.raw_decode(text, pos)
+                except ValueError:
+                    fields.append(f"{key} (continues past {prefix})")
+                    break
+                fields.append(f"{key} ({_describe(value)})")
+        except ValueError:  # cut off at the end of the prefix
+            break
+        pos = _WS_RE.match(text, pos).end()
+        if text[pos:pos + 1] != ",":
+            break
+        pos += 1
+    if opening == "[":
+        summary = [f"Top level: array, {len(items):,} items in {prefix}"]
+        if keys := _keys(items):
+            summary.append(f"Item keys: {', '.join(keys[:_MAX_KEYS])}")
+        return summary
+    return [f"Top level: object; keys in {prefix}: {', '.join(fields)}"] if fields else ["Top level: object"]
+
+
+def _json_summary(data: bytes) -> list[str]:
+    if len(data) > _JSON_PARSE_MAX_BYTES:
+        return _json_prefix_summary(data)
+    try:
+        value = json.loads(data.decode("utf-8-sig"))
+    except (ValueError, UnicodeDecodeError) as e:
+        return [f"Not valid JSON ({e})"]
+    if isinstance(value, list):
+        summary = [f"Top level: array of {len(value):,} items"]
+        if keys := _keys(value):
+            summary.append(f"Item keys: {', '.join(keys[:_MAX_KEYS])}")
+        return summary
+    if isinstance(value, dict):
+        fields = [f"{key} ({_describe(item)})" for key, item in list(value.items())[:_MAX_KEYS]]
+        return [f"Top level: object with {len(value)} keys", f"Keys: {', '.join(fields)}"]
+    return [f"Top level: {_describe(value)}"]
+
+
+def _jsonl_summary(head: str, lines: int) -> list[str]:
+    records = []
+    for line in head.splitlines()[:50]:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    summary = [f"JSON Lines: {lines:,} records"]
+    if keys := _keys(records):
+        summary.append(f"Record keys: {', '.join(keys[:_MAX_KEYS])}")
+    return summary
+
+
+def text_attachment_text(filename: str, mime_type: str, data: bytes) -> str:
+    """Model input text for a text/JSON attachment (CPU-bound for large files - run in a thread).
+
+    Raises UnicodeDecodeError for files that aren't UTF-8.
+    """
+    original_tokens = estimate_tokens(len(data))
+    if original_tokens <= TEXT_ATTACHMENT_MAX_TOKENS:
+        text = f"File: {filename}\n\n{data.decode('utf-8-sig')}"
+        TEXT_ATTACHMENT_TOTAL.inc(outcome="full")
+        TEXT_ATTACHMENT_TOKENS_TOTAL.inc(original_tokens, stage="original")
+        TEXT_ATTACHMENT_TOKENS_TOTAL.inc(original_tokens, stage="inlined")
+        return text
+
+    budget_chars = TEXT_ATTACHMENT_MAX_TOKENS * 4
+    head = _decode_head(data, int(budget_chars * _HEAD_SHARE))
+    tail = _decode_tail(data, int(budget_chars * _TAIL_SHARE))
+    lines = data.count(b"\n") + (0 if data.endswith(b"\n") else 1)
+    omitted = max(0, lines - head.count("\n") - tail.count("\n") - 2)
+
+    kind = _kind(filename, mime_type)
+    summary = [f"{len(data) / 1_048_576:.1f} MB, {lines:,} lines, ~{original_tokens:,} tokens"]
+    try:
+        if kind == "csv":
+            summary.insert(0, f"CSV with {max(0, lines - 1):,} rows")
+            summary += _csv_summary(head, filename)
+        elif kind == "json":
+            summary += _json_summary(data)
+        elif kind == "jsonl":
+            summary += _jsonl_summary(head, lines)
+    except Exception as e:  # the summary is a bonus - never fail the attachment over it
+        logger.warning("[Attachments] Could not summarize %s: %s", filename, e)
+
+    text = "\n".join([
+        f"File: {filename} (too large to include in full - summary, first and last lines below)",
+        "",
+        "Summary:",
+        *(f"- {line}" for line in summary),
+        "",
+        "--- First lines ---",
+        head,
+        f"--- [{omitted:,} lines omitted] ---" if omitted else "--- [middle omitted] ---",
+        "--- Last lines ---",
+        tail,
+    ])
+    TEXT_ATTACHMENT_TOTAL.inc(outcome="summarized")
+    TEXT_ATTACHMENT_TOKENS_TOTAL.inc(original_tokens, stage="original")
+    TEXT_ATTACHMENT_TOKENS_TOTAL.inc(estimate_tokens(len(text)), stage="inlined")
+    logger.info(
+        "[Attachments] %s: ~%s tokens inlined as ~%s-token excerpt", filename, original_tokens, estimate_tokens(len(text))
+    )
+    return text
@@ -0,0 +1,261 @@
+"""
+Per-thread vector stores for documents attached in chat.
+
+PDFs / DOCX / ... attached to a chat message used to be added to the global
+knowledge base (JASON_VECTOR_STORE_ID) for good, so every user's uploads grew
+the shared index and turned up in everyone's file_search. Now each thread
+that gets a document has its own vector store:
+
+- the document is uploaded to OpenAI at upload time as before (see
+  attachment_pipeline.py), and attached to the thread's store when the
+  message is sent - the store is created with the first document, further
+  documents are added as one file batch
+- only that thread's turns search it: its file_search gets both the
+  knowledge base and the thread's store (tool set "...+thread_docs")
+- the store expires on OpenAI's side after THREAD_VECTOR_STORE_EXPIRY_DAYS
+  without use, and is deleted here (with its files, which don't expire with
+  it) once idle that long. Stores left behind by a previous process are
+  swept at startup once they've been idle that long too - stores that are
+  still active may belong to another live instance (the old one during a
+  rolling deploy, another replica, staging on the same API key).
+
+Indexing is asynchronous, so a document announced to the model right away
+was often missed by the first file_search. `wait_for_indexing` polls the
+thread's still-indexing files with exponential backoff (DOCUMENT_INDEX_POLL_SECONDS
+doubling up to 2s) for at most DOCUMENT_INDEX_WAIT_SECONDS. It starts as soon
+as the files are attached and runs while the rest of the turn is set up; the
+turn only waits for what's left right before the model call. Observed indexing
+latency is recorded per file (`jason_document_index_seconds`, percentiles of
+recent documents at GET /admin/indexing).
+
+Environment:
+- THREAD_VECTOR_STORES_ENABLED: "true" (default) / "false" - "false" adds chat
+  documents to the global knowledge base as before
+- THREAD_VECTOR_STORE_EXPIRY_DAYS: idle days before a thread's store is removed (default 1)
+- THREAD_VECTOR_STORE_GC_SECONDS: how often idle stores are collected (default 600)
+- DOCUMENT_INDEX_WAIT_SECONDS: longest a turn waits for its documents to index (default 10)
+- DOCUMENT_INDEX_POLL_SECONDS: first polling interval (default 0.25)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from .metrics import REGISTRY
+from .openai_client import get_openai_client
+
+logger = logging.getLogger(__name__)
+
+THREAD_VECTOR_STORES_ENABLED = os.getenv("THREAD_VECTOR_STORES_ENABLED", "true").lower() == "true"
+THREAD_VECTOR_STORE_EXPIRY_DAYS = int(os.getenv("THREAD_VECTOR_STORE_EXPIRY_DAYS", "1"))
+THREAD_VECTOR_STORE_GC_SECONDS = float(os.getenv("THREAD_VECTOR_STORE_GC_SECONDS", "600"))
+DOCUMENT_INDEX_WAIT_SECONDS = float(os.getenv("DOCUMENT_INDEX_WAIT_SECONDS", "10"))
+DOCUMENT_INDEX_POLL_SECONDS = float(os.getenv("DOCUMENT_INDEX_POLL_SECONDS", "0.25"))
+_MAX_POLL_SECONDS = 2.0
+
+# Marks our stores in vector store metadata, so orphans can be found after a restart
+_THREAD_METADATA_KEY = "jason_thread_id"
+
+THREAD_VECTOR_STORE_EVENTS_TOTAL = REGISTRY.counter(
+    "jason_thread_vector_store_events_total",
+    "Per-thread vector store lifecycle (created / files_added / deleted_idle / deleted_orphan / error).",
+    ("event",),
+)
+DOCUMENT_INDEX_SECONDS = REGISTRY.histogram(
+    "jason_document_index_seconds",
+    "Time from attaching a chat document to its vector store to indexing finished, by status.",
+    ("status",),
+    buckets=(0.5, 1.0, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 30.0, 60.0),
+)
+DOCUMENT_INDEX_WAIT_TOTAL = REGISTRY.counter(
+    "jason_document_index_wait_total",
+    "Turns that waited for document indexing, by outcome (ready / timeout).",
+    ("outcome",),
+)
+DOCUMENT_INDEX_HELD_SECONDS = REGISTRY.histogram(
+    "jason_document_index_wait_seconds",
+    "Time a turn was held back waiting for its documents to index.",
+)
+REGISTRY.gauge(
+    "jason_thread_vector_stores",
+    "Per-thread vector stores currently tracked.",
+    callback=lambda: len(thread_vector_stores._stores),
+)
+
+
+@dataclass
+class ThreadStore:
+    vector_store_id: str
+    file_ids: set[str] = field(default_factory=set)
+    last_used: float = field(default_factory=time.time)
+    # file id -> when it was attached (perf_counter), until it's seen indexed
+    indexing: dict[str, float] = field(default_factory=dict)
+
+
+class ThreadVectorStores:
+    """Thread id -> its temporary vector store (see module docstring)."""
+
+    def __init__(self) -> None:
+        self._stores: dict[str, ThreadStore] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._index_samples: deque[float] = deque(maxlen=500)
+
+    def vector_store_id(self, thread_id: str) -> str | None:
+        """The thread's store, if it has one (and mark it as in use)."""
+        store = self._stores.get(thread_id)
+        if store is None:
+            return None
+        store.last_used = time.time()
+        return store.vector_store_id
+
+    async def add_files(self, thread_id: str, file_ids: list[str]) -> str:
+        """Attach uploaded files to the thread's store, creating it on first use."""
+        async with self._locks.setdefault(thread_id, asyncio.Lock()):
+            store = self._stores.get(thread_id)
+            new_ids = [file_id for file_id in file_ids if store is None or file_id not in store.file_ids]
+            if store is not None and not new_ids:
+                store.last_used = time.time()
+                return store.vector_store_id
+
+            client = get_openai_client()
+            attached_at = time.perf_counter()
+            if store is None:
+                vector_store = await client.vector_stores.create(
+                    name=f"jason-thread-{thread_id}",
+                    file_ids=new_ids,
+                    expires_after={"anchor": "last_active_at", "days": THREAD_VECTOR_STORE_EXPIRY_DAYS},
+                    metadata={_THREAD_METADATA_KEY: thread_id},
+                )
+                store = ThreadStore(vector_store.id)
+                self._stores[thread_id] = store
+                THREAD_VECTOR_STORE_EVENTS_TOTAL.inc(event="created")
+                logger.info("[Thread Docs] Created %s for thread %s", vector_store.id, thread_id)
+            else:
+                await client.vector_stores.file_batches.create(store.vector_store_id, file_ids=new_ids)
+                THREAD_VECTOR_STORE_EVENTS_TOTAL.inc(event="files_added")
+            store.file_ids.update(new_ids)
+            store.indexing.update(dict.fromkeys(new_ids, attached_at))
+            store.last_used = time.time()
+            return store.vector_store_id
+
+    def has_file(self, file_id: str) -> bool:
+        """Whether a thread's store holds this file (it's deleted with the store)."""
+        return any(file_id in store.file_ids for store in self._stores.values())
+
+    def indexing_pending(self, thread_id: str) -> bool:
+        store = self._stores.get(thread_id)
+        return store is not None and bool(store.indexing)
+
+    async def wait_for_indexing(self, thread_id: str) -> bool:
+        """Poll the thread's still-indexing files until done or the wait runs out.
+
+        Returns whether everything finished indexing (failed files count as finished).
+        """
+        store = self._stores.get(thread_id)
+        if store is None or not store.indexing:
+            return True
+        client = get_openai_client()
+        start = time.perf_counter()
+        delay = DOCUMENT_INDEX_POLL_SECONDS
+        while store.indexing:
+            pending = list(store.indexing)
+            results = await asyncio.gather(
+                *(client.vector_stores.files.retrieve(file_id, vector_store_id=store.vector_store_id) for file_id in pending),
+                return_exceptions=True,
+            )
+            for file_id, result in zip(pending, results):
+                status = getattr(result, "status", None)
+                if status in ("completed", "failed", "cancelled") and file_id in store.indexing:
+                    seconds = time.perf_counter() - store.indexing.pop(file_id)
+                    DOCUMENT_INDEX_SECONDS.observe(seconds, status=status)
+                    self._index_samples.append(seconds)
+                    if status != "completed":
+                        logger.warning("[Thread Docs] %s indexing %s: %s", file_id, status, getattr(result, "last_error", None))
+            remaining = DOCUMENT_INDEX_WAIT_SECONDS - (time.perf_counter() - start)
+            if not store.indexing or remaining <= 0:
+                break
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, _MAX_POLL_SECONDS)
+
+        ready = not store.indexing
+        DOCUMENT_INDEX_WAIT_TOTAL.inc(outcome="ready" if ready else "timeout")
+        if not ready:
+            logger.info("[Thread Docs] %s document(s) still indexing after %.1fs", len(store.indexing), DOCUMENT_INDEX_WAIT_SECONDS)
+        return ready
+
+    def indexing_percentiles(self) -> dict[str, float | int]:
+        """Indexing latency of recent documents (for GET /admin/indexing)."""
+        samples = sorted(self._index_samples)
+        summary: dict[str, float | int] = {"documents": len(samples)}
+        for name, pct in (("p50_s", 0.50), ("p95_s", 0.95), ("p99_s", 0.99)):
+            summary[name] = round(samples[min(len(samples) - 1, int(len(samples) * pct))], 3) if samples else 0.0
+        return summary
+
+    async def _delete(self, vector_store_id: str, file_ids: set[str], event: str) -> None:
+        client = get_openai_client()
+        results = await asyncio.gather(
+            client.vector_stores.delete(vector_store_id),
+            *(client.files.delete(file_id) for file_id in file_ids),
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            THREAD_VECTOR_STORE_EVENTS_TOTAL.inc(event="error")
+            logger.warning("[Thread Docs] Cleanup of %s incomplete: %s", vector_store_id, errors[0])
+        THREAD_VECTOR_STORE_EVENTS_TOTAL.inc(event=event)
+
+    async def collect_garbage(self) -> int:
+        """Delete stores (and their files) idle for longer than the expiry."""
+        cutoff = time.time() - THREAD_VECTOR_STORE_EXPIRY_DAYS * 86400
+        idle = [
+            thread_id
+            for thread_id, store in self._stores.items()
+            if store.last_used < cutoff and not self._locks.get(thread_id, asyncio.Lock()).locked()
+        ]
+        for thread_id in idle:
+            store = self._stores.pop(thread_id)
+            self._locks.pop(thread_id, None)
+            await self._delete(store.vector_store_id, store.file_ids, "deleted_idle")
+        if idle:
+            logger.info("[Thread Docs] Removed %s idle thread vector store(s)", len(idle))
+        return len(idle)
+
+    async def sweep_orphans(self) -> int:
+        """Delete thread stores left behind by a previous process (idle past the expiry)."""
+        client = get_openai_client()
+        known = {store.vector_store_id for store in self._stores.values()}
+        cutoff = time.time() - THREAD_VECTOR_STORE_EXPIRY_DAYS * 86400
+        orphans = [
+            vector_store.id
+            async for vector_store in client.vector_stores.list(limit=100)
+            if _THREAD_METADATA_KEY in (vector_store.metadata or {})
+            and vector_store.id not in known
+            and (vector_store.status == "expired" or (vector_store.last_active_at or vector_store.created_at) < cutoff)
+        ]
+        for vector_store_id in orphans:
+            file_ids = {vs_file.id async for vs_file in client.vector_stores.files.list(vector_store_id, limit=100)}
+            await self._delete(vector_store_id, file_ids, "deleted_orphan")
+        if orphans:
+            logger.info("[Thread Docs] Swept %s orphaned thread vector store(s)", len(orphans))
+        return len(orphans)
+
+    async def run(self) -> None:
+        """Background cleanup: orphans once at startup, then idle stores periodically."""
+        try:
+            await self.sweep_orphans()
+        except Exception as e:
+            logger.warning("[Thread Docs] Orphan sweep failed: %s", e)
+        while True:
+            await asyncio.sleep(THREAD_VECTOR_STORE_GC_SECONDS)
+            try:
+                await self.collect_garbage()
+            except Exception as e:
+                logger.warning("[Thread Docs] Garbage collection failed: %s", e)
+
+
+thread_vector_stores = ThreadVectorStores()
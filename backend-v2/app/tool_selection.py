@@ -0,0 +1,192 @@
+"""
+Per-turn tool set selection for jason_agent.
+
+Every tool in the request adds schema tokens to the prompt and gives the
+model something to deliberate over, even for "yo". Each turn runs a clone of
+the agent with only the tools that message can plausibly need:
+
+- none:         small talk (the router's "quick" profile) - no tools at all,
+                which also lets the router use minimal reasoning effort.
+                A quick reply to a turn that searched ("ok", "bet") keeps
+                the default set instead, since it may continue that search
+- search:       file_search + web_search (the default)
+- search+reel:  adds transcribe_instagram_reel when the message has an
+                Instagram link or mentions a reel
+
+When the local knowledge base mirror is confident about a message (see
+kb_mirror.py), file_search is dropped as well and "+local_kb" is appended to
+the set's name. A thread with its own documents (see thread_vector_stores.py)
+keeps file_search and searches its store alongside the knowledge base
+("+thread_docs"); those clones are per thread, so they aren't cached.
+
+Clones are cached per tool set, so selection costs a regex and a dict lookup.
+
+What it saves is measured, not assumed: input tokens and TTFT are recorded
+per tool set (compare "search" vs "search+reel" / "none"), and the estimated
+schema tokens of omitted function tools are counted.
+
+Environment:
+- TOOL_SELECTION_ENABLED: "true" (default); "false" always sends every tool
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import os
+import re
+from dataclasses import dataclass
+from typing import Any
+
+from agents import Agent, FileSearchTool, FunctionTool
+
+from .metrics import REGISTRY, StreamTimer
+
+TOOL_SELECTION_ENABLED = os.getenv("TOOL_SELECTION_ENABLED", "true").lower() == "true"
+
+REEL_TOOL_NAME = "transcribe_instagram_reel"
+
+_INSTAGRAM_RE = re.compile(r"instagram\.com/|instagr\.am/|\breels?\b", re.IGNORECASE)
+
+# Session items that mean the model called a tool
+_TOOL_CALL_TYPES = {"file_search_call", "web_search_call", "function_call"}
+# How far back to look for the previous turn's tool calls
+_LAST_TURN_ITEMS = 20
+
+TOOL_SET_TOTAL = REGISTRY.counter(
+    "jason_tool_set_total",
+    "Turns run with each tool set.",
+    ("endpoint", "tool_set"),
+)
+TOOLS_OMITTED_TOTAL = REGISTRY.counter(
+    "jason_tools_omitted_total",
+    "Tools left out of a turn's request, by tool.",
+    ("endpoint", "tool"),
+)
+TOOL_SCHEMA_TOKENS_SAVED_TOTAL = REGISTRY.counter(
+    "jason_tool_schema_tokens_saved_total",
+    "Estimated function-tool schema tokens not sent (about 4 chars per token).",
+    ("endpoint",),
+)
+TOOL_SET_INPUT_TOKENS = REGISTRY.histogram(
+    "jason_tool_set_input_tokens",
+    "Input tokens per request by tool set (as reported by the API).",
+    ("endpoint", "tool_set"),
+    buckets=(500, 1000, 2000, 3000, 4000, 6000, 8000, 12000, 16000, 32000, 64000),
+)
+TOOL_SET_TTFT_SECONDS = REGISTRY.histogram(
+    "jason_tool_set_ttft_seconds",
+    "Time to first token by tool set.",
+    ("endpoint", "tool_set"),
+)
+
+
+@dataclass(frozen=True)
+class ToolSelection:
+    tool_set: str
+    agent: Agent[Any]
+    omitted: tuple[str, ...]
+
+
+_clones: dict[tuple[int, str], Agent[Any]] = {}
+
+
+def _schema_tokens(tool: Any) -> int:
+    if not isinstance(tool, FunctionTool):
+        return 0
+    schema = json.dumps(
+        {"name": tool.name, "description": tool.description, "parameters": tool.params_json_schema}
+    )
+    return len(schema) // 4
+
+
+def _agent_with(agent: Agent[Any], tool_set: str, tools: list[Any]) -> Agent[Any]:
+    key = (id(agent), tool_set)
+    clone = _clones.get(key)
+    if clone is None:
+        clone = agent.clone(tools=tools)
+        _clones[key] = clone
+    return clone
+
+
+async def last_turn_used_tools(session: Any) -> bool:
+    """Whether the assistant called a tool since the thread's last user message."""
+    if session is None:
+        return False
+    for item in reversed(await session.get_items(limit=_LAST_TURN_ITEMS)):
+        if not isinstance(item, dict):
+            continue
+        if item.get("role") == "user":
+            return False
+        if item.get("type") in _TOOL_CALL_TYPES:
+            return True
+    return False
+
+
+def select_tools(
+    agent: Agent[Any],
+    message_text: str,
+    profile: str,
+    endpoint: str = "chatkit",
+    local_kb: bool = False,
+    vector_store_ids: tuple[str, ...] = (),
+    follows_tools: bool = False,
+) -> ToolSelection:
+    """Pick the tools this turn needs and return the agent to run with them.
+
+    `vector_store_ids` are extra stores for file_search (the thread's documents).
+    `follows_tools` (see `last_turn_used_tools`) keeps the default set for a
+    "quick" message.
+    """
+    if not TOOL_SELECTION_ENABLED:
+        selection = ToolSelection("all", agent, ())
+    elif profile == "quick" and not follows_tools:
+        selection = ToolSelection(
+            "none", _agent_with(agent, "none", []), tuple(tool.name for tool in agent.tools)
+        )
+    elif _INSTAGRAM_RE.search(message_text or ""):
+        selection = ToolSelection("search+reel", agent, ())
+    else:
+        tools = [tool for tool in agent.tools if getattr(tool, "name", None) != REEL_TOOL_NAME]
+        omitted = tuple(tool.name for tool in agent.tools if tool not in tools)
+        selection = ToolSelection("search", _agent_with(agent, "search", tools), omitted)
+
+    if vector_store_ids and any(isinstance(tool, FileSearchTool) for tool in selection.agent.tools):
+        # 📎 The thread's documents aren't in the local mirror - keep searching
+        tool_set = f"{selection.tool_set}+thread_docs"
+        tools = [
+            dataclasses.replace(tool, vector_store_ids=[*tool.vector_store_ids, *vector_store_ids])
+            if isinstance(tool, FileSearchTool)
+            else tool
+            for tool in selection.agent.tools
+        ]
+        selection = ToolSelection(tool_set, selection.agent.clone(tools=tools), selection.omitted)
+    elif local_kb and any(isinstance(tool, FileSearchTool) for tool in selection.agent.tools):
+        # 📚 Local passages are already in the input; skip the hosted search
+        tool_set = f"{selection.tool_set}+local_kb"
+        tools = [tool for tool in selection.agent.tools if not isinstance(tool, FileSearchTool)]
+        omitted = selection.omitted + tuple(tool.name for tool in selection.agent.tools if tool not in tools)
+        selection = ToolSelection(tool_set, _agent_with(agent, tool_set, tools), omitted)
+
+    TOOL_SET_TOTAL.inc(endpoint=endpoint, tool_set=selection.tool_set)
+    saved = 0
+    for tool in agent.tools:
+        if tool.name in selection.omitted:
+            TOOLS_OMITTED_TOTAL.inc(endpoint=endpoint, tool=tool.name)
+            saved += _schema_tokens(tool)
+    if saved:
+        TOOL_SCHEMA_TOKENS_SAVED_TOTAL.inc(saved, endpoint=endpoint)
+    return selection
+
+
+def record_tool_set_usage(
+    endpoint: str,
+    selection: ToolSelection,
+    stream_timer: StreamTimer,
+    usage: dict[str, int] | None,
+) -> None:
+    """Per-tool-set TTFT and input tokens (call after the stream has finished)."""
+    if stream_timer.ttft is not None:
+        TOOL_SET_TTFT_SECONDS.observe(stream_timer.ttft, endpoint=endpoint, tool_set=selection.tool_set)
+    if usage:
+        TOOL_SET_INPUT_TOKENS.observe(usage["input_tokens"], endpoint=endpoint, tool_set=selection.tool_set)
@@ -0,0 +1,236 @@
+"""
+Lightweight always-on request spans and an on-demand sampling CPU profiler.
+
+Unlike the Agents SDK `trace()` (which we only enable in DEBUG_MODE because
+it exports to the OpenAI dashboard), these spans live in-process and cost a
+few `perf_counter()` calls per request. Every request records its spans;
+at the end the trace is kept if it was sampled, errored, or was slow
+(tail sampling), so regressions are never invisible.
+
+Kept traces are logged (as a structured `trace` field) and held in a ring buffer
+served by GET /admin/traces. POST /admin/profile captures a time-boxed
+stack-sampling profile of the running worker.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import logging
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+logger = logging.getLogger(__name__)
+
+DEBUG_MODE = os.getenv("DEBUG_MODE", "false").lower() == "true"
+
+# Fraction of normal requests whose spans are kept (errors/slow requests are always kept)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0" if DEBUG_MODE else "0.1"))
+# Requests slower than this (end to end) are always kept
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "15000"))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+
+_current_trace: contextvars.ContextVar[RequestTrace | None] = contextvars.ContextVar(
+    "jason_current_trace", default=None
+)
+_recent_traces: deque[dict[str, Any]] = deque(maxlen=TRACE_BUFFER_SIZE)
+
+
+class RequestTrace:
+    """Spans and point events for one request, relative to the request start."""
+
+    def __init__(self, name: str, start: float | None = None, **attributes: Any) -> None:
+        self.trace_id = secrets.token_hex(8)
+        self.name = name
+        self.attributes: dict[str, Any] = dict(attributes)
+        now = time.perf_counter()
+        self.start = start if start is not None else now
+        self.started_at = time.time() - (now - self.start)
+        self.spans: list[dict[str, Any]] = []
+        self.events: list[dict[str, Any]] = []
+        self.error: str | None = None
+        self._token: contextvars.Token | None = None
+        self._finished = False
+
+    def _offset_ms(self, at: float) -> float:
+        return round((at - self.start) * 1000, 1)
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def mark(self, name: str, **attributes: Any) -> None:
+        """Record a point-in-time event (e.g. first_token)."""
+        event = {"name": name, "at_ms": self._offset_ms(time.perf_counter())}
+        if attributes:
+            event["attributes"] = attributes
+        self.events.append(event)
+
+    def add_span(self, name: str, start: float, end: float, **attributes: Any) -> None:
+        """Record a span measured elsewhere (`perf_counter()` timestamps)."""
+        span = {
+            "name": name,
+            "start_ms": self._offset_ms(start),
+            "duration_ms": round((end - start) * 1000, 1),
+        }
+        if attributes:
+            span["attributes"] = attributes
+        self.spans.append(span)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            attributes["error"] = type(e).__name__
+            raise
+        finally:
+            self.add_span(name, start, time.perf_counter(), **attributes)
+
+    def record_error(self, error: BaseException | str) -> None:
+        self.error = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+
+    def finish(self) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        if self._token is not None:
+            try:
+                _current_trace.reset(self._token)
+            except ValueError:
+                # Async generators can finish in a different context than they started
+                _current_trace.set(None)
+        duration_ms = self._offset_ms(time.perf_counter())
+        keep = (
+            self.error is not None
+            or duration_ms >= TRACE_SLOW_MS
+            or random.random() < TRACE_SAMPLE_RATE
+        )
+        if not keep:
+            return
+        record = {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": duration_ms,
+            "attributes": self.attributes,
+            "spans": self.spans,
+            "events": self.events,
+        }
+        if self.error:
+            record["error"] = self.error
+        _recent_traces.append(record)
+        logger.info(
+            "[TRACE] %s %s %.1fms", self.name, self.trace_id, duration_ms, extra={"trace": record}
+        )
+
+
+def start_trace(name: str, start: float | None = None, **attributes: Any) -> RequestTrace:
+    """
+    Start a request trace and make it current for spans opened deeper in the
+    call stack. `start` backdates the trace to an earlier `perf_counter()`.
+    """
+    request_trace = RequestTrace(name, start=start, **attributes)
+    request_trace._token = _current_trace.set(request_trace)
+    return request_trace
+
+
+def current_trace() -> RequestTrace | None:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[None]:
+    """Open a span on the current request trace (no-op outside a request)."""
+    request_trace = _current_trace.get()
+    if request_trace is None:
+        yield
+        return
+    with request_trace.span(name, **attributes):
+        yield
+
+
+def recent_traces(limit: int = 50) -> list[dict[str, Any]]:
+    return list(_recent_traces)[-limit:][::-1]
+
+
+# ============================================================================
+# ON-DEMAND SAMPLING PROFILER
+# ============================================================================
+# Samples the Python stack of a target thread (the event loop thread) at a
+# fixed interval using sys._current_frames(). No dependencies, no tracing
+# hooks, so it is safe to run briefly against a live production worker.
+# ============================================================================
+
+MAX_PROFILE_SECONDS = 60.0
+_profile_lock = threading.Lock()
+
+
+def _frame_label(frame: Any) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    # Trim site-packages / project prefixes to keep stacks readable
+    for marker in ("site-packages/", "backend-v2/"):
+        idx = filename.rfind(marker)
+        if idx != -1:
+            filename = filename[idx + len(marker):]
+            break
+    return f"{code.co_name} ({filename}:{frame.f_lineno})"
+
+
+def collect_stack(frame: Any, max_depth: int = 64) -> tuple[str, ...]:
+    """Outermost-first `function (file:line)` labels for a frame's stack."""
+    stack: list[str] = []
+    while frame is not None and len(stack) < max_depth:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+def sample_profile(thread_id: int, seconds: float, interval: float = 0.005) -> dict[str, Any]:
+    """
+    Sample `thread_id`'s stack for `seconds` (blocking; run it in a worker thread).
+
+    Returns collapsed stacks (flamegraph.pl / speedscope compatible) plus the
+    hottest leaf frames.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    try:
+        seconds = max(0.1, min(seconds, MAX_PROFILE_SECONDS))
+        interval = max(0.001, interval)
+        stacks: Counter[tuple[str, ...]] = Counter()
+        samples = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                stacks[collect_stack(frame)] += 1
+                samples += 1
+            time.sleep(interval)
+
+        leaf_counts: Counter[str] = Counter()
+        for stack, count in stacks.items():
+            if stack:
+                leaf_counts[stack[-1]] += count
+
+        return {
+            "seconds": seconds,
+            "interval_ms": interval * 1000,
+            "samples": samples,
+            "top_frames": [
+                {"frame": frame, "samples": count, "percent": round(100 * count / samples, 1)}
+                for frame, count in leaf_counts.most_common(25)
+            ] if samples else [],
+            "collapsed": "\n".join(
+                f"{';'.join(stack)} {count}" for stack, count in stacks.most_common()
+            ),
+        }
+    finally:
+        _profile_lock.release()
@@ -0,0 +1,184 @@
+"""
+Startup warm-up and readiness gating.
+
+The first chat after a deploy otherwise pays DNS + TCP + TLS setup on the
+OpenAI connection and a cold prompt cache for `JASON_INSTRUCTIONS`. The
+lifespan hook runs `run_warmup()` in the background:
+
+0. Load the chat stack (agents / chatkit / openai imports, agent
+   construction) in a worker thread so the event loop keeps serving.
+1. Pre-open pooled connections - a few concurrent, cheap `models.retrieve`
+   calls leave that many keep-alive connections in the shared pool.
+2. Optionally prime the prompt cache - one tiny agent run with the real
+   instructions and tools so the first user's prefix is already cached.
+
+`/health` stays a liveness check; GET /ready returns 503 until warm-up has
+finished. If warm-up keeps failing for WARMUP_TIMEOUT_SECONDS the worker
+reports ready anyway with status "degraded", so a transient upstream blip
+cannot hold a deploy out of rotation forever. With WARMUP_ENABLED=false only
+step 0 runs, and a failure there is reported as "degraded" too.
+
+Environment:
+- WARMUP_ENABLED: "true" (default) / "false"
+- WARMUP_CONNECTIONS: connections to pre-open (default 4)
+- WARMUP_PRIME_PROMPT_CACHE: "true" to prime the prompt cache (default
+  "false" - it costs one small model call per worker start)
+- WARMUP_TIMEOUT_SECONDS: give up and report degraded after this (default 30)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Any, Callable
+
+from .metrics import REGISTRY, mark_process_warm
+from .openai_client import get_openai_client
+
+if TYPE_CHECKING:
+    from agents import Agent
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))
+WARMUP_PRIME_PROMPT_CACHE = os.getenv("WARMUP_PRIME_PROMPT_CACHE", "false").lower() == "true"
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "30"))
+
+WARMUP_STEP_SECONDS = REGISTRY.histogram(
+    "jason_warmup_step_seconds",
+    "Duration of each startup warm-up step.",
+    ("step", "outcome"),
+)
+
+
+class Readiness:
+    """Warm-up state reported by GET /ready."""
+
+    def __init__(self) -> None:
+        self.status = "starting"  # starting -> warming -> ready | degraded
+        self.started_at: float | None = None
+        self.duration_ms: float | None = None
+        self.steps: dict[str, dict[str, Any]] = {}
+        self.last_error: str | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status in ("ready", "degraded")
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "status": self.status,
+            "ready": self.ready,
+            "warmup_ms": self.duration_ms,
+            "steps": self.steps,
+            "last_error": self.last_error,
+        }
+
+
+readiness = Readiness()
+
+REGISTRY.gauge(
+    "jason_ready",
+    "1 once startup warm-up has finished (ready or degraded).",
+    callback=lambda: 1 if readiness.ready else 0,
+)
+
+
+async def _timed_step(name: str, coro: Any) -> Any:
+    start = time.perf_counter()
+    try:
+        result = await coro
+    except BaseException as e:
+        elapsed = time.perf_counter() - start
+        WARMUP_STEP_SECONDS.observe(elapsed, step=name, outcome="error")
+        readiness.steps[name] = {"ok": False, "duration_ms": round(elapsed * 1000, 1), "error": str(e)[:200]}
+        raise
+    elapsed = time.perf_counter() - start
+    WARMUP_STEP_SECONDS.observe(elapsed, step=name, outcome="ok")
+    readiness.steps[name] = {"ok": True, "duration_ms": round(elapsed * 1000, 1)}
+    return result
+
+
+async def _open_connections(model: str) -> None:
+    """Concurrent cheap calls so WARMUP_CONNECTIONS sockets stay in the keep-alive pool."""
+    client = get_openai_client()
+    await asyncio.gather(*(client.models.retrieve(model) for _ in range(max(1, WARMUP_CONNECTIONS))))
+
+
+async def _prime_prompt_cache(agent: Agent[Any]) -> None:
+    """One minimal run with the real instructions + tools so their prefix is cached."""
+    from agents import ModelSettings, RunConfig, Runner
+    from openai.types.shared import Reasoning
+
+    await Runner.run(
+        agent,
+        "Warm-up check. Reply with OK.",
+        max_turns=1,
+        run_config=RunConfig(
+            model_settings=ModelSettings(
+                tool_choice="none",
+                reasoning=Reasoning(effort="low"),
+                max_tokens=64,
+            ),
+            tracing_disabled=True,
+        ),
+    )
+
+
+async def _warm(load_agent: Callable[[], Agent[Any]]) -> None:
+    agent = await _timed_step("chat_stack", asyncio.to_thread(load_agent))
+    model = agent.model if isinstance(agent.model, str) else "gpt-5"
+    await _timed_step("connections", _open_connections(model))
+    if WARMUP_PRIME_PROMPT_CACHE:
+        await _timed_step("prompt_cache", _prime_prompt_cache(agent))
+
+
+async def run_warmup(load_agent: Callable[[], Agent[Any]]) -> None:
+    """
+    Warm the worker, retrying with backoff until WARMUP_TIMEOUT_SECONDS.
+
+    `load_agent` imports and builds the chat stack (blocking, so it runs in
+    a worker thread) and returns the agent to warm up for.
+    """
+    if not WARMUP_ENABLED:
+        # Still load the chat stack off the event loop before reporting ready;
+        # if that fails, report degraded (the first chat retries the load)
+        try:
+            await _timed_step("chat_stack", asyncio.to_thread(load_agent))
+            readiness.status = "ready"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            readiness.last_error = f"{type(e).__name__}: {e}"[:300]
+            readiness.status = "degraded"
+            logger.warning("[Warm-up] Loading the chat stack failed: %s", readiness.last_error)
+        return
+
+    readiness.status = "warming"
+    start = time.perf_counter()
+    readiness.started_at = time.time()
+    deadline = start + WARMUP_TIMEOUT_SECONDS
+    delay = 0.5
+    while True:
+        try:
+            await asyncio.wait_for(_warm(load_agent), timeout=max(0.1, deadline - time.perf_counter()))
+            readiness.status = "ready"
+            mark_process_warm()
+            break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            readiness.last_error = f"{type(e).__name__}: {e}"[:300]
+            if time.perf_counter() + delay >= deadline:
+                readiness.status = "degraded"
+                logger.warning("[Warm-up] Giving up after %.1fs: %s", time.perf_counter() - start, readiness.last_error)
+                break
+            logger.info("[Warm-up] Attempt failed (%s), retrying in %.1fs", readiness.last_error, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 5.0)
+
+    readiness.duration_ms = round((time.perf_counter() - start) * 1000, 1)
+    logger.info("[Warm-up] %s in %.0fms", readiness.status, readiness.duration_ms)
@@ -0,0 +1,145 @@
+"""
+Short-TTL cache for web search results.
+
+Trend questions ("what's trending on TikTok right now") repeat across users
+within minutes. The hosted `WebSearchTool` runs inside OpenAI, so its results
+can't be reused - with the cache on, jason_agent's `web_search` is a function
+tool instead, which runs the search as a small Responses call (WEB_SEARCH_MODEL
+with the hosted web_search tool) and caches the summarized results keyed by
+normalized query + location. Concurrent identical searches share one call.
+
+The tool result always carries `retrieved_at` / `age_seconds` (and `cached`),
+so the model knows how fresh the information is.
+
+Environment:
+- WEB_SEARCH_CACHE_ENABLED: "false" (default) / "true" - swaps the hosted tool for the cached one
+- WEB_SEARCH_CACHE_TTL_SECONDS: result lifetime (default 300)
+- WEB_SEARCH_CACHE_MAX_ENTRIES: LRU capacity (default 500)
+- WEB_SEARCH_MODEL: model that runs the search (default "gpt-5-mini")
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any
+
+from .metrics import REGISTRY
+from .openai_client import get_openai_client
+from .response_cache import normalize_question
+
+logger = logging.getLogger(__name__)
+
+WEB_SEARCH_CACHE_ENABLED = os.getenv("WEB_SEARCH_CACHE_ENABLED", "false").lower() == "true"
+WEB_SEARCH_CACHE_TTL_SECONDS = float(os.getenv("WEB_SEARCH_CACHE_TTL_SECONDS", "300"))
+WEB_SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("WEB_SEARCH_CACHE_MAX_ENTRIES", "500"))
+WEB_SEARCH_MODEL = os.getenv("WEB_SEARCH_MODEL", "gpt-5-mini")
+
+_SEARCH_INSTRUCTIONS = (
+    "Search the web for the query and report what you find: the key facts, "
+    "names, numbers and dates, most recent first. Be concise. Do not give advice."
+)
+
+WEB_SEARCH_CACHE_TOTAL = REGISTRY.counter(
+    "jason_web_search_cache_total",
+    "Web search lookups by result (hit / miss / coalesced onto an in-flight search).",
+    ("result",),
+)
+WEB_SEARCH_SECONDS = REGISTRY.histogram(
+    "jason_web_search_seconds",
+    "Upstream web search duration on cache misses.",
+)
+REGISTRY.gauge(
+    "jason_web_search_cache_entries",
+    "Web search results currently cached.",
+    callback=lambda: len(_results),
+)
+
+
+@dataclass
+class SearchResult:
+    query: str
+    summary: str
+    sources: list[dict[str, str]]
+    retrieved_at: float
+
+    def for_model(self, cached: bool) -> dict[str, Any]:
+        """Tool output, including how old the results are."""
+        return {
+            "query": self.query,
+            "results": self.summary,
+            "sources": self.sources,
+            "retrieved_at": datetime.fromtimestamp(self.retrieved_at, timezone.utc).isoformat(timespec="seconds"),
+            "age_seconds": int(time.time() - self.retrieved_at),
+            "cached": cached,
+        }
+
+
+_results: OrderedDict[tuple[str, str], SearchResult] = OrderedDict()
+_inflight: dict[tuple[str, str], asyncio.Task[SearchResult]] = {}
+
+
+def location_key(location: dict[str, str] | None) -> str:
+    if not location:
+        return ""
+    return "/".join(str(location.get(field, "")).lower() for field in ("country", "region", "city"))
+
+
+async def _search_upstream(query: str, location: dict[str, str] | None) -> SearchResult:
+    tool: dict[str, Any] = {"type": "web_search"}
+    if location:
+        tool["user_location"] = location
+    start = time.perf_counter()
+    response = await get_openai_client().responses.create(
+        model=WEB_SEARCH_MODEL,
+        instructions=_SEARCH_INSTRUCTIONS,
+        input=query,
+        tools=[tool],
+    )
+    WEB_SEARCH_SECONDS.observe(time.perf_counter() - start)
+
+    sources: list[dict[str, str]] = []
+    for item in response.output:
+        for part in getattr(item, "content", None) or []:
+            for annotation in getattr(part, "annotations", None) or []:
+                url = getattr(annotation, "url", None)
+                if url and all(source["url"] != url for source in sources):
+                    sources.append({"title": getattr(annotation, "title", "") or "", "url": url})
+    return SearchResult(query, response.output_text, sources, time.time())
+
+
+async def _search_and_store(key: tuple[str, str], query: str, location: dict[str, str] | None) -> SearchResult:
+    result = await _search_upstream(query, location)
+    _results[key] = result
+    _results.move_to_end(key)
+    while len(_results) > WEB_SEARCH_CACHE_MAX_ENTRIES:
+        _results.popitem(last=False)
+    return result
+
+
+async def cached_web_search(query: str, location: dict[str, str] | None = None) -> dict[str, Any]:
+    """Search results for a query, from the cache when fresh (see module docstring)."""
+    key = (normalize_question(query), location_key(location))
+    entry = _results.get(key)
+    if entry is not None and time.time() - entry.retrieved_at < WEB_SEARCH_CACHE_TTL_SECONDS:
+        _results.move_to_end(key)
+        WEB_SEARCH_CACHE_TOTAL.inc(result="hit")
+        logger.debug("[Web Search Cache] Hit (%.0fs old): %s", time.time() - entry.retrieved_at, query)
+        return entry.for_model(cached=True)
+
+    task = _inflight.get(key)
+    cached = task is not None
+    if task is None:
+        # The search runs as its own task so a cancelled caller (e.g. a hedge
+        # loser) doesn't cancel it for the others waiting on it
+        task = asyncio.create_task(_search_and_store(key, query, location))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    WEB_SEARCH_CACHE_TOTAL.inc(result="coalesced" if cached else "miss")
+    result = await asyncio.shield(task)
+    return result.for_model(cached=cached)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Knowledge-base retrieval latency benchmark.
+
+Times the local BM25 mirror (backend-v2/app/kb_mirror.py): index build time
+and per-query latency percentiles, plus how many queries would inject
+passages / skip file_search at the current thresholds. The corpus is the
+persisted mirror (KB_MIRROR_PATH) if it exists, otherwise a synthetic corpus
+of --passages passages.
+
+With --hosted, the same queries are also sent to the hosted vector store
+search (`vector_stores.search`, needs OPENAI_API_KEY and JASON_VECTOR_STORE_ID)
+for comparison - that's a lower bound on what file_search adds inside the
+model's tool loop.
+
+Usage (from the repo root):
+    python scripts/bench-kb-retrieval.py [--runs 200] [--passages 5000] [--hosted]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend-v2")
+sys.path.insert(0, BACKEND_DIR)
+
+QUERIES = [
+    "What are the best hooks for Instagram reels?",
+    "How do I grow on Instagram?",
+    "What's the best time to post on Instagram?",
+    "How do I create viral content?",
+    "What equipment do I need for content creation?",
+    "How should I price a brand deal with 50k followers?",
+    "Give me a 30 day content plan for a fitness page",
+    "yo how do I stop being scared of the camera",
+]
+
+_VOCAB = (
+    "hook reel instagram growth audience retention caption thumbnail camera lighting edit script "
+    "brand deal sponsor pricing rate followers engagement algorithm post schedule consistency story "
+    "niche viral trend sound transition pattern interrupt question claim value cta comment share save "
+    "analytics reach impressions collab carousel live dm funnel offer launch community batch film"
+).split()
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def report(name: str, samples: list[float]) -> None:
+    print(
+        f"  {name:<22} p50 {percentile(samples, 0.50) * 1000:8.2f} ms   "
+        f"p95 {percentile(samples, 0.95) * 1000:8.2f} ms   "
+        f"p99 {percentile(samples, 0.99) * 1000:8.2f} ms   (n={len(samples)})"
+    )
+
+
+def synthetic_files(passages: int) -> dict[str, dict]:
+    rng = random.Random(7)
+    files: dict[str, dict] = {}
+    for i in range(passages):
+        file_id = f"file-synthetic-{i // 20}"
+        text = " ".join(rng.choice(_VOCAB) for _ in range(rng.randint(80, 200)))
+        files.setdefault(file_id, {"filename": f"{file_id}.md", "passages": []})["passages"].append(text)
+    return files
+
+
+async def hosted_search(runs: int) -> list[float]:
+    from app.knowledge_base import JASON_VECTOR_STORE_ID
+    from app.openai_client import get_openai_client
+
+    client = get_openai_client()
+    samples = []
+    for i in range(runs):
+        start = time.perf_counter()
+        page = await client.vector_stores.search(JASON_VECTOR_STORE_ID, query=QUERIES[i % len(QUERIES)])
+        _ = [hit async for hit in page]
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=200, help="local queries to time")
+    parser.add_argument("--passages", type=int, default=5000, help="synthetic corpus size")
+    parser.add_argument("--hosted", action="store_true", help="also time hosted vector store search")
+    parser.add_argument("--hosted-runs", type=int, default=16)
+    args = parser.parse_args()
+
+    from app import kb_mirror as mirror_module
+
+    mirror = mirror_module.KnowledgeBaseMirror(mirror_module.KB_MIRROR_PATH)
+    mirror.load()
+    if mirror.files:
+        source = f"mirror at {mirror.path}"
+    else:
+        mirror.files = synthetic_files(args.passages)
+        source = f"synthetic corpus ({args.passages} passages)"
+
+    start = time.perf_counter()
+    mirror.index = mirror_module._build_index(mirror.files)
+    build_s = time.perf_counter() - start
+    print(f"Corpus: {source} - {len(mirror.files)} files, {len(mirror.index.passages)} passages")
+    print(f"Index build: {build_s * 1000:.1f} ms")
+
+    samples = []
+    injected = confident = 0
+    for i in range(args.runs):
+        retrieval = mirror.search(QUERIES[i % len(QUERIES)])
+        samples.append(retrieval.seconds)
+        if i < len(QUERIES):
+            injected += retrieval.injectable
+            confident += retrieval.confident
+    print("Latency:")
+    report("local BM25", samples)
+
+    if args.hosted:
+        report("hosted vector search", asyncio.run(hosted_search(args.hosted_runs)))
+
+    shown = min(args.runs, len(QUERIES))
+    print(f"Of {shown} sample queries: {injected} would inject passages, {confident} would skip file_search")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
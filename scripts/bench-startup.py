@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the backend.
+
+Runs a fresh interpreter with `-X importtime` that imports `app.main` (what
+uvicorn does before it can bind the port) and then calls
+`load_chat_stack()` (what the warm-up / first chat does), and reports the
+cumulative import time per module for each phase.
+
+Usage (from the repo root):
+    python scripts/bench-startup.py [--top 15] [--runs 3]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend-v2")
+
+PHASE_MARKER = "@@phase:chat_stack@@"
+
+CHILD = f"""
+import sys, time
+t0 = time.perf_counter()
+import app.main
+t1 = time.perf_counter()
+print({PHASE_MARKER!r}, file=sys.stderr, flush=True)
+app.main.load_chat_stack()
+t2 = time.perf_counter()
+print(f"@@timing {{t1 - t0:.6f}} {{t2 - t1:.6f}}", file=sys.stderr, flush=True)
+"""
+
+
+def run_once() -> tuple[float, float, dict[str, dict[str, int]]]:
+    env = {**os.environ, "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-bench")}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    phases: dict[str, dict[str, int]] = {"app.main": {}, "load_chat_stack": {}}
+    phase = "app.main"
+    app_main_s = chat_stack_s = 0.0
+    for line in proc.stderr.splitlines():
+        if line.startswith(PHASE_MARKER):
+            phase = "load_chat_stack"
+        elif line.startswith("@@timing"):
+            _, app_main, chat_stack = line.split()
+            app_main_s, chat_stack_s = float(app_main), float(chat_stack)
+        elif line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            if cumulative.strip().isdigit():
+                phases[phase][name.rstrip()] = int(cumulative)
+    return app_main_s, chat_stack_s, phases
+
+
+def top_level(modules: dict[str, int]) -> list[tuple[str, int]]:
+    """Modules imported directly by the phase (least-indented), by cumulative time."""
+    if not modules:
+        return []
+    depth = min(len(name) - len(name.lstrip()) for name in modules)
+    rows = [
+        (name.strip(), us) for name, us in modules.items()
+        if len(name) - len(name.lstrip()) <= depth + 2
+    ]
+    return sorted(rows, key=lambda row: row[1], reverse=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=15, help="modules to list per phase")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters to average over")
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(max(1, args.runs))]
+    app_main_times = [r[0] for r in results]
+    chat_stack_times = [r[1] for r in results]
+
+    print(f"import app.main:    median {statistics.median(app_main_times) * 1000:7.1f}ms  (runs: {', '.join(f'{t * 1000:.0f}' for t in app_main_times)})")
+    print(f"load_chat_stack():  median {statistics.median(chat_stack_times) * 1000:7.1f}ms  (runs: {', '.join(f'{t * 1000:.0f}' for t in chat_stack_times)})")
+
+    _, _, phases = results[-1]
+    for phase, modules in phases.items():
+        print(f"\n{phase} - cumulative import time per module (last run)")
+        for name, us in top_level(modules)[: args.top]:
+            print(f"  {us / 1000:8.1f}ms  {name}")
+
+    heavy = [name for name in ("agents", "chatkit", "openai") if name in {n.strip() for n in phases["app.main"]}]
+    if heavy:
+        print(f"\n❌ Imported at startup (should be lazy): {', '.join(heavy)}")
+        return 1
+    print("\n✅ agents / chatkit / openai are deferred until the chat stack loads")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
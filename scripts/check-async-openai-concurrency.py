@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Concurrency check for the backend's OpenAI-backed endpoints.
+
+Starts a local stand-in for the OpenAI API (every call sleeps DELAY seconds),
+points the backend at it via OPENAI_BASE_URL, then fires concurrent
+TTS / transcription / knowledge-base upload requests while probing /health.
+Each upload sends different content so dedup (kb_manifest.py) doesn't make
+them wait on each other; a final re-upload checks that dedup still answers
+with the existing file.
+
+If any handler still blocks the event loop, the requests serialize
+(total time ~ N * DELAY) and /health stalls behind them.
+
+Usage (from the repo root):
+    python scripts/check-async-openai-concurrency.py
+"""
+
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, Response
+
+DELAY = 0.5
+CONCURRENCY = 8
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend-v2")
+
+
+def build_stand_in_api() -> FastAPI:
+    """Minimal subset of the OpenAI REST API used by the backend."""
+    api = FastAPI()
+
+    @api.post("/v1/audio/speech")
+    async def speech() -> Response:
+        await asyncio.sleep(DELAY)
+        return Response(content=b"ID3fake-mp3", media_type="audio/mpeg")
+
+    @api.post("/v1/audio/transcriptions")
+    async def transcriptions() -> PlainTextResponse:
+        await asyncio.sleep(DELAY)
+        return PlainTextResponse("yo this is a transcript")
+
+    @api.post("/v1/files")
+    async def files(request: Request) -> dict:
+        await request.body()
+        await asyncio.sleep(DELAY)
+        return {
+            "id": f"file-{time.time_ns()}",
+            "object": "file",
+            "bytes": 10,
+            "created_at": int(time.time()),
+            "filename": "upload.txt",
+            "purpose": "assistants",
+            "status": "processed",
+        }
+
+    @api.get("/v1/vector_stores/{vector_store_id}/files/{file_id}")
+    async def vector_store_file(vector_store_id: str, file_id: str) -> dict:
+        await asyncio.sleep(DELAY)
+        return {
+            "id": file_id,
+            "object": "vector_store.file",
+            "created_at": int(time.time()),
+            "usage_bytes": 10,
+            "vector_store_id": vector_store_id,
+            "status": "completed",
+            "last_error": None,
+        }
+
+    @api.post("/v1/vector_stores/{vector_store_id}/files")
+    async def vector_store_files(vector_store_id: str, request: Request) -> dict:
+        body = await request.json()
+        await asyncio.sleep(DELAY)
+        return {
+            "id": body["file_id"],
+            "object": "vector_store.file",
+            "created_at": int(time.time()),
+            "usage_bytes": 10,
+            "vector_store_id": vector_store_id,
+            "status": "in_progress",
+            "last_error": None,
+        }
+
+    return api
+
+
+def start_stand_in_api() -> str:
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    server = uvicorn.Server(uvicorn.Config(build_stand_in_api(), port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+async def main() -> int:
+    os.environ["OPENAI_BASE_URL"] = start_stand_in_api()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-local-stand-in")
+    # Runtime state (the KB manifest, the conversations.db session store in the
+    # working directory) goes to a temp dir, not the repo
+    workdir = tempfile.mkdtemp()
+    os.environ["KB_MANIFEST_PATH"] = os.path.join(workdir, "kb_manifest.json")
+    os.chdir(workdir)
+    sys.path.insert(0, BACKEND_DIR)
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://backend", timeout=60) as client:
+        async def speak() -> httpx.Response:
+            return await client.post("/api/voice/speak", json={"text": "yo"})
+
+        async def transcribe() -> httpx.Response:
+            return await client.post(
+                "/api/voice/transcribe", files={"file": ("clip.mp3", b"fake-audio", "audio/mpeg")}
+            )
+
+        uploads = iter(range(CONCURRENCY))
+
+        async def upload() -> httpx.Response:
+            content = f"hooks hooks hooks #{next(uploads)}".encode()
+            return await client.post("/api/files/upload", files={"file": ("notes.txt", content, "text/plain")})
+
+        async def health_probe() -> float:
+            await asyncio.sleep(DELAY / 4)
+            start = time.perf_counter()
+            await client.get("/health")
+            return time.perf_counter() - start
+
+        calls = [speak, transcribe, upload] * (CONCURRENCY // 3 + 1)
+        calls = calls[:CONCURRENCY]
+
+        start = time.perf_counter()
+        *responses, health_latency = await asyncio.gather(*(call() for call in calls), health_probe())
+        elapsed = time.perf_counter() - start
+
+        repeat = await client.post(
+            "/api/files/upload", files={"file": ("notes-copy.txt", b"hooks hooks hooks #0", "text/plain")}
+        )
+
+    failures = [r for r in responses if r.status_code != 200]
+    serial_time = sum(2 if call is upload else 1 for call in calls) * DELAY
+
+    print(f"Requests: {len(calls)} (each upstream call sleeps {DELAY:.2f}s)")
+    print(f"Wall time: {elapsed:.2f}s (fully serialized would be ~{serial_time:.2f}s)")
+    print(f"/health latency during load: {health_latency * 1000:.0f}ms")
+
+    ok = True
+    if failures:
+        print(f"❌ {len(failures)} request(s) failed: {failures[0].status_code} {failures[0].text[:200]}")
+        ok = False
+    if elapsed > serial_time / 2:
+        print("❌ Requests appear to be serialized - something is blocking the event loop")
+        ok = False
+    if repeat.status_code != 200 or not repeat.json().get("duplicate"):
+        print(f"❌ Re-uploading identical content was not deduplicated: {repeat.status_code} {repeat.text[:200]}")
+        ok = False
+    if health_latency > DELAY / 2:
+        print("❌ /health stalled behind OpenAI calls")
+        ok = False
+    if ok:
+        print("✅ OpenAI-backed endpoints run concurrently")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Hedged-request check against a local stand-in model.
+
+Starts a stand-in for the OpenAI Responses API that streams a short answer
+after an injected delay before the first output (SLOW_DELAY for the first
+call of each scenario, FAST_DELAY afterwards), enables hedging with a fixed
+threshold, and sends chats through /api/chat:
+
+1. slow primary - the hedge should start at the threshold, win, and the
+   client should see its first token well before SLOW_DELAY
+2. fast primary - no hedge should start
+
+It also checks the thread's session memory holds the user message once.
+
+Usage (from the repo root):
+    python scripts/check-hedged-requests.py
+"""
+
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+SLOW_DELAY = 4.0
+FAST_DELAY = 0.2
+HEDGE_AFTER_MS = 1000
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend-v2")
+
+# First-output delays handed out to incoming /v1/responses calls, in order
+DELAYS: list[float] = []
+CALLS: list[float] = []
+
+
+def build_stand_in_api() -> FastAPI:
+    """Streams `response.created`, waits, then a short text answer."""
+    api = FastAPI()
+
+    @api.get("/v1/models/{model}")
+    async def model(model: str) -> dict:
+        return {"id": model, "object": "model", "created": 0, "owned_by": "stand-in"}
+
+    @api.post("/v1/responses")
+    async def responses(request: Request) -> StreamingResponse:
+        body = await request.json()
+        delay = DELAYS.pop(0) if DELAYS else FAST_DELAY
+        CALLS.append(delay)
+        base = {
+            "id": f"resp_{time.time_ns()}", "object": "response", "created_at": int(time.time()),
+            "model": body.get("model", "gpt-5"), "output": [], "parallel_tool_calls": True,
+            "tool_choice": "auto", "tools": [], "status": "in_progress",
+        }
+        text = f"answer after {delay:.1f}s"
+        item = {"id": "msg_1", "type": "message", "role": "assistant", "status": "in_progress", "content": []}
+        done_item = {**item, "status": "completed", "content": [{"type": "output_text", "text": text, "annotations": []}]}
+        usage = {
+            "input_tokens": 100, "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": 5, "output_tokens_details": {"reasoning_tokens": 0}, "total_tokens": 105,
+        }
+
+        async def events():
+            seq = 0
+
+            def sse(event: dict) -> str:
+                nonlocal seq
+                event["sequence_number"] = seq
+                seq += 1
+                return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+            yield sse({"type": "response.created", "response": base})
+            await asyncio.sleep(delay)
+            yield sse({"type": "response.output_item.added", "output_index": 0, "item": item})
+            yield sse({"type": "response.content_part.added", "item_id": "msg_1", "output_index": 0,
+                       "content_index": 0, "part": {"type": "output_text", "text": "", "annotations": []}})
+            yield sse({"type": "response.output_text.delta", "item_id": "msg_1", "output_index": 0,
+                       "content_index": 0, "delta": text, "logprobs": []})
+            yield sse({"type": "response.output_item.done", "output_index": 0, "item": done_item})
+            yield sse({"type": "response.completed",
+                       "response": {**base, "status": "completed", "output": [done_item], "usage": usage}})
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return api
+
+
+def start_stand_in_api() -> str:
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    server = uvicorn.Server(uvicorn.Config(build_stand_in_api(), port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+async def main() -> int:
+    workdir = tempfile.mkdtemp(prefix="hedge-check-")
+    os.environ["OPENAI_BASE_URL"] = start_stand_in_api()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-local-stand-in")
+    os.environ.update({
+        "HEDGING_ENABLED": "true",
+        "HEDGE_AFTER_MS": str(HEDGE_AFTER_MS),
+        "WARMUP_ENABLED": "false",
+        "OPENAI_AGENTS_DISABLE_TRACING": "1",
+    })
+    os.chdir(workdir)  # conversations.db lands here
+    sys.path.insert(0, BACKEND_DIR)
+
+    import httpx
+    from app.main import app, load_chat_stack
+    from app.metrics import REGISTRY
+
+    load_chat_stack()
+    transport = httpx.ASGITransport(app=app)
+    ok = True
+    async with httpx.AsyncClient(transport=transport, base_url="http://backend", timeout=60) as client:
+        async def chat(thread_id: str) -> tuple[float | None, float, str]:
+            start = time.perf_counter()
+            ttft = None
+            body = ""
+            async with client.stream(
+                "POST", "/api/chat",
+                json={"messages": [{"role": "user", "content": "how do I get more views?"}], "threadId": thread_id},
+            ) as response:
+                async for chunk in response.aiter_text():
+                    if ttft is None and '0:"' in chunk:
+                        ttft = time.perf_counter() - start
+                    body += chunk
+            return ttft, time.perf_counter() - start, body
+
+        # 1. Slow primary -> hedge wins
+        DELAYS[:] = [SLOW_DELAY, FAST_DELAY]
+        ttft, total, body = await chat("hedge-slow")
+        print(f"slow primary: first token {ttft:.2f}s, total {total:.2f}s, upstream calls {CALLS}")
+        if ttft is None or ttft > SLOW_DELAY / 2:
+            print(f"❌ expected the hedge to answer well before {SLOW_DELAY}s")
+            ok = False
+        if f"answer after {FAST_DELAY:.1f}s" not in body:
+            print("❌ the streamed answer did not come from the hedge leg")
+            ok = False
+
+        # 2. Fast primary -> no hedge
+        CALLS.clear()
+        DELAYS[:] = [FAST_DELAY]
+        ttft, total, _ = await chat("hedge-fast")
+        print(f"fast primary: first token {ttft:.2f}s, total {total:.2f}s, upstream calls {CALLS}")
+        if len(CALLS) != 1:
+            print("❌ a fast primary should not be hedged")
+            ok = False
+
+    metrics = {
+        line.split(" ")[0]: line.split(" ")[1]
+        for line in REGISTRY.render().splitlines()
+        if line.startswith(("jason_hedges_total", "jason_hedge_wins_total", "jason_hedge_runs_total"))
+    }
+    print("metrics:", json.dumps(metrics, indent=2))
+    if float(metrics.get('jason_hedge_wins_total{endpoint="ai_sdk",winner="hedge"}', 0)) != 1:
+        print("❌ expected one hedge win")
+        ok = False
+
+    with sqlite3.connect(os.path.join(workdir, "conversations.db")) as db:
+        stored = db.execute(
+            "SELECT COUNT(*) FROM agent_messages WHERE session_id = ? AND message_data LIKE '%\"role\": \"user\"%'",
+            ("hedge-slow",),
+        ).fetchone()[0]
+    print(f"user messages stored for the hedged thread: {stored}")
+    if stored != 1:
+        print("❌ session memory should hold the user message exactly once")
+        ok = False
+
+    if ok:
+        print("✅ Hedging cuts the slow first token and keeps one copy of the turn")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))